@@ -0,0 +1,69 @@
+"""
+Общие помощники для бенчмарков: пул к отдельной схеме bench и src в sys.path.
+
+Подключение берётся из тех же переменных окружения, что и у бота (DB_*),
+но все таблицы создаются в схеме BENCH_SCHEMA, чтобы не трогать рабочие данные.
+"""
+import os
+import sys
+import statistics
+import tempfile
+from pathlib import Path
+
+import asyncpg
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+BENCH_SCHEMA = os.getenv("BENCH_SCHEMA", "bench")
+
+# config.py требует переменные бота — для бенчмарков хватает заглушек
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:bench")
+os.environ.setdefault("TELEGRAM_CHANNEL_ID", "0")
+os.environ.setdefault("TELEGRAM_ADMIN_CHAT_ID", "0")
+os.environ.setdefault("MEDIA_ROOT", tempfile.mkdtemp(prefix="bench_uploads_"))
+
+DB_CONFIG = {
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+    "host": os.getenv("DB_HOST"),
+    "port": int(os.getenv("DB_PORT", 5432)),
+}
+
+
+async def create_bench_pool(reset=True, **kwargs):
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        if reset:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}")
+    finally:
+        await conn.close()
+
+    # config импортируется только здесь: бенчмарки задают свои переменные до вызова
+    from config import ensure_media_dirs
+    from database.pool import PoolManager
+
+    # Каталоги медиа бот создаёт в main(); бенчмарки собирают сервисы сами
+    ensure_media_dirs()
+
+    # Тот же PoolManager, что у бота: проверка здоровья и переподключение
+
+    pool = PoolManager(
+        {**DB_CONFIG, "server_settings": {"search_path": BENCH_SCHEMA}},
+        name="bench",
+        **kwargs
+    )
+    await pool.start()
+    return pool
+
+
+def percentiles(samples_ms):
+    samples = sorted(samples_ms)
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49], cuts[98]
@@ -0,0 +1,204 @@
+"""
+Импорт истории из экспорта Telegram Desktop: скорость и возобновление.
+
+Собирает синтетический экспорт на --messages сообщений (result.json и папки
+photos/video_files/files, каждое --media-every сообщение с файлом, часть
+файлов повторяется, часть помечена как не выгруженная) и импортирует его
+через Backfill. Первый запуск прерывается после --interrupt-at сообщений,
+второй продолжает с контрольной точки. Несколько сообщений заранее приняты
+«живым ботом» — половина с заявками в message_claims, половина без них, как
+до появления заявок, — импорт должен пропустить все.
+
+Проверки: в messages ровно одна строка на сообщение, media_items — по одной
+на выгруженный файл, каждый media_url существует на диске, одинаковые файлы
+скопированы один раз, а /apibot/messages/since отдаёт только посты бота.
+Код выхода 1 при расхождении.
+
+    python bench/backfill.py --messages 100000 --batch-size 5000 --workers 8
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import orjson
+
+EXPORT_CHANNEL_ID = 1234567890
+# Экспорт из канала бота: config читает переменную при импорте, поэтому до _db
+os.environ.setdefault("TELEGRAM_CHANNEL_ID", str(-(10 ** 12 + EXPORT_CHANNEL_ID)))
+
+from _db import create_bench_pool  # noqa: E402
+
+from config import MEDIA_ROOT  # noqa: E402
+from database.db import init_db  # noqa: E402
+from database.models import (  # noqa: E402
+    claim_message,
+    complete_message_claim,
+    fetch_messages_since,
+    save_message_to_db
+)
+from services.backfill import Backfill, export_chat_id  # noqa: E402
+
+# Повторяющиеся файлы: каждый DUPLICATE_EVERY-й файл — копия одного из DUPLICATE_POOL
+DUPLICATE_EVERY = 5
+DUPLICATE_POOL = 20
+NOT_INCLUDED_EVERY = 50
+# Сообщения, уже принятые ботом до импорта
+LIVE_MESSAGES = 100
+
+
+def make_export(path: Path, count: int, media_every: int, file_size: int):
+    """
+    Возвращает {message_id: sha256 файла} для сообщений с выгруженным файлом.
+    """
+    for folder in ("photos", "video_files", "files"):
+        (path / folder).mkdir(parents=True, exist_ok=True)
+    started = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    shared = [os.urandom(file_size) for _ in range(DUPLICATE_POOL)]
+
+    messages = []
+    files = {}
+    for message_id in range(1, count + 1):
+        date = started + timedelta(minutes=15 * message_id)
+        message = {
+            "id": message_id,
+            "type": "message",
+            "date": date.replace(tzinfo=None).isoformat(),
+            "date_unixtime": str(int(date.timestamp())),
+            "from": "Bench",
+            "text": f"Сообщение {message_id}" if message_id % 3 else [
+                "Сообщение ", {"type": "bold", "text": str(message_id)}, " со ссылкой"
+            ],
+        }
+        if message_id % media_every == 0:
+            n = message_id // media_every
+            kind = n % 3
+            if kind == 0:
+                relative = f"photos/photo_{n}@{date:%d-%m-%Y_%H-%M-%S}.jpg"
+                message["photo"] = relative
+            elif kind == 1:
+                relative = f"video_files/video_{n}.mp4"
+                message["file"] = relative
+                message["media_type"] = "video_file"
+                message["mime_type"] = "video/mp4"
+            else:
+                relative = f"files/report_{n}.pdf"
+                message["file"] = relative
+                message["mime_type"] = "application/pdf"
+
+            if n % NOT_INCLUDED_EVERY == 0:
+                key = "photo" if "photo" in message else "file"
+                message[key] = "(File not included. Change data exporting settings to download.)"
+            else:
+                if n % DUPLICATE_EVERY == 0:
+                    content = shared[n // DUPLICATE_EVERY % DUPLICATE_POOL]
+                else:
+                    content = os.urandom(file_size)
+                (path / relative).write_bytes(content)
+                files[message_id] = hashlib.sha256(content).hexdigest()
+        messages.append(message)
+
+    # Служебные записи экспорт тоже содержит — импорт их пропускает
+    messages.insert(0, {"id": 0, "type": "service", "date": started.isoformat(), "action": "create_channel"})
+    export = {"name": "Bench", "type": "public_channel", "id": EXPORT_CHANNEL_ID, "messages": messages}
+    (path / "result.json").write_bytes(orjson.dumps(export))
+    return files
+
+
+async def run_interrupted(pool, export_dir, args):
+    backfill = Backfill(pool, export_dir, args.batch_size, args.workers)
+    task = asyncio.create_task(backfill.run())
+    while not task.done() and backfill.done < args.interrupt_at:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return backfill
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--media-every", type=int, default=10, help="каждое N-е сообщение с файлом")
+    parser.add_argument("--file-size", type=int, default=16 * 1024)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--interrupt-at", type=int, default=40_000, help="прервать после N сообщений, 0 — без прерывания")
+    args = parser.parse_args()
+
+    export_dir = Path(tempfile.mkdtemp(prefix="bench_export_"))
+    started = time.perf_counter()
+    files = make_export(export_dir, args.messages, args.media_every, args.file_size)
+    print(f"Экспорт: {args.messages} сообщений, {len(files)} файлов за {time.perf_counter() - started:.1f} с")
+
+    pool = await create_bench_pool(min_size=1, max_size=4)
+    failed = False
+    try:
+        await init_db(pool)
+        chat_id = export_chat_id({"id": EXPORT_CHANNEL_ID, "type": "public_channel"})
+        # «Живой бот» уже принял последние сообщения канала
+        live_ids = range(args.messages - LIVE_MESSAGES + 1, args.messages + 1)
+        for message_id in live_ids:
+            # Нечётные сохранены ещё до появления message_claims
+            claimed = message_id % 2 == 0
+            if claimed:
+                await claim_message(pool, chat_id, message_id, ttl=0)
+            await save_message_to_db(pool, message_id, f"Сообщение {message_id}")
+            if claimed:
+                await complete_message_claim(pool, chat_id, message_id)
+        # Файлы принятых ботом сообщений импорт не трогает
+        imported_files = {k: v for k, v in files.items() if k not in live_ids}
+        media_items = len(imported_files)
+        unique_files = len(set(imported_files.values()))
+
+        files_before = sum(1 for p in MEDIA_ROOT.rglob("*") if p.is_file())
+        started = time.perf_counter()
+        if args.interrupt_at:
+            first = await run_interrupted(pool, export_dir, args)
+            print(f"Первый запуск прерван после {first.done} сообщений: {first.stats()}")
+        resumed = Backfill(pool, export_dir, args.batch_size, args.workers)
+        stats = await resumed.run()
+        elapsed = time.perf_counter() - started
+        print(f"Второй запуск: {stats}")
+        print(f"Всего {args.messages / elapsed:.0f} сообщ/с за {elapsed:.1f} с")
+
+        async with pool.acquire() as conn:
+            rows = await conn.fetchval("SELECT count(*) FROM messages")
+            distinct = await conn.fetchval("SELECT count(DISTINCT message_id) FROM messages")
+            items = await conn.fetch("SELECT media_url FROM media_items")
+            empty_tsv = await conn.fetchval("SELECT count(*) FROM messages WHERE text_tsv IS NULL")
+        # В ленте изменений только посты «живого бота», история туда не попадает
+        feed, _ = await fetch_messages_since(pool, 0, args.messages)
+        missing = [row["media_url"] for row in items
+                   if not (MEDIA_ROOT / Path(row["media_url"]).relative_to("uploads")).is_file()]
+        copied = sum(1 for p in MEDIA_ROOT.rglob("*") if p.is_file()) - files_before
+        leftovers = [p for p in MEDIA_ROOT.rglob("*.part")]
+
+        checks = {
+            "строк на сообщение": rows == distinct == args.messages,
+            "media_items": len(items) == media_items,
+            "файлы на месте": not missing,
+            "копий файлов": copied == unique_files and not leftovers,
+            "поиск заполнен": empty_tsv == 0,
+            "история не в since": len(feed) == len(live_ids),
+        }
+        print(f"messages {rows} (уникальных {distinct}), media_items {len(items)}/{media_items}, "
+              f"файлов скопировано {copied}/{unique_files}, нет на диске {len(missing)}, .part {len(leftovers)}")
+        for name, ok in checks.items():
+            print(f"  {name}: {'✅' if ok else '❌'}")
+        failed = not all(checks.values())
+    finally:
+        await pool.close()
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Пропускная способность PostgresUpdateQueue в зависимости от числа процессов.
+
+Очередь заполняется заранее, затем N процессов разбирают её одновременно.
+Хендлер имитирует работу апдейта: CPU (разбор, хеширование) и ожидание
+сети через asyncio.sleep. CPU-часть в одном процессе упирается в GIL,
+поэтому рост с числом процессов показывает, что даёт режим cluster.
+
+    python bench/cluster_throughput.py --updates 2000 --processes 1 2 4 --cpu-ms 5
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import time
+
+import _db  # noqa: F401  (src в sys.path)
+from _db import create_bench_pool
+from aiogram.types import Update
+
+from database.db import init_db
+from database.models import enqueue_update, count_queued_updates
+from services.queue import PostgresUpdateQueue
+
+
+def make_payload(n: int) -> str:
+    return Update(**{
+        "update_id": n,
+        "channel_post": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": -100, "type": "channel", "title": "bench"},
+            "text": f"post {n}",
+        },
+    }).model_dump_json(by_alias=True, exclude_none=True)
+
+
+def burn_cpu(ms: float):
+    deadline = time.perf_counter() + ms / 1000
+    digest = b""
+    while time.perf_counter() < deadline:
+        digest = hashlib.sha256(digest).digest()
+
+
+async def seed(updates: int):
+    pool = await create_bench_pool(min_size=1, max_size=4)
+    try:
+        await init_db(pool)
+        for n in range(updates):
+            await enqueue_update(pool, make_payload(n))
+    finally:
+        await pool.close()
+
+
+async def consume(workers: int, cpu_ms: float, io_ms: float, handled):
+    pool = await create_bench_pool(reset=False, min_size=1, max_size=workers + 2)
+
+    async def handler(update):
+        burn_cpu(cpu_ms)
+        await asyncio.sleep(io_ms / 1000)
+        with handled.get_lock():
+            handled.value += 1
+
+    queue = PostgresUpdateQueue(
+        pool, handler, maxsize=0, workers=workers, visibility_timeout=300, max_attempts=5
+    )
+    queue.start()
+    try:
+        while await count_queued_updates(pool):
+            await asyncio.sleep(0.1)
+    finally:
+        await queue.stop(timeout=30)
+        await pool.close()
+
+
+def run_consumer(workers, cpu_ms, io_ms, handled):
+    asyncio.run(consume(workers, cpu_ms, io_ms, handled))
+
+
+def run(processes, updates, workers, cpu_ms, io_ms):
+    asyncio.run(seed(updates))
+
+    context = multiprocessing.get_context("fork")
+    handled = context.Value("i", 0)
+    children = [
+        context.Process(target=run_consumer, args=(workers, cpu_ms, io_ms, handled))
+        for _ in range(processes)
+    ]
+    started = time.perf_counter()
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"процессов={processes:<3} воркеров={workers:<3} "
+        f"{handled.value / elapsed:8.1f} апд/с  обработано={handled.value}  время={elapsed:6.2f} с"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--workers", type=int, default=8, help="воркеров очереди на процесс")
+    parser.add_argument("--cpu-ms", type=float, default=5.0)
+    parser.add_argument("--io-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    for processes in args.processes:
+        run(processes, args.updates, args.workers, args.cpu_ms, args.io_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Повтор трассы публикаций с повторяющимися медиа через MediaStore.
+
+Каждое сообщение берёт файл из набора --distinct штук по закону Ципфа,
+так что популярные фото/видео репостятся многократно. Отчёт: доля попаданий
+в индекс, сэкономленные байты и сколько реально скачано у заглушки Telegram.
+
+    python bench/media_dedup.py --messages 2000 --distinct 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from _db import create_bench_pool
+from stub_telegram import StubTelegram
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    from database.db import init_db
+    from services.media import MediaProcessor
+
+    pool = await create_bench_pool(min_size=1, max_size=args.concurrency + 2)
+    await init_db(pool)
+    stub = await StubTelegram().start()
+    bot = stub.make_bot()
+    processor = MediaProcessor(bot, pool)
+
+    size = args.size_kb * 1024
+    weights = [1 / (rank + 1) for rank in range(args.distinct)]
+    trace = random.Random(1).choices(range(args.distinct), weights=weights, k=args.messages)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post(message_id, n):
+        file_id = f"photos:{size}:{n}"
+        async with semaphore:
+            await processor.download_and_save_media(file_id, "photo", message_id, f"uphotos{size}{n}")
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(post(message_id, n) for message_id, n in enumerate(trace)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.session.close()
+        await stub.stop()
+        await pool.close()
+
+    stats = processor.store.stats()
+    requested = args.messages * size
+    print(f"Сообщений: {args.messages}, уникальных файлов: {len(set(trace))}, время: {elapsed:.2f} с")
+    print(f"Попадания: {stats['hit_rate']:.1%} (по file_unique_id {stats['unique_id_hits']}, по хешу {stats['hash_hits']})")
+    print(f"Скачано: {stub.downloaded_bytes / 2**20:.1f} МБ из {requested / 2**20:.1f} МБ, "
+          f"сэкономлено {stats['bytes_saved'] / 2**20:.1f} МБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
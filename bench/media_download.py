@@ -0,0 +1,55 @@
+"""
+Пиковая память при скачивании медиа через MediaProcessor.download_and_save_media.
+
+Файлы отдаёт локальная заглушка Telegram; для каждого размера меряется
+пик tracemalloc и ru_maxrss. При потоковой записи пик не зависит от размера файла.
+
+    python bench/media_download.py --sizes-mb 1,10,50,200
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tracemalloc
+
+from _db import create_bench_pool
+from stub_telegram import StubTelegram
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", default="1,10,50,200")
+    args = parser.parse_args()
+
+    sizes = [int(float(s) * 2**20) for s in args.sizes_mb.split(",")]
+    os.environ["MEDIA_MAX_FILE_SIZE"] = str(max(sizes))
+    os.environ["MEDIA_MAX_INFLIGHT_BYTES"] = str(max(sizes))
+
+    from database.db import init_db
+    from services.media import MediaProcessor
+
+    pool = await create_bench_pool(min_size=1, max_size=2)
+    await init_db(pool)
+    stub = await StubTelegram().start()
+    bot = stub.make_bot()
+    processor = MediaProcessor(bot, pool)
+    try:
+        for n, size in enumerate(sizes):
+            tracemalloc.start()
+            path = await processor.download_and_save_media(f"videos:{size}:{n}", "video", n)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(
+                f"{size / 2**20:8.1f} МБ -> {path}: пик Python {peak / 2**20:6.2f} МБ, "
+                f"max RSS {rss_mb:7.1f} МБ"
+            )
+    finally:
+        await bot.session.close()
+        await stub.stop()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
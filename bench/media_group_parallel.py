@@ -0,0 +1,89 @@
+"""
+Время сборки альбома из 10 фото при медленной отдаче файлов.
+
+Заглушка Telegram отдаёт каждую часть со своей задержкой. Части альбома
+подаются в process_message_media подряд, как их присылает вебхук;
+меряется время до сохранения альбома. Ожидаемо оно близко к самой
+медленной части, а не к сумме задержек.
+
+    python bench/media_group_parallel.py --parts 10 --min-latency 0.2 --max-latency 1.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from _db import create_bench_pool
+from stub_telegram import StubTelegram
+
+
+def make_part(n, media_group_id, size):
+    from aiogram.types import Message
+
+    return Message.model_validate({
+        "message_id": 1000 + n,
+        "date": int(time.time()),
+        "chat": {"id": -100, "type": "channel", "title": "bench"},
+        "media_group_id": media_group_id,
+        "caption": "Альбом" if n == 0 else None,
+        "photo": [{
+            "file_id": f"photos:{size}:{n}",
+            "file_unique_id": f"uphotos{size}{n}",
+            "width": 1280,
+            "height": 960,
+        }],
+    })
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parts", type=int, default=10)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--min-latency", type=float, default=0.2)
+    parser.add_argument("--max-latency", type=float, default=1.5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MEDIA_GROUP_DELAY", "0.2")
+    os.environ.setdefault("MEDIA_GROUP_PART_DELAY", "0.05")
+
+    from database.db import init_db
+    from services.media import MediaProcessor
+
+    rng = random.Random(1)
+    latencies = {n: rng.uniform(args.min_latency, args.max_latency) for n in range(args.parts)}
+
+    pool = await create_bench_pool(min_size=2, max_size=10)
+    await init_db(pool)
+    stub = await StubTelegram(
+        download_latency=lambda path: latencies[int(path.rsplit("_", 1)[1].split(".")[0])]
+    ).start()
+    bot = stub.make_bot()
+    processor = MediaProcessor(bot, pool)
+    await processor.media_groups.start()
+
+    try:
+        started = time.perf_counter()
+        for n in range(args.parts):
+            await processor.process_message_media(make_part(n, "bench_album", args.size_kb * 1024))
+        handlers_done = time.perf_counter() - started
+
+        while processor.media_groups.finalized < 1:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        await processor.media_groups.stop()
+        await bot.session.close()
+        await stub.stop()
+
+    async with pool.acquire() as conn:
+        saved = await conn.fetchval("SELECT count(*) FROM media_items")
+    await pool.close()
+
+    print(f"Хендлеры всех частей отработали за {handlers_done * 1000:.1f} мс")
+    print(f"Альбом из {args.parts} частей сохранён за {elapsed:.2f} с, файлов в альбоме: {saved}")
+    print(f"Самая медленная часть: {max(latencies.values()):.2f} с, сумма задержек: {sum(latencies.values()):.2f} с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
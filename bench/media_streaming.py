@@ -0,0 +1,164 @@
+"""
+Отдача видео из /uploads параллельно с вебхуком.
+
+Для каждого режима MEDIA_SERVING (static — прежний StaticFiles, app — свой
+обработчик с Range/ETag, accel — X-Accel-Redirect без тела) поднимается
+отдельный процесс uvicorn с API и вебхуком. Клиенты качают видео целиком
+и кусками по Range, как плеер при перемотке; одновременно на вебхук идут
+апдейты. Отчёт: p50/p99 ответа вебхука и скорость отдачи медиа.
+
+    python bench/media_streaming.py --streams 32 --file-mb 50 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+import _db  # noqa: F401  (src в sys.path и MEDIA_ROOT во временном каталоге)
+from _db import create_bench_pool, percentiles
+from webhook_queue import make_update
+
+from database.db import init_db
+
+MODES = ("static", "app", "accel")
+
+
+async def serve(port):
+    import uvicorn
+
+    import main as bot_main
+    from api import routes
+    from services.queue import UpdateQueue
+
+    async def noop(update):
+        pass
+
+    # Рабочую БД не трогаем: хеши ищутся в схеме bench, LISTEN не нужен
+    routes.app.router.on_startup.clear()
+    routes.pool = await create_bench_pool(reset=False, min_size=1, max_size=4)
+    bot_main.update_queue = UpdateQueue(noop, maxsize=10000, workers=4)
+    bot_main.update_queue.start()
+
+    config = uvicorn.Config(routes.app, host="127.0.0.1", port=port, log_level="warning")
+    await uvicorn.Server(config).serve()
+
+
+async def wait_ready(session, base_url, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.get(f"{base_url}/apibot/stats") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API не поднялся")
+
+
+async def stream(session, base_url, files, file_size, deadline, totals):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        name = rng.choice(files)
+        headers = {}
+        if rng.random() < 0.7:
+            # Перемотка: кусок в 1 МБ с произвольного места
+            start = rng.randrange(0, max(file_size - 2**20, 1))
+            headers["Range"] = f"bytes={start}-{start + 2**20 - 1}"
+        async with session.get(f"{base_url}/uploads/video/{name}", headers=headers) as response:
+            async for chunk in response.content.iter_chunked(256 * 1024):
+                totals["bytes"] += len(chunk)
+            totals["requests"] += 1
+            totals.setdefault(response.status, 0)
+            totals[response.status] += 1
+
+
+async def post_updates(session, base_url, webhook_path, rate, deadline, latencies):
+    n = 0
+    while time.perf_counter() < deadline:
+        payload = make_update(n).model_dump(mode="json", exclude_none=True)
+        started = time.perf_counter()
+        async with session.post(f"{base_url}{webhook_path}", json=payload) as response:
+            await response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        n += 1
+        await asyncio.sleep(1 / rate)
+
+
+async def run_mode(mode, args, files, file_size):
+    from config import WEBHOOK_PATH
+
+    port = args.port
+    env = {**os.environ, "MEDIA_SERVING": mode, "METRICS_ENABLED": "false"}
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(port)], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        connector = aiohttp.TCPConnector(limit=args.streams + 8)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_ready(session, base_url)
+            deadline = time.perf_counter() + args.duration
+            totals = {"bytes": 0, "requests": 0}
+            latencies = []
+            started = time.perf_counter()
+            await asyncio.gather(
+                post_updates(session, base_url, WEBHOOK_PATH, args.rate, deadline, latencies),
+                *(stream(session, base_url, files, file_size, deadline, totals) for _ in range(args.streams))
+            )
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    p50, p99 = percentiles(latencies)
+    statuses = ", ".join(f"{k}: {v}" for k, v in totals.items() if isinstance(k, int))
+    print(
+        f"{mode:<7} вебхук p50={p50:8.2f} мс p99={p99:8.2f} мс  "
+        f"медиа {totals['bytes'] / 2**20 / elapsed:8.1f} МБ/с, {totals['requests'] / elapsed:7.1f} запр/с  ({statuses})"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--streams", type=int, default=32)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--file-mb", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--rate", type=float, default=50, help="апдейтов в секунду")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.serve:
+        await serve(args.serve)
+        return
+
+    # _db кладёт MEDIA_ROOT в окружение, дочерние процессы видят тот же каталог
+    media_root = Path(os.environ["MEDIA_ROOT"])
+    pool = await create_bench_pool(min_size=1, max_size=2)
+    await init_db(pool)
+    await pool.close()
+
+    video_dir = media_root / "video"
+    video_dir.mkdir(parents=True, exist_ok=True)
+    file_size = args.file_mb * 2**20
+    files = []
+    for n in range(args.files):
+        path = video_dir / f"bench_{n}.mp4"
+        with open(path, "wb") as f:
+            for _ in range(args.file_mb):
+                f.write(os.urandom(2**20))
+        files.append(path.name)
+
+    for mode in args.modes.split(","):
+        await run_mode(mode, args, files, file_size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
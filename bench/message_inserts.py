@@ -0,0 +1,64 @@
+"""
+Вставок в секунду: по одной строке на запрос против буфера отложенной записи.
+
+Запускает --messages вызовов save_message_to_db с --concurrency
+параллельными отправителями (как воркеры очереди апдейтов) в двух режимах.
+
+    python bench/message_inserts.py --messages 20000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+from _db import create_bench_pool
+from database.batcher import WriteBehindBatcher
+from database.db import init_db
+from database.models import save_message_to_db, set_write_batcher
+
+
+async def run(pool, label, messages, concurrency, wait):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(n):
+        async with semaphore:
+            await save_message_to_db(pool, n, f"Сообщение {n}", wait=wait)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(n) for n in range(messages)))
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--batch-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=5, max_size=20)
+    try:
+        await init_db(pool)
+
+        elapsed = await run(pool, "single", args.messages, args.concurrency, wait=True)
+        print(f"по одной строке:        {args.messages / elapsed:9.0f} вставок/с")
+
+        for wait in (True, False):
+            batcher = WriteBehindBatcher(pool, args.batch_size, args.batch_delay)
+            batcher.start()
+            set_write_batcher(batcher)
+            started = time.perf_counter()
+            await run(pool, "batched", args.messages, args.concurrency, wait=wait)
+            await batcher.stop()
+            elapsed = time.perf_counter() - started
+            set_write_batcher(None)
+
+            label = "пачками, ждём id:" if wait else "пачками, без ожидания:"
+            print(f"{label:<23} {args.messages / elapsed:9.0f} вставок/с "
+                  f"(средняя пачка {batcher.stats()['avg_batch']})")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Бенчмарк потоковой выгрузки /apibot/messages/export.
+
+Наполняет messages и выгружает всю таблицу через export_chunks,
+отслеживая пик памяти Python (tracemalloc). Пик не должен расти
+вместе с числом строк.
+
+    python bench/messages_export.py --sizes 100000,500000,1000000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from _db import create_bench_pool
+from messages_pagination import seed
+from database.db import init_db
+from api.routes import export_chunks
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,500000,1000000")
+    parser.add_argument("--format", default="ndjson", choices=["ndjson", "json"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=1, max_size=2)
+    try:
+        await init_db(pool)
+        seeded = 0
+        for size in map(int, args.sizes.split(",")):
+            async with pool.acquire() as conn:
+                await seed(conn, seeded + 1, size)
+            seeded = size
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            total_bytes = 0
+            async for chunk in export_chunks(pool, args.format, args.batch_size):
+                total_bytes += len(chunk)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(
+                f"{size:>9} строк: {total_bytes / 2**20:8.1f} МБ за {elapsed:6.2f} с, "
+                f"пик памяти {peak / 2**20:6.2f} МБ"
+            )
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
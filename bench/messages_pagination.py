@@ -0,0 +1,103 @@
+"""
+Бенчмарк keyset-пагинации /apibot/messages.
+
+Наполняет таблицу messages до 1M строк ступенями и на каждой ступени
+меряет p50/p99 одной страницы: первая страница, глубокая страница
+по курсору и страницы с фильтрами. Время должно оставаться плоским.
+
+    python bench/messages_pagination.py --sizes 100000,250000,500000,1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from _db import create_bench_pool, percentiles
+from database.db import ensure_message_partitions, init_db
+from database.models import fetch_messages_page
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO messages (message_id, text, media_group_id, timestamp)
+    SELECT
+        g,
+        'Сообщение ' || g,
+        CASE WHEN g % 7 = 0 THEN 'group_' || g END,
+        TIMESTAMP '2015-01-01' + g * INTERVAL '1 minute'
+    FROM generate_series($1::bigint, $2::bigint) AS g
+    """,
+    # Одиночные фото/видео и альбомы из двух файлов
+    """
+    INSERT INTO media_items (message_db_id, position, media_type, media_url)
+    SELECT id, 0,
+           CASE WHEN message_id % 3 = 0 THEN 'photo' ELSE 'video' END,
+           'uploads/img/' || message_id || '_media'
+    FROM messages
+    WHERE message_id BETWEEN $1 AND $2 AND media_group_id IS NULL
+      AND (message_id % 3 = 0 OR message_id % 5 = 0)
+    UNION ALL
+    SELECT id, position, media_type, media_url
+    FROM messages,
+         (VALUES (0, 'photo', 'uploads/img/a.jpg'), (1, 'video', 'uploads/video/b.mp4'))
+             AS v(position, media_type, media_url)
+    WHERE message_id BETWEEN $1 AND $2 AND media_group_id IS NOT NULL
+    """,
+]
+
+
+async def seed(conn, start, end):
+    # Время строк — 2015-01-01 плюс номер в минутах; секции под них создаём заранее
+    epoch = datetime(2015, 1, 1)
+    await ensure_message_partitions(conn, epoch + timedelta(minutes=start), epoch + timedelta(minutes=end))
+    for statement in SEED_STATEMENTS:
+        await conn.execute(statement, start, end)
+    await conn.execute("ANALYZE messages")
+    await conn.execute("ANALYZE media_items")
+
+
+async def measure(pool, label, requests, deep=False, **filters):
+    samples = []
+    async with pool.acquire() as conn:
+        bounds = await conn.fetchrow("SELECT min(timestamp) AS lo, max(timestamp) AS hi, max(id) AS max_id FROM messages")
+
+    for _ in range(requests):
+        before = None
+        if deep:
+            offset = random.random() * (bounds["hi"] - bounds["lo"])
+            before = (bounds["lo"] + offset, bounds["max_id"])
+
+        started = time.perf_counter()
+        await fetch_messages_page(pool, limit=50, before=before, **filters)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    p50, p99 = percentiles(samples)
+    print(f"  {label:<24} p50={p50:7.2f} мс  p99={p99:7.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100000,250000,500000,1000000")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=1, max_size=4)
+    try:
+        await init_db(pool)
+        seeded = 0
+        for size in map(int, args.sizes.split(",")):
+            async with pool.acquire() as conn:
+                await seed(conn, seeded + 1, size)
+            seeded = size
+
+            print(f"Строк в messages: {size}")
+            await measure(pool, "first page", args.requests)
+            await measure(pool, "deep page", args.requests, deep=True)
+            await measure(pool, "media_type=photo", args.requests, media_type="photo")
+            await measure(pool, "media_group only", args.requests, media_group=True)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Проверка /metrics после синтетического трафика и цена инструментирования.
+
+Гоняет через ASGI-приложение запросы к вебхуку и /apibot/messages,
+скачивает файлы через MediaProcessor с заглушкой Telegram, затем снимает
+/metrics и проверяет, что у каждой ожидаемой метрики есть наблюдения.
+В конце сравнивает pool.acquire() с metrics.acquire(). Нужен httpx.
+
+    python bench/metrics_scrape.py --requests 200
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from _db import create_bench_pool, percentiles
+from messages_pagination import seed
+from stub_telegram import StubTelegram
+from webhook_queue import make_update
+
+import main as bot_main
+import metrics
+from config import METRICS_PATH, WEBHOOK_PATH
+from api import routes
+from database.db import init_db
+from services.media import MediaProcessor
+from services.queue import UpdateQueue
+
+EXPECTED = {
+    "bot_webhook_seconds": {"status": "ok"},
+    "bot_media_get_file_seconds": {"media_type": "photo"},
+    "bot_media_download_seconds": {"media_type": "photo"},
+    "bot_media_disk_write_seconds": {"media_type": "photo"},
+    "db_acquire_wait_seconds": {"function": "fetch_messages_page"},
+    "db_query_seconds": {"function": "fetch_messages_page"},
+    "api_messages_seconds": {"cache": "miss"},
+    "api_messages_rows": {},
+}
+
+
+def observed_count(families, name, labels):
+    for family in families:
+        if family.name != name:
+            continue
+        for sample in family.samples:
+            if sample.name == f"{name}_count" and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return 0
+
+
+async def acquire_overhead(pool, rounds):
+    plain, timed = [], []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        async with pool.acquire():
+            pass
+        plain.append((time.perf_counter() - started) * 1e6)
+
+        started = time.perf_counter()
+        async with metrics.acquire(pool, "bench"):
+            pass
+        timed.append((time.perf_counter() - started) * 1e6)
+    return percentiles(plain), percentiles(timed)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=2, max_size=10)
+    await init_db(pool)
+    async with pool.acquire() as conn:
+        await seed(conn, 1, args.rows)
+
+    routes.pool = pool
+    metrics.track_pool(pool, "api")
+
+    async def noop(update):
+        pass
+
+    bot_main.update_queue = UpdateQueue(noop, maxsize=args.requests, workers=2)
+    bot_main.update_queue.start()
+    stub = await StubTelegram().start()
+    bot = stub.make_bot()
+    processor = MediaProcessor(bot, pool)
+
+    try:
+        transport = httpx.ASGITransport(app=routes.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for n in range(args.requests):
+                update = make_update(n).model_dump(mode="json", exclude_none=True)
+                await client.post(WEBHOOK_PATH, json=update)
+                await client.get("/apibot/messages", params={"limit": 1 + n % 100})
+            for n in range(20):
+                await processor.download_and_save_media(f"photos:{256 * 1024}:{n}", "photo", n)
+
+            response = await client.get(METRICS_PATH)
+    finally:
+        await bot_main.update_queue.stop(timeout=5)
+        await bot.session.close()
+        await stub.stop()
+
+    if response.status_code != 200:
+        print(f"/metrics вернул {response.status_code}")
+        await pool.close()
+        sys.exit(1)
+
+    families = list(text_string_to_metric_families(response.text))
+    missing = []
+    for name, labels in EXPECTED.items():
+        count = observed_count(families, name, labels)
+        print(f"{name:<32} {labels or ''!s:<40} наблюдений={count:.0f}")
+        if not count:
+            missing.append(name)
+    print(f"размер ответа /metrics: {len(response.content)} байт")
+
+    (plain_p50, plain_p99), (timed_p50, timed_p99) = await acquire_overhead(pool, 2000)
+    print(f"pool.acquire()    p50={plain_p50:7.1f} мкс  p99={plain_p99:7.1f} мкс")
+    print(f"metrics.acquire() p50={timed_p50:7.1f} мкс  p99={timed_p99:7.1f} мкс")
+    await pool.close()
+
+    if missing:
+        print(f"Нет наблюдений: {', '.join(missing)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Секционирование messages по месяцам: свежие страницы не дорожают с ростом истории.
+
+Наполняет текущий месяц, затем ступенями добавляет историю в прошлое
+(--steps месяцев за ступень, --per-month сообщений в месяце) и на каждой
+ступени меряет p50/p99 первой страницы и страницы по курсору за последние
+сутки, а по EXPLAIN ANALYZE считает, сколько секций реально прочитано.
+В конце архивирует всё старше --keep месяцев через PartitionMaintainer и
+проверяет, что архив содержит все сообщения, а файлы медиа ушли в tar.
+Перед архивацией init_db вызывается повторно, как при рестарте бота.
+
+    python bench/partitions.py --steps 12,24,48 --per-month 20000 --keep 6
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from _db import create_bench_pool, percentiles
+
+from database.db import add_months, ensure_message_partitions, init_db, month_start
+from database.models import MESSAGES_SELECT, fetch_messages_page
+
+SEED_MESSAGES = """
+INSERT INTO messages (message_id, text, timestamp, text_tsv)
+SELECT g, 'Сообщение ' || g, $3::timestamp + (g - $1) * $4::interval, ''::tsvector
+FROM generate_series($1::bigint, $2::bigint) AS g
+"""
+
+# Каждое сотое сообщение с фото, чтобы архивации было что переносить
+SEED_MEDIA = """
+INSERT INTO media_items (message_db_id, position, media_type, media_url)
+SELECT id, 0, 'photo', 'uploads/img/bench_' || id || '.jpg'
+FROM messages
+WHERE message_id BETWEEN $1 AND $2 AND message_id % 100 = 0
+RETURNING media_url
+"""
+
+PAGE_QUERY = f"""
+EXPLAIN (ANALYZE, FORMAT JSON)
+{MESSAGES_SELECT}
+WHERE m.timestamp <= $1 AND (m.timestamp, m.id) < ($1, $2)
+ORDER BY m.timestamp DESC, m.id DESC
+LIMIT 51
+"""
+
+
+async def seed_month(conn, month, end, first_id, count):
+    step = (end - month) / count
+    await ensure_message_partitions(conn, month, month)
+    await conn.execute(SEED_MESSAGES, first_id, first_id + count - 1, month, step)
+    media_urls = await conn.fetch(SEED_MEDIA, first_id, first_id + count - 1)
+    for row in media_urls:
+        path = Path(os.environ["MEDIA_ROOT"]) / Path(row["media_url"]).relative_to("uploads")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(1024))
+    return first_id + count
+
+
+def scanned_partitions(plan):
+    """
+    Секции, которые исполнитель действительно прочитал (Actual Loops > 0).
+    """
+    found = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        name = node.get("Relation Name", "")
+        if name.startswith("messages_p") and node.get("Actual Loops", 0) > 0:
+            found.add(name)
+        stack.extend(node.get("Plans", []))
+    return found
+
+
+async def measure(pool, now, requests):
+    results = {}
+    for label, before in (("first page", None), ("last day", (now - timedelta(days=1), 2**31 - 1))):
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await fetch_messages_page(pool, limit=50, before=before)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[label] = percentiles(samples)
+
+    async with pool.acquire() as conn:
+        plan = json.loads(await conn.fetchval(PAGE_QUERY, now, 2**31 - 1))[0]["Plan"]
+        total = await conn.fetchval(
+            "SELECT count(*) FROM pg_inherits WHERE inhparent = 'messages'::regclass"
+        )
+    return results, len(scanned_partitions(plan)), total
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", default="12,24,48", help="месяцев истории на каждой ступени")
+    parser.add_argument("--per-month", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--keep", type=int, default=6, help="месяцев, оставляемых при архивации")
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=1, max_size=4)
+    try:
+        await init_db(pool)
+        async with pool.acquire() as conn:
+            now = await conn.fetchval("SELECT NOW()::timestamp")
+            current = month_start(now)
+            next_id = await seed_month(conn, current, now, 1, args.per_month)
+
+            months = 0
+            for target in map(int, args.steps.split(",")):
+                while months < target:
+                    months += 1
+                    month = add_months(current, -months)
+                    next_id = await seed_month(conn, month, add_months(month, 1), next_id, args.per_month)
+                await conn.execute("ANALYZE messages")
+
+                results, scanned, total = await measure(pool, now, args.requests)
+                print(f"История {months} мес., строк {next_id - 1}, секций {total}, прочитано секций: {scanned}")
+                for label, (p50, p99) in results.items():
+                    print(f"  {label:<12} p50={p50:7.2f} мс  p99={p99:7.2f} мс")
+
+        # Повторный init_db, как при рестарте бота, не должен заново переносить messages
+        async with pool.acquire() as conn:
+            rows_before = await conn.fetchval("SELECT count(*) FROM messages")
+        await init_db(pool)
+        async with pool.acquire() as conn:
+            rows_after = await conn.fetchval("SELECT count(*) FROM messages")
+        print(f"Повторный init_db: строк {rows_before} → {rows_after} {'✅' if rows_before == rows_after else '❌'}")
+
+        from services.partitions import PartitionMaintainer
+
+        archive_dir = Path(tempfile.mkdtemp(prefix="bench_archive_"))
+        maintainer = PartitionMaintainer(pool, archive_dir=archive_dir, retention_months=args.keep)
+        started = time.perf_counter()
+        await maintainer.run_once()
+        elapsed = time.perf_counter() - started
+        stats = maintainer.stats()
+        print(f"Архивация: {stats['archived']} секций, {stats['archived_messages']} сообщений, "
+              f"{stats['archived_files']} файлов за {elapsed:.1f} с")
+
+        archived_rows = 0
+        archived_files = 0
+        for path in archive_dir.glob("*.ndjson.gz"):
+            with gzip.open(path) as f:
+                archived_rows += sum(1 for _ in f)
+        for path in archive_dir.glob("*.media.tar"):
+            with tarfile.open(path) as tar:
+                archived_files += len(tar.getmembers())
+        async with pool.acquire() as conn:
+            left = await conn.fetchval("SELECT count(*) FROM messages")
+            cutoff = add_months(current, -args.keep)
+            older = await conn.fetchval("SELECT count(*) FROM messages WHERE timestamp < $1", cutoff)
+        ok = archived_rows == stats["archived_messages"] and archived_files == stats["archived_files"] and not older
+        print(f"В архиве {archived_rows} строк и {archived_files} файлов, в БД осталось {left} {'✅' if ok else '❌'}")
+
+        results, scanned, total = await measure(pool, now, args.requests)
+        print(f"После архивации: секций {total}, прочитано секций: {scanned}")
+        for label, (p50, p99) in results.items():
+            print(f"  {label:<12} p50={p50:7.2f} мс  p99={p99:7.2f} мс")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Восстановление PoolManager после перезапуска Postgres.
+
+Под постоянной нагрузкой (SELECT через пул с заданной частотой) устраивает сбой:
+по умолчанию обрывает все соединения к базе через pg_terminate_backend, а с
+--restart-cmd выполняет команду перезапуска сервера (например,
+"docker restart bench-pg" или "pg_ctl -D /var/lib/postgresql/data restart").
+Считает время от сбоя до первого успешного запроса и до пересоздания пула.
+Код выхода 1, если восстановление дольше --max-recovery секунд.
+
+    python bench/pool_recovery.py --restart-cmd "docker restart bench-pg" --max-recovery 10
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import asyncpg
+
+from _db import DB_CONFIG, create_bench_pool
+
+from metrics import acquire
+
+
+async def load(pool, rate, stop, timeline):
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            async with acquire(pool, "bench") as conn:
+                await conn.fetchval("SELECT 1", timeout=1)
+            timeline.append((started, True))
+        except Exception:
+            timeline.append((started, False))
+        await asyncio.sleep(1 / rate)
+
+
+async def break_database(restart_cmd):
+    if restart_cmd:
+        process = await asyncio.create_subprocess_shell(restart_cmd)
+        await process.wait()
+        return
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        await conn.execute("""
+        SELECT pg_terminate_backend(pid)
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND pid <> pg_backend_pid()
+        """)
+    finally:
+        await conn.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restart-cmd", help="команда перезапуска Postgres")
+    parser.add_argument("--rate", type=float, default=50, help="запросов в секунду")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--observe", type=float, default=20, help="секунд наблюдения после сбоя")
+    parser.add_argument("--max-recovery", type=float, default=10)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(reset=False, min_size=5, max_size=10)
+    stop = asyncio.Event()
+    timeline = []
+    load_task = asyncio.create_task(load(pool, args.rate, stop, timeline))
+
+    await asyncio.sleep(args.warmup)
+    broken_at = time.monotonic()
+    await break_database(args.restart_cmd)
+    print(f"Сбой устроен за {time.monotonic() - broken_at:.2f} с")
+
+    reconnected_at = None
+    deadline = broken_at + args.observe
+    while time.monotonic() < deadline:
+        if reconnected_at is None and pool.reconnects:
+            reconnected_at = time.monotonic()
+        await asyncio.sleep(0.1)
+
+    stop.set()
+    await load_task
+    stats = pool.stats()
+    await pool.close()
+
+    after = [(started, ok) for started, ok in timeline if started > broken_at]
+    failures = [started for started, ok in after if not ok]
+    print(f"Ошибок после сбоя: {len(failures)} из {len(after)}")
+    print(f"Пересоздание пула: {f'{reconnected_at - broken_at:.2f} с' if reconnected_at else 'не понадобилось'}")
+    print(f"Статистика пула: {stats}")
+
+    if not failures:
+        print("Запросы не падали — сбой пережит без ошибок")
+        return
+    # Восстановление — первый успешный запрос после последней ошибки
+    recovered_at = next((started for started, ok in after if ok and started > failures[-1]), None)
+    if recovered_at is None:
+        print(f"❌ Не восстановились за {args.observe} с")
+        sys.exit(1)
+
+    recovery = recovered_at - broken_at
+    print(f"Первый успешный запрос после ошибок через {recovery:.2f} с")
+    if recovery > args.max_recovery:
+        print(f"❌ Дольше {args.max_recovery} с")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+"""
+Воспроизведение трассы апдейтов через webhook_handler с заглушкой Telegram.
+
+Бот собирается так же, как в main(): те же хендлеры, очередь апдейтов,
+MediaProcessor и сборщик альбомов, но Bot API — локальная заглушка, а БД —
+схема bench. Апдейты отправляются в ASGI-приложение по offset из трассы,
+затем скрипт ждёт, пока все сообщения окажутся в messages.
+
+Отчёт: апдейтов в секунду (от первого запроса до последней записи в БД),
+p50/p99 ответа вебхука, число обращений к БД, вызовы Bot API, скачанные байты,
+пик памяти. --save сохраняет отчёт в JSON, --baseline сравнивает с сохранённым.
+
+--resend доля апдейтов отправляется повторно через --resend-delay секунд, как
+это делает Telegram после ошибки или таймаута вебхука. В отчёте extra_rows
+должно быть 0, а вызовы getFile и скачанные байты — как без повторов.
+--no-window отключает окно update_id, и повторы ловит только message_claims в БД.
+
+    python bench/replay.py --updates 2000 --rate 200 --save baseline.json
+    python bench/replay.py --trace recorded.jsonl --speed 4 --baseline baseline.json
+    python bench/replay.py --trace recorded.jsonl --resend 0.5 --no-window --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import time
+import tracemalloc
+
+import httpx
+
+from _db import create_bench_pool, percentiles
+from stub_telegram import StubTelegram
+from traces import synthetic_trace, load_trace, save_trace, expected_messages
+
+# Чем меньше — тем лучше; для остальных метрик больше — лучше
+LOWER_IS_BETTER = {
+    "extra_rows", "webhook_p50_ms", "webhook_p99_ms", "elapsed_s", "db_queries",
+    "db_queries_per_update", "max_rss_mb", "python_peak_mb",
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, record):
+        self.count += 1
+
+    async def attach(self, conn):
+        conn.add_query_logger(self)
+
+
+async def fire(client, path, update, results, delay=0.0):
+    if delay:
+        await asyncio.sleep(delay)
+    started = time.perf_counter()
+    response = await client.post(path, json=update)
+    results.append(((time.perf_counter() - started) * 1000, response.status_code))
+
+
+async def wait_for_messages(pool, expected, timeout):
+    deadline = time.perf_counter() + timeout
+    stored = 0
+    while time.perf_counter() < deadline:
+        async with pool.acquire() as conn:
+            stored = await conn.fetchval("SELECT count(*) FROM messages")
+        if stored >= expected:
+            break
+        await asyncio.sleep(0.05)
+    return stored
+
+
+async def run(trace, args):
+    stub = await StubTelegram(args.api_latency, args.download_latency).start()
+    # config читает переменные при импорте, поэтому бот импортируется после старта заглушки
+    os.environ["TELEGRAM_API_SERVER"] = stub.base_url
+    os.environ.setdefault("WEBHOOK_HOST", "https://bench.invalid")
+    if args.no_window:
+        os.environ["UPDATE_DEDUP_WINDOW"] = "0"
+
+    import main as bot_main
+    from config import WEBHOOK_PATH, UPDATE_WORKERS
+    from api.routes import app
+    from database.db import init_db
+    from hook.webhook import WebhookManager
+    from services.media import MediaProcessor
+
+    counter = QueryCounter()
+    pool = await create_bench_pool(min_size=5, max_size=20, init=counter.attach)
+    await init_db(pool)
+
+    processor = MediaProcessor(bot_main.bot, pool)
+    bot_main.register_handlers(processor)
+    await WebhookManager(bot_main.bot).setup_webhook()
+    await processor.media_groups.start()
+    bot_main.update_queue = bot_main.create_update_queue(pool, UPDATE_WORKERS)
+    bot_main.update_queue.start()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    counter.count = 0
+    stub.calls.clear()
+    expected = expected_messages(trace)
+    results = []
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            tasks = []
+            rng = random.Random(0)
+            resent = 0
+            for item in trace:
+                delay = started + item["offset"] / args.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(fire(client, WEBHOOK_PATH, item["update"], results)))
+                if rng.random() < args.resend:
+                    resent += 1
+                    tasks.append(asyncio.create_task(
+                        fire(client, WEBHOOK_PATH, item["update"], results, args.resend_delay)
+                    ))
+            await asyncio.gather(*tasks)
+            stored = await wait_for_messages(pool, expected, args.timeout)
+            elapsed = time.perf_counter() - started
+            if resent:
+                # Повторы могли ещё обрабатываться — даём им дойти до БД
+                await asyncio.sleep(1)
+                async with pool.acquire() as conn:
+                    stored = await conn.fetchval("SELECT count(*) FROM messages")
+    finally:
+        python_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else 0
+        tracemalloc.stop()
+        await bot_main.update_queue.stop(timeout=args.timeout)
+        await processor.media_groups.stop()
+        await bot_main.bot.session.close()
+        await stub.stop()
+        await pool.close()
+
+    latencies = [latency for latency, _ in results]
+    p50, p99 = percentiles(latencies)
+    report = {
+        "updates": len(trace),
+        "messages_expected": expected,
+        "messages_stored": stored,
+        "resent": resent,
+        "extra_rows": max(stored - expected, 0),
+        "duplicates_window": bot_main.recent_updates.duplicates,
+        "duplicates_claim": processor.duplicates,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(trace) / elapsed, 1),
+        "webhook_p50_ms": round(p50, 2),
+        "webhook_p99_ms": round(p99, 2),
+        "webhook_errors": sum(1 for _, status in results if status != 200),
+        "db_queries": counter.count,
+        "db_queries_per_update": round(counter.count / len(trace), 2),
+        "bot_api_calls": dict(stub.calls),
+        "downloaded_mb": round(stub.downloaded_bytes / 2**20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "python_peak_mb": round(python_peak / 2**20, 2),
+    }
+    return report
+
+
+def print_report(report, baseline=None):
+    for key, value in report.items():
+        line = f"{key:<24} {value}"
+        base = baseline.get(key) if baseline else None
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            change = (value - base) / base * 100
+            better = change < 0 if key in LOWER_IS_BETTER else change > 0
+            mark = "" if abs(change) < 1 else (" ✅" if better else " ⚠️")
+            line += f"   (было {base}, {change:+.1f}%{mark})"
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", help="JSONL-трасса; без неё генерируется синтетическая")
+    parser.add_argument("--write-trace", help="сохранить синтетическую трассу в файл")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="постов в секунду")
+    parser.add_argument("--media-share", type=float, default=0.3)
+    parser.add_argument("--album-share", type=float, default=0.1)
+    parser.add_argument("--album-size", type=int, default=4)
+    parser.add_argument("--file-size", type=int, default=256 * 1024)
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение воспроизведения")
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--download-latency", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--resend", type=float, default=0.0, help="доля апдейтов, доставляемых повторно")
+    parser.add_argument("--resend-delay", type=float, default=0.5, help="через сколько секунд повтор")
+    parser.add_argument("--no-window", action="store_true", help="без окна update_id, только claims в БД")
+    parser.add_argument("--tracemalloc", action="store_true", help="пик памяти Python (замедляет прогон)")
+    parser.add_argument("--save", help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="JSON-отчёт для сравнения")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(
+            args.updates, args.rate, args.media_share, args.album_share,
+            args.album_size, args.file_size
+        )
+        if args.write_trace:
+            save_trace(args.write_trace, trace)
+
+    report = await run(trace, args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
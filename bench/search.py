@@ -0,0 +1,80 @@
+"""
+Задержка полнотекстового поиска на 1M сообщений.
+
+Наполняет messages текстами из русского словаря (с заполненным text_tsv
+и GIN-индексом) и меряет p50/p99 search_messages для редких и частых
+слов, фраз и глубоких страниц.
+
+    python bench/search.py --rows 1000000 --requests 200
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from _db import create_bench_pool, percentiles
+from database.db import ensure_message_partitions, init_db
+from database.models import search_messages
+
+WORDS = [
+    "жизнь", "город", "новости", "фотография", "концерт", "выставка", "музыка",
+    "погода", "праздник", "встреча", "спектакль", "книга", "кино", "театр",
+    "река", "лес", "дорога", "история", "школа", "работа", "семья", "друзья",
+    "весна", "лето", "осень", "зима", "утро", "вечер", "ночь", "солнце",
+    "дождь", "снег", "ветер", "море", "горы", "путешествие", "поезд", "самолёт",
+    "музей", "парк", "улица", "площадь", "фестиваль", "ярмарка", "спорт",
+    "футбол", "хоккей", "забег", "велосипед", "редкость",
+]
+
+SEED_SQL = """
+INSERT INTO messages (message_id, text, timestamp, text_tsv)
+SELECT g, t.text, TIMESTAMP '2015-01-01' + g * INTERVAL '1 minute', to_tsvector('russian', t.text)
+FROM generate_series($1::bigint, $2::bigint) AS g,
+LATERAL (
+    SELECT ($3::text[])[1 + (g * 7) % 49] || ' ' || ($3::text[])[1 + (g * 13) % 49] || ' '
+        || ($3::text[])[1 + (g * 31) % 49] || ' ' || ($3::text[])[1 + (g / 49) % 49]
+        || CASE WHEN g % 10007 = 0 THEN ' ' || ($3::text[])[50] ELSE '' END AS text
+) AS t
+"""
+
+QUERIES = {
+    "редкое слово": ("редкости", 0),
+    "частое слово": ("концерты", 0),
+    "два слова": ("город музыка", 0),
+    "фраза": ('"вечер дождь"', 0),
+    "частое, offset 2000": ("концерт", 2000),
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    pool = await create_bench_pool(min_size=1, max_size=2)
+    try:
+        await init_db(pool)
+        async with pool.acquire() as conn:
+            epoch = datetime(2015, 1, 1)
+            await ensure_message_partitions(conn, epoch, epoch + timedelta(minutes=args.rows))
+            step = 100000
+            for start in range(1, args.rows + 1, step):
+                await conn.execute(SEED_SQL, start, min(start + step - 1, args.rows), WORDS)
+            await conn.execute("ANALYZE messages")
+
+        print(f"Строк в messages: {args.rows}")
+        for label, (query, offset) in QUERIES.items():
+            samples = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                rows, _ = await search_messages(pool, query, 50, offset)
+                samples.append((time.perf_counter() - started) * 1000)
+            p50, p99 = percentiles(samples)
+            print(f"  {label:<22} p50={p50:8.2f} мс  p99={p99:8.2f} мс  (найдено на странице: {len(rows)})")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Микробенчмарки сериализации ответа /apibot/messages по стадиям.
+
+Каждая стадия меряется отдельно в строках в секунду:
+- legacy dict: прежний разбор JSON-в-TEXT колонок через json.loads;
+- row dict: row_to_message по массивам из media_items;
+- pydantic: проверка каждой строки моделью Message (путь response_model);
+- json / orjson: кодирование списка в байты.
+В конце — сквозной старый путь против нового. Строки имитируются словарями.
+
+    python bench/serialization.py --rows 10000 --repeat 20
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import orjson
+
+import _db  # noqa: F401  (src в sys.path и заглушки config)
+from api.routes import Message, row_to_message
+
+
+def legacy_row_to_message(row) -> dict:
+    is_media_group = row["media_group_id"] is not None
+    timestamp = row["timestamp"].isoformat()
+
+    if is_media_group:
+        try:
+            media_types = json.loads(row["media_type"]) if row["media_type"] else []
+            media_urls = json.loads(row["media_url"]) if row["media_url"] else []
+        except (json.JSONDecodeError, TypeError):
+            media_types = [row["media_type"]] if row["media_type"] else []
+            media_urls = [row["media_url"]] if row["media_url"] else []
+        return {
+            "id": row["id"], "message_id": row["message_id"], "text": row["text"],
+            "media_type": None, "media_url": None,
+            "media_types": media_types, "media_urls": media_urls,
+            "is_media_group": True, "timestamp": timestamp,
+        }
+    return {
+        "id": row["id"], "message_id": row["message_id"], "text": row["text"],
+        "media_type": row["media_type"], "media_url": row["media_url"],
+        "media_types": None, "media_urls": None,
+        "is_media_group": False, "timestamp": timestamp,
+    }
+
+
+def make_rows(count):
+    legacy, current = [], []
+    started = datetime(2024, 1, 1)
+    for n in range(count):
+        types = ["photo"] * (n % 5) if n % 3 == 0 else (["video"] if n % 2 else [])
+        urls = [f"uploads/img/{n}_{i}.jpg" for i in range(len(types))]
+        group = f"group_{n}" if n % 3 == 0 and types else None
+        base = {"id": n, "message_id": n, "text": f"Сообщение {n} " * 5,
+                "media_group_id": group, "timestamp": started + timedelta(minutes=n)}
+
+        if group:
+            legacy.append({**base, "media_type": json.dumps(types), "media_url": json.dumps(urls)})
+        else:
+            legacy.append({**base, "media_type": types[0] if types else None,
+                           "media_url": urls[0] if urls else None})
+        thumbs = [url.replace("img/", "thumbs/") for url in urls]
+        current.append({**base, "media_types": types or None, "media_urls": urls or None,
+                        "thumb_urls": thumbs or None, "feed_seq": n})
+    return legacy, current
+
+
+def measure(label, stage, items, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = stage(items)
+    elapsed = time.perf_counter() - started
+    rate = len(items) * repeat / elapsed
+    print(f"{label:<22} {rate:12.0f} строк/с  {elapsed / repeat / len(items) * 10000 * 1000:8.2f} мс на 10k")
+    return result
+
+
+def old_path(rows):
+    messages = [Message.model_validate(legacy_row_to_message(row)).model_dump() for row in rows]
+    return json.dumps(messages, ensure_ascii=False).encode()
+
+
+def new_path(rows):
+    return orjson.dumps([row_to_message(row) for row in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy, current = make_rows(args.rows)
+
+    print("Стадии:")
+    legacy_dicts = measure("legacy dict", lambda rows: [legacy_row_to_message(r) for r in rows], legacy, args.repeat)
+    dicts = measure("row dict", lambda rows: [row_to_message(r) for r in rows], current, args.repeat)
+    measure("pydantic validate", lambda items: [Message.model_validate(i) for i in items], legacy_dicts, args.repeat)
+    measure("json.dumps", lambda items: json.dumps(items, ensure_ascii=False).encode(), legacy_dicts, args.repeat)
+    measure("orjson.dumps", orjson.dumps, dicts, args.repeat)
+
+    print("Сквозной путь:")
+    measure("old (pydantic + json)", old_path, legacy, args.repeat)
+    measure("new (orjson)", new_path, current, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Рассылка новых сообщений через /apibot/messages/stream тысячам подписчиков.
+
+Поднимает uvicorn с API в отдельном процессе (схема bench), открывает
+--clients простаивающих SSE-соединений и меряет прирост RSS сервера на
+одно соединение. Затем пишет --messages сообщений через save_message_to_db
+и для каждого считает задержку от записи до получения всеми клиентами.
+В конце проверяет дельту /apibot/messages/since и досылку по Last-Event-ID.
+Код выхода 1, если кто-то не получил сообщение или память на соединение
+больше --max-kb.
+
+    python bench/sse_fanout.py --clients 5000 --messages 50 --max-kb 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import _db  # noqa: F401  (src в sys.path)
+from _db import create_bench_pool, percentiles
+
+from database.db import init_db
+from database.models import save_message_to_db
+
+
+def raise_nofile_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def serve(port):
+    import uvicorn
+
+    from api import routes
+
+    raise_nofile_limit()
+    routes.app.router.on_startup.clear()
+    routes.pool = await create_bench_pool(reset=False, min_size=1, max_size=4)
+    await routes.start_broadcaster()
+
+    config = uvicorn.Config(
+        routes.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096
+    )
+    await uvicorn.Server(config).serve()
+
+
+async def request(port, path, headers=""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n{headers}\r\n".encode())
+    await writer.drain()
+    status = await reader.readuntil(b"\r\n\r\n")
+    return reader, writer, status
+
+
+async def get_json(port, path):
+    reader, writer, head = await request(port, path, "Connection: close\r\n")
+    body = await reader.read()
+    writer.close()
+    return head, json.loads(body)
+
+
+async def wait_ready(port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            await get_json(port, "/apibot/stats")
+            return
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            await asyncio.sleep(0.2)
+    raise RuntimeError("API не поднялся")
+
+
+async def subscriber(port, received, connected, headers=""):
+    """
+    Читает поток и записывает время получения каждого id.
+    Разбирать chunked-кодирование не нужно: ищем только строки "id: N" (N — feed_seq).
+    """
+    reader, writer, _ = await request(port, "/apibot/messages/stream", headers)
+    connected.append(1)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b"id: "):
+                seq = int(line[4:])
+                received.setdefault(seq, []).append(time.perf_counter())
+    finally:
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.1, help="пауза между сообщениями, с")
+    parser.add_argument("--max-kb", type=float, default=64, help="допустимый RSS на соединение, КБ")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    if args.serve:
+        await serve(args.serve)
+        return
+
+    limit = raise_nofile_limit()
+    if limit < args.clients + 100:
+        print(f"⚠️ Лимит файлов {limit} меньше числа клиентов, поднимите ulimit -n")
+
+    pool = await create_bench_pool(min_size=1, max_size=4)
+    await init_db(pool)
+
+    env = {**os.environ, "METRICS_ENABLED": "false"}
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(args.port)], env=env)
+    tasks = []
+    failed = False
+    try:
+        await wait_ready(args.port)
+        rss_before = rss_kb(server.pid)
+
+        received = {}
+        connected = []
+        started = time.perf_counter()
+        for n in range(args.clients):
+            tasks.append(asyncio.create_task(subscriber(args.port, received, connected)))
+            if n % 200 == 199:
+                await asyncio.sleep(0.05)
+        while len(connected) < args.clients:
+            if time.perf_counter() - started > 60:
+                raise RuntimeError(f"Подключилось только {len(connected)} клиентов")
+            await asyncio.sleep(0.1)
+        print(f"Подключено {args.clients} клиентов за {time.perf_counter() - started:.1f} с")
+
+        # Даём серверу дойти до простоя: все генераторы ждут общий Event
+        await asyncio.sleep(2)
+        rss_idle = rss_kb(server.pid)
+        per_connection = (rss_idle - rss_before) / args.clients
+        print(f"RSS сервера: {rss_before / 1024:.1f} → {rss_idle / 1024:.1f} МБ, {per_connection:.1f} КБ на соединение")
+
+        written = {}
+        for n in range(args.messages):
+            written_at = time.perf_counter()
+            message_db_id = await save_message_to_db(pool, 10_000_000 + n, f"SSE {n}")
+            written[message_db_id] = written_at
+            await asyncio.sleep(args.interval)
+        await asyncio.sleep(2)
+
+        # id событий — feed_seq, а не id строки
+        async with pool.acquire() as conn:
+            seqs = await conn.fetch("SELECT id, feed_seq FROM messages WHERE id = ANY($1::int[])", list(written))
+        seqs = {row["id"]: row["feed_seq"] for row in seqs}
+        written = {seqs[message_db_id]: written_at for message_db_id, written_at in written.items()}
+
+        latencies = []
+        missing = 0
+        for seq, written_at in written.items():
+            times = received.get(seq, [])
+            missing += args.clients - len(times)
+            latencies.extend((t - written_at) * 1000 for t in times)
+        p50, p99 = percentiles(latencies)
+        print(f"Доставка {args.messages} сообщений: p50={p50:.1f} мс p99={p99:.1f} мс, недоставлено {missing}")
+        _, stats = await get_json(args.port, "/apibot/stats")
+        print(f"Статистика рассылки: {stats.get('sse')}")
+
+        # Переподключение: клиент с Last-Event-ID получает пропущенное из БД
+        ids = sorted(written)
+        middle = ids[len(ids) // 2]
+        _, delta = await get_json(args.port, f"/apibot/messages/since?since={middle}")
+        expected = [i for i in ids if i > middle]
+        delta_ok = [m["seq"] for m in delta] == expected
+        print(f"since={middle}: {len(delta)} сообщений {'✅' if delta_ok else '❌'}")
+
+        replay = {}
+        replay_task = asyncio.create_task(
+            subscriber(args.port, replay, [], f"Last-Event-ID: {middle}\r\n")
+        )
+        await asyncio.sleep(1)
+        replay_task.cancel()
+        replay_ok = sorted(replay) == expected
+        print(f"Last-Event-ID={middle}: досланы {len(replay)} сообщений {'✅' if replay_ok else '❌'}")
+
+        failed = missing > 0 or per_connection > args.max_kb or not delta_ok or not replay_ok
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.terminate()
+        server.wait()
+        await pool.close()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
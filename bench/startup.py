@@ -0,0 +1,149 @@
+"""
+Время от запуска процесса бота до первого обработанного апдейта.
+
+Бот запускается целиком через main() в отдельном процессе: Bot API — локальная
+заглушка с задержкой --api-latency (как у настоящего Telegram), БД — схема bench,
+API — обычный HTTP на --port. Скрипт сразу шлёт на вебхук апдейт и повторяет,
+пока бот не ответит 200, затем ждёт строку в messages. Отчёт по каждому режиму:
+время до первого 200, до записи в БД, разбивка шагов из /apibot/stats,
+число вызовов setWebhook и запросов выбросить накопившиеся апдейты.
+
+Первый запуск на чистой заглушке ставит вебхук, следующие видят, что он
+уже совпадает; --fresh-webhook сбрасывает его перед каждым запуском.
+
+    python bench/startup.py --runs 3 --api-latency 0.15
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from _db import BENCH_SCHEMA, DB_CONFIG, create_bench_pool
+from stub_telegram import StubTelegram
+from webhook_queue import make_update
+
+from database.db import init_db
+
+MODES = {"sequential": "false", "fast": "true"}
+
+
+async def serve(port):
+    import uvicorn
+
+    import main as bot_main
+    from database.pool import pool_manager
+
+    pool_manager.connect_kwargs = {**DB_CONFIG, "server_settings": {"search_path": BENCH_SCHEMA}}
+
+    async def start_api_server(sockets=None, timer=None):
+        # Без SSL: заглушка шлёт апдейты по HTTP
+        config = uvicorn.Config(bot_main.app, host="127.0.0.1", port=port, log_level="warning")
+        server = uvicorn.Server(config)
+        asyncio.create_task(bot_main.report_ready(server, timer))
+        await server.serve()
+
+    bot_main.start_api_server = start_api_server
+    await bot_main.main("all")
+
+
+async def first_served(session, base_url, webhook_path, pool, message_id, started, timeout=60):
+    """
+    Шлёт апдейт, пока бот не примет его, затем ждёт запись в БД.
+    Возвращает (секунд до 200, секунд до строки в messages) от started.
+    """
+    deadline = started + timeout
+    payload = make_update(message_id).model_dump(mode="json", exclude_none=True)
+    accepted = None
+    while accepted is None:
+        if time.perf_counter() > deadline:
+            raise RuntimeError("Бот не принял апдейт")
+        try:
+            async with session.post(f"{base_url}{webhook_path}", json=payload) as response:
+                if response.status == 200 and (await response.json()).get("status") == "ok":
+                    accepted = time.perf_counter() - started
+                    break
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.01)
+
+    while time.perf_counter() < deadline:
+        async with pool.acquire() as conn:
+            if await conn.fetchval("SELECT 1 FROM messages WHERE message_id = $1", message_id):
+                return accepted, time.perf_counter() - started
+        await asyncio.sleep(0.01)
+    raise RuntimeError("Апдейт не дошёл до БД")
+
+
+async def run_once(mode, args, stub, pool, message_id):
+    from config import WEBHOOK_PATH
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = {
+        **os.environ,
+        "FAST_START": MODES[mode],
+        "TELEGRAM_API_SERVER": stub.base_url,
+        "WEBHOOK_HOST": base_url,
+        "METRICS_ENABLED": "false",
+        "THUMBNAILS_ENABLED": "false",
+    }
+    calls_before = dict(stub.calls)
+    dropped_before = stub.dropped_pending
+    spawned = time.perf_counter()
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(args.port)], env=env)
+    try:
+        async with aiohttp.ClientSession() as session:
+            accepted, stored = await first_served(
+                session, base_url, WEBHOOK_PATH, pool, message_id, spawned
+            )
+            async with session.get(f"{base_url}/apibot/stats") as response:
+                startup = (await response.json()).get("startup", {})
+    finally:
+        server.terminate()
+        server.wait()
+
+    set_webhook = stub.calls.get("setWebhook", 0) - calls_before.get("setWebhook", 0)
+    steps = ", ".join(f"{name} {seconds:.2f}" for name, seconds in startup.get("steps", {}).items())
+    print(
+        f"{mode:<10} 200 через {accepted:5.2f} с, в БД через {stored:5.2f} с, "
+        f"setWebhook: {set_webhook}, сброс апдейтов: {stub.dropped_pending - dropped_before}  ({steps})"
+    )
+    return stored
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--api-latency", type=float, default=0.15, help="задержка Bot API, с")
+    parser.add_argument("--fresh-webhook", action="store_true")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    if args.serve:
+        await serve(args.serve)
+        return
+
+    pool = await create_bench_pool(min_size=1, max_size=2)
+    await init_db(pool)
+    stub = await StubTelegram(api_latency=args.api_latency).start()
+    message_id = 1
+    try:
+        for mode in MODES:
+            totals = []
+            for _ in range(args.runs):
+                if args.fresh_webhook:
+                    stub.webhook_url = ""
+                totals.append(await run_once(mode, args, stub, pool, message_id))
+                message_id += 1
+            print(f"{mode:<10} среднее до первого апдейта в БД: {sum(totals) / len(totals):.2f} с\n")
+    finally:
+        await stub.stop()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
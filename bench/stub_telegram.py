@@ -0,0 +1,129 @@
+"""
+Локальная заглушка Telegram Bot API для бенчмарков.
+
+getFile отдаёт file_path вида "<kind>/<size>_<n>.<ext>" — размер зашит
+в file_id ("<kind>:<size>:<n>"), а /file/bot<token>/<path> отдаёт столько
+сгенерированных байт чанками. Задержки настраиваются; download_latency
+может быть функцией от пути файла.
+
+Кроме getFile поддержаны getMe, setWebhook, deleteWebhook, getWebhookInfo
+и sendMessage — этого хватает, чтобы запустить бота целиком
+(TELEGRAM_API_SERVER=<base_url>). Число вызовов методов — в calls.
+"""
+import asyncio
+import time
+
+from aiohttp import web
+
+CHUNK = 64 * 1024
+_PATTERN = bytes(range(256)) * (CHUNK // 256)
+
+
+class StubTelegram:
+    def __init__(self, api_latency: float = 0.0, download_latency: float = 0.0):
+        self.api_latency = api_latency
+        self.download_latency = download_latency
+        self.calls = {}
+        self.downloaded_bytes = 0
+        self.webhook_url = ""
+        # Сколько раз бот просил выбросить накопившиеся апдейты
+        self.dropped_pending = 0
+        self.sent_messages = []
+        self._runner = None
+        self.base_url = None
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def make_bot(self, token="42:bench"):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token=token, session=session)
+
+    async def handle_method(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+        handler = getattr(self, f"method_{method.lower()}", None)
+        if handler is None:
+            return web.json_response({"ok": False, "error_code": 404, "description": f"Not Found: {method}"})
+        return web.json_response({"ok": True, "result": handler(params)})
+
+    def method_getfile(self, params):
+        file_id = params["file_id"]
+        kind, size, n = file_id.split(":")
+        ext = {"photos": "jpg", "videos": "mp4", "music": "mp3", "documents": "bin"}.get(kind, "bin")
+        return {
+            "file_id": file_id,
+            "file_unique_id": f"u{kind}{size}{n}",
+            "file_size": int(size),
+            "file_path": f"{kind}/{size}_{n}.{ext}",
+        }
+
+    def method_getme(self, params):
+        return {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+    def method_setwebhook(self, params):
+        self.webhook_url = params.get("url", "")
+        self._count_drop(params)
+        return True
+
+    def method_deletewebhook(self, params):
+        self.webhook_url = ""
+        self._count_drop(params)
+        return True
+
+    def _count_drop(self, params):
+        if str(params.get("drop_pending_updates", "")).lower() == "true":
+            self.dropped_pending += 1
+
+    def method_getwebhookinfo(self, params):
+        return {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+
+    def method_sendmessage(self, params):
+        self.sent_messages.append(params.get("text"))
+        return {
+            "message_id": len(self.sent_messages),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "text": params.get("text"),
+        }
+
+    async def handle_file(self, request):
+        path = request.match_info["path"]
+        size = int(path.split("/")[-1].split("_")[0])
+        latency = self.download_latency(path) if callable(self.download_latency) else self.download_latency
+        if latency:
+            await asyncio.sleep(latency)
+
+        response = web.StreamResponse(headers={"Content-Length": str(size)})
+        await response.prepare(request)
+        remaining = size
+        while remaining > 0:
+            chunk = _PATTERN[:min(CHUNK, remaining)]
+            await response.write(chunk)
+            remaining -= len(chunk)
+        self.downloaded_bytes += size
+        await response.write_eof()
+        return response
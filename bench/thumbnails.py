@@ -0,0 +1,78 @@
+"""
+Скорость генерации превью: картинок в секунду и на одно ядро.
+
+Генерирует набор JPEG заданного размера и прогоняет render_image_thumbnail
+через ProcessPoolExecutor с разным числом процессов — как ThumbnailGenerator.
+БД и Telegram не нужны, нужен Pillow.
+
+    python bench/thumbnails.py --images 200 --size 3000x2000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import _db  # noqa: F401  (src в sys.path и заглушки config)
+from PIL import Image
+
+from config import THUMB_SIZE, THUMB_QUALITY
+from services.thumbnails import render_image_thumbnail
+
+
+def make_images(directory: Path, count: int, width: int, height: int):
+    paths = []
+    # Шум плохо сжимается — ближе к фотографии, чем однотонная заливка
+    base = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    for n in range(count):
+        path = directory / f"{n}.jpg"
+        base.rotate(n % 4 * 90, expand=True).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def run(paths, out_dir: Path, workers: int, image_format: str):
+    for old in out_dir.iterdir():
+        old.unlink()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                render_image_thumbnail, str(path), str(out_dir / f"{path.stem}.{image_format}"),
+                THUMB_SIZE, image_format, THUMB_QUALITY
+            )
+            for path in paths
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    rate = len(paths) / elapsed
+    size = sum(f.stat().st_size for f in out_dir.iterdir()) / len(paths) / 1024
+    print(f"{image_format:<5} процессов={workers:<3} {rate:8.1f} картинок/с  "
+          f"{rate / workers:7.1f} на ядро  средний размер превью {size:6.1f} КБ")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", default="3000x2000")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}")
+    parser.add_argument("--formats", default="webp,jpeg")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    with tempfile.TemporaryDirectory(prefix="bench_thumbs_") as tmp:
+        source_dir, out_dir = Path(tmp) / "src", Path(tmp) / "out"
+        source_dir.mkdir()
+        out_dir.mkdir()
+        paths = make_images(source_dir, args.images, width, height)
+
+        for image_format in args.formats.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                run(paths, out_dir, workers, image_format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Трассы апдейтов для bench/replay.py.
+
+Трасса — JSONL, по строке на апдейт: {"offset": <секунды от начала>, "update": {...}}.
+update — тело запроса вебхука как его присылает Telegram, поэтому записанные
+с боевого вебхука апдейты воспроизводятся без изменений. Для синтетических
+трасс file_id имеет вид "<kind>:<size>:<n>", который понимает заглушка Telegram.
+"""
+import json
+import random
+import time
+
+CHANNEL_ID = -1001234567890
+
+# Тип медиа (он же поле апдейта) -> каталог заглушки, от него зависит расширение
+MEDIA_KINDS = {
+    "photo": "photos",
+    "video": "videos",
+    "document": "documents",
+    "audio": "music",
+}
+
+
+def _media_field(media_type, n, size):
+    file = {
+        "file_id": f"{MEDIA_KINDS[media_type]}:{size}:{n}",
+        "file_unique_id": f"bench{n}",
+        "file_size": size,
+    }
+    if media_type == "photo":
+        return [{**file, "width": 1280, "height": 720}]
+    if media_type == "video":
+        return {**file, "width": 1280, "height": 720, "duration": 10}
+    if media_type == "audio":
+        return {**file, "duration": 180}
+    return {**file, "file_name": f"bench{n}.bin"}
+
+
+def make_post(n, text=None, media_type=None, file_size=0, media_group_id=None, date=None):
+    post = {
+        "message_id": n,
+        "date": date or int(time.time()),
+        "chat": {"id": CHANNEL_ID, "type": "channel", "title": "bench"},
+    }
+    if media_type:
+        post[media_type] = _media_field(media_type, n, file_size)
+        if text:
+            post["caption"] = text
+    else:
+        post["text"] = text or f"Пост {n}"
+    if media_group_id:
+        post["media_group_id"] = media_group_id
+    return {"update_id": n, "channel_post": post}
+
+
+def synthetic_trace(count, rate, media_share=0.3, album_share=0.1, album_size=4,
+                    file_size=256 * 1024, seed=0):
+    """
+    count апдейтов, rate постов в секунду: текстовые посты, одиночные медиа
+    (media_share) и альбомы по album_size частей (album_share). Доли считаются
+    от постов, а не от апдейтов; части альбома идут пачкой через 20 мс,
+    как их присылает Telegram.
+    """
+    rng = random.Random(seed)
+    trace = []
+    n = 0
+    offset = 0.0
+    while n < count:
+        roll = rng.random()
+        if roll < album_share:
+            group_id = f"album{n}"
+            for part in range(min(album_size, count - n)):
+                media_type = "photo" if part % 2 == 0 else "video"
+                text = "Альбом" if part == 0 else None
+                trace.append({
+                    "offset": round(offset + part * 0.02, 4),
+                    "update": make_post(n, text, media_type, file_size, group_id),
+                })
+                n += 1
+        elif roll < album_share + media_share:
+            media_type = rng.choice(list(MEDIA_KINDS))
+            trace.append({"offset": round(offset, 4), "update": make_post(n, f"Медиа {n}", media_type, file_size)})
+            n += 1
+        else:
+            trace.append({"offset": round(offset, 4), "update": make_post(n)})
+            n += 1
+        offset += 1 / rate
+    # Хвост альбома может перекрыть следующий пост
+    trace.sort(key=lambda item: item["offset"])
+    return trace
+
+
+def expected_messages(trace):
+    """
+    Сколько строк messages даст трасса: альбом сохраняется одним сообщением.
+    """
+    singles = 0
+    groups = set()
+    for item in trace:
+        post = item["update"].get("channel_post") or item["update"].get("message") or {}
+        if post.get("media_group_id"):
+            groups.add(post["media_group_id"])
+        elif post:
+            singles += 1
+    return singles + len(groups)
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path, trace):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in trace:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
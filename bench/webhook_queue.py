@@ -0,0 +1,84 @@
+"""
+Нагрузочный тест очереди апдейтов с заглушкой медленного скачивания.
+
+Сравнивает время ответа вебхука при синхронной обработке (как было:
+await dp.feed_update) и при постановке в UpdateQueue. Хендлер имитирует
+get_file + download_file через asyncio.sleep, сеть не используется.
+
+    python bench/webhook_queue.py --updates 500 --download-delay 2
+"""
+import argparse
+import asyncio
+import time
+
+import _db  # noqa: F401  (src в sys.path)
+from _db import percentiles
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from services.queue import UpdateQueue
+
+
+def make_update(n: int) -> Update:
+    return Update(**{
+        "update_id": n,
+        "channel_post": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": -100, "type": "channel", "title": "bench"},
+            "text": f"post {n}",
+        },
+    })
+
+
+async def run(mode, updates, delay, workers, queue_size, rate):
+    bot = Bot(token="42:bench")
+    dp = Dispatcher()
+
+    async def slow_handler(message):
+        await asyncio.sleep(delay)
+
+    dp.channel_post.register(slow_handler)
+    queue = UpdateQueue(lambda update: dp.feed_update(bot, update), maxsize=queue_size, workers=workers)
+    queue.start()
+
+    async def webhook(update):
+        started = time.perf_counter()
+        if mode == "inline":
+            await dp.feed_update(bot, update)
+            ok = True
+        else:
+            ok = await queue.put(update, timeout=1)
+        return (time.perf_counter() - started) * 1000, ok
+
+    tasks = []
+    for n in range(updates):
+        tasks.append(asyncio.create_task(webhook(make_update(n))))
+        await asyncio.sleep(1 / rate)
+    results = await asyncio.gather(*tasks)
+
+    depth = queue.stats()["depth"]
+    await queue.stop(timeout=updates * delay)
+    await bot.session.close()
+
+    latencies = [latency for latency, ok in results if ok]
+    p50, p99 = percentiles(latencies)
+    rejected = sum(1 for _, ok in results if not ok)
+    print(f"{mode:<7} p50={p50:9.2f} мс  p99={p99:9.2f} мс  отклонено={rejected}  очередь={depth}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200, help="апдейтов в секунду")
+    parser.add_argument("--download-delay", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for mode in ("inline", "queue"):
+        await run(mode, args.updates, args.download_delay, args.workers, args.queue_size, args.rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU-кэш готовых ответов (тело в байтах, ETag, заголовки) с TTL.
+    Сбрасывается целиком при любой записи в messages.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, generation=None):
+        # Страница, собранная до последнего сброса, уже может быть устаревшей
+        if self.maxsize <= 0 or (generation is not None and generation != self.invalidations):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def record(self, hit: bool, elapsed: float):
+        if hit:
+            self.hits += 1
+            self.hit_time += elapsed
+        else:
+            self.misses += 1
+            self.miss_time += elapsed
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "avg_hit_ms": round(self.hit_time / self.hits * 1000, 3) if self.hits else 0.0,
+            "avg_miss_ms": round(self.miss_time / self.misses * 1000, 3) if self.misses else 0.0,
+        }
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from collections import deque
+
+PING_FRAME = b": ping\n\n"
+RESYNC_FRAME = b"event: resync\ndata: {}\n\n"
+
+
+def message_frame(seq: int, data: bytes) -> bytes:
+    # id (feed_seq) есть только у новых сообщений: по Last-Event-ID клиент догоняет через since
+    return b"id: %d\nevent: message\ndata: %s\n\n" % (seq, data)
+
+
+def update_frame(data: bytes) -> bytes:
+    return b"event: update\ndata: %s\n\n" % data
+
+
+class MessageBroadcaster:
+    """
+    Рассылка изменений messages подписчикам SSE.
+
+    На процесс одна подписка LISTEN: id из NOTIFY копятся batch_delay секунд,
+    затем строки читаются одним запросом и сериализуются один раз для всех.
+    Готовые кадры лежат в общем кольцевом буфере, а подписчик хранит только
+    номер последнего отправленного кадра и ждёт общий Event — простаивающее
+    соединение не держит ни очереди, ни собственного таймера. Пинги раз в
+    ping_interval рассылает одна задача.
+
+    Новое сообщение от изменения отличает feed_seq: он выдаётся в порядке
+    коммитов, а NOTIFY приходят в том же порядке, поэтому всё, что не больше
+    уже разосланного, — изменение.
+
+    load(ids) -> [(feed_seq или None, json-байты)] — сообщения по id.
+    """
+
+    def __init__(self, load, buffer_size: int, batch_delay: float, ping_interval: float):
+        self.load = load
+        self.batch_delay = batch_delay
+        self.ping_interval = ping_interval
+        self.logger = logging.getLogger(__name__)
+
+        # (номер кадра, feed_seq или None для update, кадр)
+        self._frames = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._published = asyncio.Event()
+        self._pending = set()
+        self._closing = False
+        self._flush_task = None
+        self._ping_task = None
+        self.max_seq = 0
+
+        self.clients = 0
+        self.published = 0
+        self.resyncs = 0
+
+    async def start(self, pool, channel: str, max_seq: int):
+        self.max_seq = max_seq
+        await pool.add_listener(channel, self.on_notify)
+        self._ping_task = asyncio.create_task(self._ping(), name="sse-ping")
+
+    async def stop(self, pool, channel: str):
+        await pool.remove_listener(channel, self.on_notify)
+        for task in (self._ping_task, self._flush_task):
+            if task:
+                task.cancel()
+
+    def close(self):
+        """
+        Завершает все подписки: сервер останавливается и ждёт окончания ответов.
+        Браузер переподключится к другому процессу и догонит по Last-Event-ID.
+        """
+        self._closing = True
+        self._wake()
+
+    def on_notify(self, connection, pid, channel, payload):
+        try:
+            self._pending.add(int(payload))
+        except ValueError:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # id, пришедшие во время чтения, забирает следующий проход этой же задачи
+        while self._pending:
+            await asyncio.sleep(self.batch_delay)
+            ids, self._pending = sorted(self._pending), set()
+            try:
+                rows = await self.load(ids)
+            except Exception as e:
+                self.logger.error(f"❌ Не удалось прочитать сообщения для рассылки: {e}")
+                continue
+
+            for seq, data in sorted(rows, key=lambda row: row[0] or 0):
+                # У импортированной истории feed_seq нет: клиентам она не рассылалась
+                if seq is None:
+                    continue
+                # feed_seq не больше разосланного — это изменение (например, готово превью)
+                if seq > self.max_seq:
+                    self.max_seq = seq
+                    self._append(seq, message_frame(seq, data))
+                else:
+                    self._append(None, update_frame(data))
+            self._wake()
+
+    def _append(self, event_id, frame: bytes):
+        self._seq += 1
+        self._frames.append((self._seq, event_id, frame))
+        self.published += 1
+
+    def _wake(self):
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            # Подписчики без новых кадров отправят пинг
+            self._wake()
+
+    @property
+    def position(self) -> int:
+        return self._seq
+
+    async def subscribe(self, seq: int, skip_until: int = 0):
+        """
+        Кадры после seq. Сообщения с feed_seq <= skip_until клиент уже получил из БД.
+        """
+        self.clients += 1
+        try:
+            while not self._closing:
+                if self._seq == seq:
+                    await self._published.wait()
+                    if self._closing:
+                        break
+                    if self._seq == seq:
+                        yield PING_FRAME
+                        continue
+
+                first = self._frames[0][0]
+                if seq + 1 < first:
+                    # Клиент отстал больше, чем на буфер: пусть догонит через since
+                    self.resyncs += 1
+                    yield RESYNC_FRAME
+                    seq = first - 1
+
+                start = seq + 1 - first
+                frames = [self._frames[i] for i in range(start, len(self._frames))]
+                seq = frames[-1][0]
+                chunk = b"".join(
+                    frame for _, event_id, frame in frames
+                    if event_id is None or event_id > skip_until
+                )
+                if chunk:
+                    yield chunk
+        finally:
+            self.clients -= 1
+
+    def stats(self) -> dict:
+        return {
+            "clients": self.clients,
+            "published": self.published,
+            "buffered": len(self._frames),
+            "resyncs": self.resyncs,
+            "max_seq": self.max_seq,
+        }
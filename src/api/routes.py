@@ -1,21 +1,57 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
-import asyncpg
 from typing import List, Optional, Union
-from pydantic import BaseModel, validator
-import config
+from pydantic import BaseModel
 from datetime import datetime
-import json
+import base64
+import hashlib
+import orjson
+import logging
 import ssl
+import time
 from config import (
     MEDIA_ROOT,
     WEBHOOK_HOST,
     DB_CONFIG,
+    MESSAGES_PAGE_SIZE,
+    MESSAGES_MAX_PAGE_SIZE,
+    EXPORT_BATCH_SIZE,
+    MESSAGES_CACHE_SIZE,
+    MESSAGES_CACHE_TTL,
+    SEARCH_MAX_OFFSET,
+    SSE_MAX_CLIENTS,
+    SSE_PING_INTERVAL,
+    SSE_BUFFER_SIZE,
+    SSE_BATCH_DELAY,
+    SSE_REPLAY_LIMIT,
+    METRICS_ENABLED,
+    METRICS_PATH,
+    MEDIA_SERVING,
+    MEDIA_ACCEL_PREFIX,
+    MEDIA_CHUNK_SIZE,
     SSL_CERTFILE, 
     SSL_KEYFILE 
 )
+from database.models import (
+    fetch_messages_page,
+    fetch_messages_since,
+    fetch_messages_by_ids,
+    get_max_feed_seq,
+    iter_messages,
+    search_messages,
+    get_media_file_hash_by_path,
+    MESSAGES_CHANNEL
+)
+from database.pool import pool_manager
+from api.cache import ResponseCache
+from api.events import MessageBroadcaster, RESYNC_FRAME, message_frame
+from api.static import MediaFileServer
+import metrics
+
+logger = logging.getLogger(__name__)
 app = FastAPI()
 
 app.add_middleware(
@@ -24,21 +60,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Prev-Cursor", "X-Next-Offset", "X-Next-Since"],
+)
+
+# Общий с ботом пул; подменяется целиком только в бенчмарках
+pool = pool_manager
+messages_cache = ResponseCache(MESSAGES_CACHE_SIZE, MESSAGES_CACHE_TTL)
+# Источники внутренней статистики: имя -> функция, возвращающая dict
+stats_providers = {"messages_cache": messages_cache.stats}
+
+async def load_broadcast_messages(ids):
+    rows = await fetch_messages_by_ids(pool, ids)
+    return [(row["feed_seq"], orjson.dumps(row_to_message(row))) for row in rows]
+
+broadcaster = MessageBroadcaster(
+    load_broadcast_messages,
+    buffer_size=SSE_BUFFER_SIZE,
+    batch_delay=SSE_BATCH_DELAY,
+    ping_interval=SSE_PING_INTERVAL
 )
+stats_providers["sse"] = broadcaster.stats
+
+async def lookup_media_hash(path):
+    return await get_media_file_hash_by_path(pool, path)
+
+media_server = MediaFileServer(
+    MEDIA_ROOT,
+    lookup_media_hash,
+    chunk_size=MEDIA_CHUNK_SIZE,
+    accel_prefix=MEDIA_ACCEL_PREFIX if MEDIA_SERVING == "accel" else None
+)
+
+if MEDIA_SERVING in ("app", "accel"):
+    stats_providers["media_serving"] = media_server.stats
+
+    @app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+    async def get_upload(request: Request, path: str):
+        return await media_server.response(request, path)
+elif MEDIA_SERVING == "static":
+    # Каталог создаёт ensure_media_dirs() в main(), уже после импорта модуля
+    app.mount("/uploads", StaticFiles(directory=str(MEDIA_ROOT), check_dir=False), name="uploads")
 
-app.mount("/uploads", StaticFiles(directory=str(MEDIA_ROOT)), name="uploads")
-pool = None
+def on_messages_changed(connection, pid, channel, payload):
+    messages_cache.clear()
 
 @app.on_event("startup")
 async def startup():
-    global pool
-    pool = await asyncpg.create_pool(**config.DB_CONFIG)
+    await pool_manager.start()
+    stats_providers["db_pool"] = pool_manager.stats
+    try:
+        # LISTEN сбрасывает кэш при записи из любого процесса
+        await pool_manager.add_listener(MESSAGES_CHANNEL, on_messages_changed)
+    except Exception as e:
+        # Без LISTEN кэш всё равно устаревает по TTL
+        logger.error(f"❌ Не удалось подписаться на {MESSAGES_CHANNEL}: {e}")
+    await start_broadcaster()
+
+async def start_broadcaster():
+    try:
+        await broadcaster.start(pool, MESSAGES_CHANNEL, await get_max_feed_seq(pool))
+    except Exception as e:
+        # Без рассылки клиенты догоняют через /apibot/messages/since
+        logger.error(f"❌ Не удалось запустить рассылку сообщений: {e}")
 
 @app.on_event("shutdown")
 async def shutdown():
-    global pool
-    if pool:
-        await pool.close()
+    # Пул закрывает владелец процесса (main), API только отписывается
+    await pool_manager.remove_listener(MESSAGES_CHANNEL, on_messages_changed)
+    await broadcaster.stop(pool, MESSAGES_CHANNEL)
 
 class Message(BaseModel):
     id: int
@@ -48,81 +137,273 @@ class Message(BaseModel):
     media_url: Optional[str] = None
     media_types: Optional[List[str]] = None
     media_urls: Optional[List[str]] = None
+    thumb_url: Optional[str] = None
+    thumb_urls: Optional[List[Optional[str]]] = None
     is_media_group: bool = False
     timestamp: str
+    # Позиция в ленте изменений: since для /apibot/messages/since и id события SSE
+    seq: Optional[int] = None
+
+    class Config:
+        from_attributes = True
 
-    @validator('media_type', pre=True, always=True)
-    def validate_media_type(cls, v):
-        return v if v is not None else None
+class SearchResult(Message):
+    rank: float
 
-    @validator('media_url', pre=True, always=True)
-    def validate_media_url(cls, v):
-        return v if v is not None else None
+def encode_cursor(timestamp, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    @validator('text', pre=True, always=True)
-    def validate_text(cls, v):
-        return v if v is not None else None
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail=f"Некорректный курсор: {cursor}")
 
-    class Config:
-        from_attributes = True
+def row_to_message(row) -> dict:
+    """
+    Запись asyncpg -> dict по схеме Message. Проверки pydantic здесь нет:
+    модель только описывает ответ в OpenAPI, а timestamp сериализует orjson.
+    """
+    media_types = row["media_types"] or []
+    media_urls = row["media_urls"] or []
+    thumb_urls = row["thumb_urls"] or []
+    timestamp = row["timestamp"]
+
+    if row["media_group_id"] is not None:
+        return {
+            "id": row["id"],
+            "message_id": row["message_id"],
+            "text": row["text"],
+            "media_type": None,
+            "media_url": None,
+            "media_types": media_types,
+            "media_urls": media_urls,
+            "thumb_url": None,
+            "thumb_urls": thumb_urls,
+            "is_media_group": True,
+            "timestamp": timestamp,
+            "seq": row["feed_seq"]
+        }
+
+    return {
+        "id": row["id"],
+        "message_id": row["message_id"],
+        "text": row["text"],
+        "media_type": media_types[0] if media_types else None,
+        "media_url": media_urls[0] if media_urls else None,
+        "media_types": None,
+        "media_urls": None,
+        "thumb_url": thumb_urls[0] if thumb_urls else None,
+        "thumb_urls": None,
+        "is_media_group": False,
+        "timestamp": timestamp,
+        "seq": row["feed_seq"]
+    }
 
 @app.get("/apibot/messages", response_model=List[Message])
-async def get_messages():
-    global pool
-    if not pool:
-        pool = await asyncpg.create_pool(**config.DB_CONFIG)
-        
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT id, message_id, text, media_type, media_url, media_group_id, timestamp
-            FROM messages
-            ORDER BY timestamp DESC
-        ''')
-        
-        messages = []
-        for row in rows:
-            try:
-                is_media_group = row["media_group_id"] is not None
-                
-                if is_media_group:
-                    try:
-                        media_types = json.loads(row["media_type"]) if row["media_type"] else []
-                        media_urls = json.loads(row["media_url"]) if row["media_url"] else []
-                    except (json.JSONDecodeError, TypeError):
-                        media_types = [row["media_type"]] if row["media_type"] else []
-                        media_urls = [row["media_url"]] if row["media_url"] else []
-                    
-                    message_data = {
-                        "id": row["id"],
-                        "message_id": row["message_id"],
-                        "text": row["text"],
-                        "media_type": None,
-                        "media_url": None,
-                        "media_types": media_types,
-                        "media_urls": media_urls,
-                        "is_media_group": True,
-                        "timestamp": row["timestamp"].isoformat() if isinstance(row["timestamp"], datetime) else str(row["timestamp"])
-                    }
-                else:
-                    message_data = {
-                        "id": row["id"],
-                        "message_id": row["message_id"],
-                        "text": row["text"],
-                        "media_type": row["media_type"],
-                        "media_url": row["media_url"],
-                        "media_types": None,
-                        "media_urls": None,
-                        "is_media_group": False,
-                        "timestamp": row["timestamp"].isoformat() if isinstance(row["timestamp"], datetime) else str(row["timestamp"])
-                    }
-                
-                messages.append(message_data)
-                
-            except Exception as e:
-                print(f"Ошибка при обработке сообщения {row['id']}: {e}")
+async def get_messages(
+    request: Request,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    media_type: Optional[str] = None,
+    media_group: Optional[bool] = None,
+    media_group_id: Optional[str] = None,
+):
+    """
+    Лента сообщений от новых к старым.
+    X-Next-Cursor — курсор для before (старше), X-Prev-Cursor — для after (новее).
+    Ответы кэшируются; клиент с If-None-Match получает 304.
+    """
+    started = time.perf_counter()
+    key = (limit, before, after, media_type, media_group, media_group_id)
+
+    cached = messages_cache.get(key)
+    hit = cached is not None
+    if not hit:
+        generation = messages_cache.invalidations
+        cached = await build_messages_page(key)
+        messages_cache.set(key, cached, generation)
+
+    body, headers = cached
+    elapsed = time.perf_counter() - started
+    messages_cache.record(hit, elapsed)
+    metrics.observe(metrics.API_MESSAGES_SECONDS, elapsed, "hit" if hit else "miss")
+
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def build_messages_page(key):
+    limit, before, after, media_type, media_group, media_group_id = key
+    rows, has_more = await fetch_messages_page(
+        pool,
+        limit=limit,
+        before=decode_cursor(before) if before else None,
+        after=decode_cursor(after) if after else None,
+        media_type=media_type,
+        media_group=media_group,
+        media_group_id=media_group_id
+    )
+    metrics.observe(metrics.API_MESSAGES_ROWS, len(rows))
+
+    messages = []
+    for row in rows:
+        try:
+            messages.append(row_to_message(row))
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обработке сообщения {row['id']}: {e}")
+            continue
+
+    body = orjson.dumps(messages)
+    headers = {
+        "ETag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        "Cache-Control": "no-cache",
+    }
+    if rows:
+        # При движении по after более старые сообщения есть всегда
+        if has_more or (after and not before):
+            headers["X-Next-Cursor"] = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+        headers["X-Prev-Cursor"] = encode_cursor(rows[0]["timestamp"], rows[0]["id"])
+
+    return body, headers
+
+@app.get("/apibot/search", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+):
+    """
+    Поиск по тексту сообщений с ранжированием, синтаксис запроса как у websearch
+    ("точная фраза", -исключить, or). X-Next-Offset — смещение следующей страницы.
+    """
+    rows, has_more = await search_messages(pool, q, limit, offset)
+
+    results = []
+    for row in rows:
+        try:
+            result = row_to_message(row)
+            result["rank"] = row["rank"]
+            results.append(result)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обработке сообщения {row['id']}: {e}")
+
+    headers = {"X-Next-Offset": str(offset + limit)} if has_more else {}
+    return Response(content=orjson.dumps(results), media_type="application/json", headers=headers)
+
+@app.get("/apibot/messages/since", response_model=List[Message])
+async def get_messages_since(
+    since: int = Query(..., ge=0),
+    limit: int = Query(MESSAGES_MAX_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+):
+    """
+    Сообщения новее since (seq последнего известного) в порядке сохранения.
+    Если пропущено больше limit, X-Next-Since — since для следующего запроса.
+    Импортированная история (seq = null) в дельту не попадает.
+    """
+    rows, has_more = await fetch_messages_since(pool, since, limit)
+    messages = [row_to_message(row) for row in rows]
+    headers = {"X-Next-Since": str(rows[-1]["feed_seq"])} if has_more else {}
+    return Response(content=orjson.dumps(messages), media_type="application/json", headers=headers)
+
+async def stream_events(since: Optional[int]):
+    # Позицию в буфере берём до чтения из БД: что придёт во время чтения, не потеряется
+    position = broadcaster.position
+    replayed = 0
+    metrics.inc_gauge(metrics.API_SSE_CLIENTS, 1)
+    try:
+        # Подсказка браузеру: переподключаться через 3 с
+        yield b"retry: 3000\n\n"
+        if since is not None:
+            rows, has_more = await fetch_messages_since(pool, since, SSE_REPLAY_LIMIT)
+            for row in rows:
+                yield message_frame(row["feed_seq"], orjson.dumps(row_to_message(row)))
+            replayed = rows[-1]["feed_seq"] if rows else since
+            if has_more:
+                # Остальное клиент заберёт через /apibot/messages/since
+                yield RESYNC_FRAME
+        async for chunk in broadcaster.subscribe(position, skip_until=replayed):
+            yield chunk
+    finally:
+        metrics.inc_gauge(metrics.API_SSE_CLIENTS, -1)
+
+@app.get("/apibot/messages/stream")
+async def stream_messages(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """
+    Server-Sent Events: message — новое сообщение (id события = seq сообщения),
+    update — изменилось уже отправленное (например, появилось превью),
+    resync — клиент отстал, пропущенное нужно забрать через /apibot/messages/since.
+    При переподключении браузер сам присылает Last-Event-ID, и пропущенное досылается.
+    """
+    if broadcaster.clients >= SSE_MAX_CLIENTS:
+        raise HTTPException(status_code=503, detail="Слишком много подписчиков")
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    headers = {
+        "Cache-Control": "no-cache",
+        # nginx не должен копить поток в буфере
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(stream_events(since), media_type="text/event-stream", headers=headers)
+
+async def export_chunks(pool, export_format: str, batch_size: int):
+    first = True
+    if export_format == "json":
+        yield b"["
+
+    try:
+        async for rows in iter_messages(pool, batch_size):
+            lines = []
+            for row in rows:
+                try:
+                    lines.append(orjson.dumps(row_to_message(row)))
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при обработке сообщения {row['id']}: {e}")
+
+            if not lines:
                 continue
-            
-        return messages
+
+            if export_format == "json":
+                chunk = b",".join(lines)
+                yield chunk if first else b"," + chunk
+            else:
+                yield b"\n".join(lines) + b"\n"
+            first = False
+    except Exception as e:
+        # Статус уже отправлен — остаётся только оборвать поток
+        logger.exception(f"❌ Ошибка при экспорте сообщений: {e}")
+        raise
+
+    if export_format == "json":
+        yield b"]"
+
+@app.get("/apibot/messages/export")
+async def export_messages(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=10000),
+):
+    """
+    Выгрузка всей таблицы потоком: NDJSON (по строке на сообщение) или JSON-массив.
+    """
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(export_chunks(pool, format, batch_size), media_type=media_type)
+
+@app.get("/apibot/stats")
+async def get_stats():
+    return {name: provider() for name, provider in stats_providers.items()}
+
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.RENDER_CONTENT_TYPE)
+
+if METRICS_ENABLED:
+    app.add_api_route(METRICS_PATH, get_metrics, methods=["GET"], include_in_schema=False)
 
 def create_ssl_context():
     ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import mimetypes
+from collections import OrderedDict
+from pathlib import Path
+
+import aiofiles
+from fastapi import HTTPException, Request, Response
+
+# Имена файлов — sha256 содержимого, и существующий файл не заменяется, поэтому кэшируются навсегда
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def parse_range(header: str, size: int):
+    """
+    Один диапазон из заголовка Range -> (start, end) включительно.
+    None — заголовок не разобран или диапазонов несколько (отдаём файл целиком),
+    ValueError — диапазон за пределами файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    start, sep, end = spec.strip().partition("-")
+    if unit.strip() != "bytes" or not sep or not (start or end):
+        return None
+    if (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+
+    if not start:
+        # bytes=-N — последние N байт
+        length = int(end)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    Отдаёт кусок файла [offset, offset + count). Если сервер поддерживает
+    расширение ASGI zerocopysend, байты уходят через sendfile, иначе —
+    чтением чанками без загрузки файла в память.
+    """
+
+    def __init__(self, path: Path, offset: int, count: int, status_code: int, headers: dict,
+                 media_type: str, chunk_size: int):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.chunk_size = chunk_size
+        self.headers["content-length"] = str(count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+
+        remaining = self.count
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.offset)
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # Файл укоротился во время отдачи — закрываем ответ как есть
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class MediaFileServer:
+    """
+    Отдача файлов из MEDIA_ROOT: immutable Cache-Control, сильный ETag
+    из sha256 содержимого, Range для перемотки видео.
+    В режиме accel вместо байт отдаётся X-Accel-Redirect, и файл шлёт nginx.
+
+    lookup_hash(relative_path) -> sha256 или None — хеш из индекса media_files;
+    для файлов вне индекса (превью) хеш считается один раз и кэшируется.
+    """
+
+    def __init__(self, root: Path, lookup_hash, chunk_size: int, accel_prefix: str = None,
+                 cache_size: int = 10000):
+        self.root = root.resolve()
+        self.lookup_hash = lookup_hash
+        self.chunk_size = chunk_size
+        self.accel_prefix = accel_prefix
+        self.cache_size = cache_size
+        # (путь, mtime_ns, размер) -> ETag
+        self._etags = OrderedDict()
+
+        self.served = 0
+        self.partial = 0
+        self.not_modified = 0
+        self.hashed = 0
+
+    def resolve(self, path: str) -> Path:
+        target = (self.root / path).resolve()
+        if not target.is_relative_to(self.root) or not target.is_file():
+            raise HTTPException(status_code=404, detail="Not Found")
+        return target
+
+    async def etag(self, path: str, target: Path, stat) -> str:
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        etag = self._etags.get(key)
+        if etag is not None:
+            self._etags.move_to_end(key)
+            return etag
+
+        sha256 = await self.lookup_hash(f"uploads/{path}")
+        if not sha256:
+            sha256 = await asyncio.to_thread(self._hash_file, target)
+            self.hashed += 1
+        etag = f'"{sha256[:32]}"'
+
+        self._etags[key] = etag
+        if len(self._etags) > self.cache_size:
+            self._etags.popitem(last=False)
+        return etag
+
+    def _hash_file(self, target: Path) -> str:
+        digest = hashlib.sha256()
+        with open(target, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def response(self, request: Request, path: str) -> Response:
+        target = self.resolve(path)
+        stat = target.stat()
+        etag = await self.etag(path, target, stat)
+        media_type = mimetypes.guess_type(target.name)[0] or "application/octet-stream"
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+        }
+
+        if request.headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if self.accel_prefix:
+            # nginx сам обработает Range и отдаст файл через sendfile
+            headers["X-Accel-Redirect"] = f"{self.accel_prefix.rstrip('/')}/{path}"
+            self.served += 1
+            return Response(status_code=200, headers=headers, media_type=media_type)
+
+        size = stat.st_size
+        byte_range = None
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range", etag) == etag:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+
+        self.served += 1
+        if byte_range is None:
+            return FileRangeResponse(target, 0, size, 200, headers, media_type, self.chunk_size)
+
+        start, end = byte_range
+        self.partial += 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileRangeResponse(target, start, end - start + 1, 206, headers, media_type, self.chunk_size)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "accel" if self.accel_prefix else "app",
+            "served": self.served,
+            "partial": self.partial,
+            "not_modified": self.not_modified,
+            "hashed": self.hashed,
+            "etags_cached": len(self._etags),
+        }
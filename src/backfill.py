@@ -0,0 +1,41 @@
+"""
+Импорт истории канала из экспорта Telegram Desktop (JSON и папка с медиа).
+
+    python src/backfill.py /path/to/ChatExport_2024-01-01 --batch-size 5000 --workers 8
+
+Прерванный импорт продолжается повторным запуском с той же командой.
+"""
+import argparse
+import asyncio
+import logging
+
+from config import BACKFILL_BATCH_SIZE, BACKFILL_COPY_WORKERS, ensure_media_dirs
+from database.db import init_db
+from database.pool import pool_manager
+from services.backfill import Backfill
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%d.%m.%Y, %H:%M:%S"
+)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Импорт истории из экспорта Telegram Desktop")
+    parser.add_argument("export_dir", help="каталог экспорта с result.json")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=BACKFILL_COPY_WORKERS, help="потоков копирования файлов")
+    args = parser.parse_args()
+
+    await pool_manager.start()
+    try:
+        await init_db(pool_manager)
+        ensure_media_dirs()
+        await Backfill(pool_manager, args.export_dir, args.batch_size, args.workers).run()
+    finally:
+        await pool_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
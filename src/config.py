@@ -7,6 +7,8 @@ load_dotenv()
 API_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 CHANNEL_ID = int(os.getenv('TELEGRAM_CHANNEL_ID'))
 ADMIN_CHAT_ID = int(os.getenv('TELEGRAM_ADMIN_CHAT_ID'))
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка из bench/)
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER')
 
 DB_CONFIG = {
     "user": os.getenv('DB_USER'),
@@ -15,23 +17,123 @@ DB_CONFIG = {
     "host": os.getenv('DB_HOST'),
     "port": int(os.getenv('DB_PORT', 5432))
 }
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 5))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 20))
+DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', 10))
+# 0 отключает кэш подготовленных запросов (нужно для pgbouncer в режиме transaction)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+DB_HEALTH_INTERVAL = float(os.getenv('DB_HEALTH_INTERVAL', 2))
+DB_HEALTH_TIMEOUT = float(os.getenv('DB_HEALTH_TIMEOUT', 2))
+DB_RECONNECT_MAX_DELAY = float(os.getenv('DB_RECONNECT_MAX_DELAY', 5))
 
 MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', '/var/www/uploads'))
 IMAGE_DIR = Path(os.getenv('IMAGE_DIR', MEDIA_ROOT / 'img'))
 VIDEO_DIR = Path(os.getenv('VIDEO_DIR', MEDIA_ROOT / 'video'))
 AUDIO_DIR = Path(os.getenv('AUDIO_DIR', MEDIA_ROOT / 'audio'))
 DOCUMENT_DIR = Path(os.getenv('DOCUMENT_DIR', MEDIA_ROOT / 'documents'))
+THUMB_DIR = Path(os.getenv('THUMB_DIR', MEDIA_ROOT / 'thumbs'))
+
+MEDIA_CHUNK_SIZE = int(os.getenv('MEDIA_CHUNK_SIZE', 64 * 1024))
+MEDIA_MAX_FILE_SIZE = int(os.getenv('MEDIA_MAX_FILE_SIZE', 20 * 1024 * 1024))
+MEDIA_MAX_INFLIGHT_BYTES = int(os.getenv('MEDIA_MAX_INFLIGHT_BYTES', 100 * 1024 * 1024))
+MEDIA_DOWNLOAD_CONCURRENCY = int(os.getenv('MEDIA_DOWNLOAD_CONCURRENCY', 8))
+
+# app — файлы отдаёт API (Range, ETag), accel — X-Accel-Redirect для nginx,
+# static — прежний StaticFiles, none — /uploads обслуживается снаружи
+MEDIA_SERVING = os.getenv('MEDIA_SERVING', 'app')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/internal/uploads')
+
+THUMBNAILS_ENABLED = os.getenv('THUMBNAILS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+THUMB_SIZE = int(os.getenv('THUMB_SIZE', 480))
+# webp или jpeg
+THUMB_FORMAT = os.getenv('THUMB_FORMAT', 'webp')
+THUMB_QUALITY = int(os.getenv('THUMB_QUALITY', 80))
+THUMB_WORKERS = int(os.getenv('THUMB_WORKERS', os.cpu_count() or 1))
+THUMB_BATCH_SIZE = int(os.getenv('THUMB_BATCH_SIZE', 32))
+THUMB_POLL_INTERVAL = float(os.getenv('THUMB_POLL_INTERVAL', 10))
+# Через сколько секунд взятые в работу, но не готовые превью (упавший процесс) можно взять снова
+THUMB_CLAIM_TTL = float(os.getenv('THUMB_CLAIM_TTL', 600))
+
+MEDIA_GROUP_DELAY = float(os.getenv('MEDIA_GROUP_DELAY', 1.0))
+MEDIA_GROUP_PART_DELAY = float(os.getenv('MEDIA_GROUP_PART_DELAY', 0.3))
+MEDIA_GROUP_MAX_DELAY = float(os.getenv('MEDIA_GROUP_MAX_DELAY', 5.0))
+MEDIA_GROUP_MAX_AGE = float(os.getenv('MEDIA_GROUP_MAX_AGE', 60))
+# Через сколько секунд недокачанную часть альбома (упавший процесс) может скачать другой процесс
+MEDIA_GROUP_DOWNLOAD_TTL = float(os.getenv('MEDIA_GROUP_DOWNLOAD_TTL', MEDIA_GROUP_MAX_AGE))
+MEDIA_GROUP_MAX_PENDING = int(os.getenv('MEDIA_GROUP_MAX_PENDING', 1000))
 
 WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')
 WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook/telegram')
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
 WEBHOOK_INTERVAL = int(os.getenv('WEBHOOK_INTERVAL', 1800))
+WEBHOOK_LOCK_RETRY = int(os.getenv('WEBHOOK_LOCK_RETRY', 30))
+# true — при установке вебхука Telegram выбросит накопившиеся апдейты
+WEBHOOK_DROP_PENDING = os.getenv('WEBHOOK_DROP_PENDING', 'false').lower() in ('1', 'true', 'yes')
+# Независимые шаги запуска (БД, getMe, вебхук, каталоги) выполняются параллельно
+FAST_START = os.getenv('FAST_START', 'true').lower() in ('1', 'true', 'yes')
+
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', 200))
+DB_WRITE_BATCH_DELAY = float(os.getenv('DB_WRITE_BATCH_DELAY', 0.05))
+
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 8))
+UPDATE_QUEUE_PUT_TIMEOUT = float(os.getenv('UPDATE_QUEUE_PUT_TIMEOUT', 1))
+UPDATE_QUEUE_DRAIN_TIMEOUT = float(os.getenv('UPDATE_QUEUE_DRAIN_TIMEOUT', 30))
+# memory — очередь в процессе, postgres — общая таблица для нескольких процессов
+UPDATE_QUEUE_BACKEND = os.getenv('UPDATE_QUEUE_BACKEND', 'memory')
+UPDATE_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv('UPDATE_QUEUE_VISIBILITY_TIMEOUT', 300))
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.getenv('UPDATE_QUEUE_MAX_ATTEMPTS', 5))
+# Сколько последних update_id помнит вебхук, чтобы отбрасывать повторные доставки; 0 — не помнить
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', 10000))
+# Через сколько секунд незавершённую обработку поста (упавший воркер) можно начать заново
+MESSAGE_CLAIM_TTL = float(os.getenv('MESSAGE_CLAIM_TTL', UPDATE_QUEUE_VISIBILITY_TIMEOUT))
+
+# Импорт истории из экспорта Telegram Desktop (src/backfill.py)
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', 5000))
+BACKFILL_COPY_WORKERS = int(os.getenv('BACKFILL_COPY_WORKERS', 8))
+
+# all — бот и API в одном процессе; api/ingest — роли воркеров; cluster — запуск N воркеров
+APP_ROLE = os.getenv('APP_ROLE', 'all')
+API_WORKERS = int(os.getenv('API_WORKERS', 2))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))
 
 API_HOST = os.getenv('API_HOST', '127.0.0.1')
 API_PORT = int(os.getenv('API_PORT', 8000))
+# Сколько секунд при остановке ждать незавершённые ответы, прежде чем закрыть их силой
+API_SHUTDOWN_TIMEOUT = float(os.getenv('API_SHUTDOWN_TIMEOUT', 10))
+
+MESSAGES_PAGE_SIZE = int(os.getenv('MESSAGES_PAGE_SIZE', 50))
+MESSAGES_MAX_PAGE_SIZE = int(os.getenv('MESSAGES_MAX_PAGE_SIZE', 500))
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+MESSAGES_CACHE_SIZE = int(os.getenv('MESSAGES_CACHE_SIZE', 256))
+MESSAGES_CACHE_TTL = float(os.getenv('MESSAGES_CACHE_TTL', 30))
+SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', 5000))
+
+# Push новых сообщений (SSE)
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', 10000))
+SSE_PING_INTERVAL = float(os.getenv('SSE_PING_INTERVAL', 15))
+SSE_BUFFER_SIZE = int(os.getenv('SSE_BUFFER_SIZE', 1000))
+SSE_BATCH_DELAY = float(os.getenv('SSE_BATCH_DELAY', 0.05))
+SSE_REPLAY_LIMIT = int(os.getenv('SSE_REPLAY_LIMIT', 500))
+
+# Секции messages по месяцам и архивация старых
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 3600))
+# Сколько полных месяцев хранить в БД; 0 — хранить всё
+MESSAGES_RETENTION_MONTHS = int(os.getenv('MESSAGES_RETENTION_MONTHS', 0))
+# Архив: сообщения в NDJSON.gz и медиа в tar на секцию; каталог можно смонтировать с холодного хранилища
+ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', '/var/backups/ano_bot'))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
 
 SSL_KEYFILE = os.getenv('SSL_KEYFILE')
 SSL_CERTFILE = os.getenv('SSL_CERTFILE')
 
-for directory in [MEDIA_ROOT, IMAGE_DIR, VIDEO_DIR, AUDIO_DIR, DOCUMENT_DIR]:
-    directory.mkdir(exist_ok=True, parents=True)
+MEDIA_DIRS = [MEDIA_ROOT, IMAGE_DIR, VIDEO_DIR, AUDIO_DIR, DOCUMENT_DIR, THUMB_DIR]
+
+def ensure_media_dirs():
+    # Вызывается при запуске, а не при импорте: config импортируют и утилиты, которым каталоги не нужны
+    for directory in MEDIA_DIRS:
+        directory.mkdir(exist_ok=True, parents=True)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+from database.models import insert_messages_batch
+
+
+class WriteBehindBatcher:
+    """
+    Копит строки для messages и вставляет их одной командой:
+    по достижении max_batch строк или через max_delay секунд.
+    Каждый вызывающий получает future с id своей строки.
+    """
+
+    def __init__(self, pool, max_batch: int, max_delay: float):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.logger = logging.getLogger(__name__)
+
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    def submit(self, row: tuple, wait: bool = True) -> asyncio.Future:
+        """
+        row: (message_id, text, media_type, media_url, media_group_id)
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not wait:
+            # Ошибку уже залогирует flush, забирать её некому
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+
+            try:
+                ids = await insert_messages_batch(self.pool, [row for row, _ in batch])
+            except Exception as e:
+                self.failed_rows += len(batch)
+                self.logger.error(f"❌ Ошибка при пакетной вставке {len(batch)} сообщений: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            for (_, future), message_db_id in zip(batch, ids):
+                if not future.done():
+                    future.set_result(message_db_id)
+
+    async def stop(self):
+        """
+        Дописывает всё накопленное и останавливает фоновую задачу.
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        self.logger.info(f"🧹 Буфер записи сброшен, вставлено строк: {self.flushed_rows}")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "avg_batch": round(self.flushed_rows / self.flushes, 2) if self.flushes else 0.0,
+        }
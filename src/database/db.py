@@ -1,13 +1,402 @@
-async def init_db(pool):
+import json
+import logging
+from datetime import datetime
+from itertools import zip_longest
+
+from config import PARTITION_MONTHS_AHEAD
+
+logger = logging.getLogger(__name__)
+
+# messages секционирована по месяцам: messages_pYYYYMM, границы [1-е число, 1-е число следующего)
+PARTITION_PREFIX = "messages_p"
+
+MESSAGES_TABLE = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+    message_id BIGINT NOT NULL,
+    text TEXT,
+    media_type TEXT,
+    media_url TEXT,
+    media_group_id VARCHAR(100),
+    timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+    text_tsv tsvector,
+    -- Ключ секционирования обязан входить в первичный ключ
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+'''
+
+# Индексы секционированной таблицы создаются на родителе и сами появляются
+# в каждой новой секции. CONCURRENTLY для секционированных таблиц не поддерживается,
+# поэтому IF NOT EXISTS: строятся только при создании или переносе таблицы
+MESSAGES_INDEXES = [
+    # Основная лента: keyset-пагинация по (timestamp, id)
+    '''
+    CREATE INDEX IF NOT EXISTS messages_timestamp_id_idx
+    ON messages (timestamp DESC, id DESC)
+    ''',
+    # Фильтр "только медиагруппы"
+    '''
+    CREATE INDEX IF NOT EXISTS messages_media_group_timestamp_id_idx
+    ON messages (timestamp DESC, id DESC)
+    WHERE media_group_id IS NOT NULL
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS messages_media_group_id_idx
+    ON messages (media_group_id)
+    WHERE media_group_id IS NOT NULL
+    ''',
+    # Строки со старыми JSON-в-TEXT медиа, ещё не перенесённые в media_items
+    '''
+    CREATE INDEX IF NOT EXISTS messages_legacy_media_idx
+    ON messages (id)
+    WHERE media_type IS NOT NULL OR media_url IS NOT NULL
+    ''',
+    # Лента изменений: /apibot/messages/since и SSE по feed_seq
+    '''
+    CREATE INDEX IF NOT EXISTS messages_feed_seq_idx
+    ON messages (feed_seq)
+    WHERE feed_seq IS NOT NULL
+    ''',
+    # Полнотекстовый поиск
+    '''
+    CREATE INDEX IF NOT EXISTS messages_text_tsv_idx
+    ON messages USING GIN (text_tsv)
+    ''',
+    # Строки без text_tsv, ещё не проиндексированные для поиска
+    '''
+    CREATE INDEX IF NOT EXISTS messages_tsv_pending_idx
+    ON messages (id)
+    WHERE text_tsv IS NULL
+    ''',
+]
+
+MEDIA_INDEXES = [
+    '''
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS media_items_type_message_idx
+    ON media_items (media_type, message_db_id)
+    ''',
+    # Медиа, для которых ещё не сделаны превью
+    '''
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS media_items_thumb_pending_idx
+    ON media_items (message_db_id DESC)
+    WHERE thumb_url IS NULL AND media_url IS NOT NULL
+    ''',
+    # Архивация: используется ли файл сообщениями вне архивируемой секции
+    '''
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS media_items_media_url_idx
+    ON media_items (media_url)
+    ''',
+]
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return datetime(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+async def ensure_message_partitions(conn, start: datetime, end: datetime):
+    """
+    Создаёт месячные секции, покрывающие [start, end]. Возвращает имена новых.
+    """
+    created = []
+    month = month_start(start)
+    while month <= end:
+        name = partition_name(month)
+        exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name)
+        if not exists:
+            await conn.execute(f'''
+            CREATE TABLE {name} PARTITION OF messages
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')
+            ''')
+            created.append(name)
+        month = add_months(month, 1)
+    if created:
+        logger.info(f"📅 Созданы секции messages: {', '.join(created)}")
+    return created
+
+
+async def ensure_future_partitions(conn, months_ahead: int):
+    now = await conn.fetchval("SELECT NOW()::timestamp")
+    return await ensure_message_partitions(conn, now, add_months(month_start(now), months_ahead))
+
+
+async def list_message_partitions(conn):
+    """
+    Секции messages: (имя, начало месяца, подключена ли). Отключённые секции —
+    это прерванная архивация, их нужно доархивировать.
+    """
+    rows = await conn.fetch('''
+    SELECT c.relname AS name, i.inhrelid IS NOT NULL AS attached
+    FROM pg_class c
+    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'messages'::regclass
+    WHERE c.relkind = 'r' AND c.relname ~ ('^' || $1 || '[0-9]{6}$')
+      AND c.relnamespace = current_schema()::regnamespace
+    ORDER BY c.relname
+    ''', PARTITION_PREFIX)
+    return [
+        (row["name"], datetime.strptime(row["name"][len(PARTITION_PREFIX):], "%Y%m"), row["attached"])
+        for row in rows
+    ]
+
+
+async def detach_message_partition(conn, name: str):
+    # Обычный DETACH берёт короткую эксклюзивную блокировку messages — секция уже не пишется
+    await conn.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+
+
+async def partition_messages(conn, months_ahead: int):
+    """
+    Создаёт секционированную messages или переносит в неё старую обычную таблицу.
+    Перенос идёт одной транзакцией под эксклюзивной блокировкой: запись на это время
+    останавливается, чтение старой таблицы — тоже.
+    """
+    # relkind — тип "char", asyncpg вернул бы его как bytes
+    relkind = await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('messages')")
+    if relkind == "p":
+        await ensure_future_partitions(conn, months_ahead)
+        return
+
+    async with conn.transaction():
+        await conn.execute("CREATE SEQUENCE IF NOT EXISTS messages_id_seq AS integer")
+        if relkind is None:
+            await conn.execute(MESSAGES_TABLE)
+            await ensure_future_partitions(conn, months_ahead)
+            return
+
+        logger.info("🔄 Перенос messages в секционированную таблицу...")
+        await conn.execute('''
+        LOCK TABLE messages IN ACCESS EXCLUSIVE MODE;
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS text_tsv tsvector;
+        ALTER TABLE messages RENAME TO messages_unpartitioned;
+        ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey;
+        -- Внешний ключ на секционированную таблицу требовал бы timestamp в media_items;
+        -- строки media_items удаляет архивация
+        ALTER TABLE IF EXISTS media_items DROP CONSTRAINT IF EXISTS media_items_message_db_id_fkey;
+        ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+        ''')
+        await conn.execute(MESSAGES_TABLE)
+
+        bounds = await conn.fetchrow('''
+        SELECT min(timestamp) AS lo, greatest(max(timestamp), NOW()::timestamp) AS hi, NOW()::timestamp AS now
+        FROM messages_unpartitioned
+        ''')
+        await ensure_message_partitions(conn, bounds["lo"] or bounds["now"], bounds["hi"])
+        await ensure_future_partitions(conn, months_ahead)
+
+        result = await conn.execute('''
+        INSERT INTO messages (id, message_id, text, media_type, media_url, media_group_id, timestamp, text_tsv)
+        SELECT id, message_id, text, media_type, media_url, media_group_id,
+               coalesce(timestamp, NOW()::timestamp), text_tsv
+        FROM messages_unpartitioned
+        ''')
+        await conn.execute("DROP TABLE messages_unpartitioned")
+        logger.info(f"✅ messages секционирована, перенесено строк: {result.split()[-1]}")
+
+
+async def add_feed_seq(conn):
+    """
+    feed_seq — номер сообщения в порядке коммитов, курсор для since и SSE.
+    id выдаётся при вставке, и при нескольких писателях меньший id может
+    закоммититься позже большего. Существующим строкам достаётся их id,
+    поэтому выданные клиентам курсоры остаются верными.
+    """
+    exists = await conn.fetchval('''
+    SELECT 1 FROM pg_attribute
+    WHERE attrelid = 'messages'::regclass AND attname = 'feed_seq' AND NOT attisdropped
+    ''')
+    if exists:
+        return
+
+    async with conn.transaction():
+        await conn.execute('''
+        CREATE SEQUENCE IF NOT EXISTS messages_feed_seq AS bigint;
+        ALTER TABLE messages ADD COLUMN feed_seq BIGINT;
+        UPDATE messages SET feed_seq = id;
+        SELECT setval('messages_feed_seq', coalesce((SELECT max(id) FROM messages), 0) + 1, false);
+        ''')
+    logger.info("✅ Добавлена колонка messages.feed_seq")
+
+
+async def init_db(pool, months_ahead: int = PARTITION_MONTHS_AHEAD):
     async with pool.acquire() as conn:
+        await partition_messages(conn, months_ahead)
+        await add_feed_seq(conn)
+        for index_sql in MESSAGES_INDEXES:
+            await conn.execute(index_sql)
+
+        # Медиа сообщения: одна строка на файл, position — порядок в альбоме
         await conn.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id SERIAL PRIMARY KEY,
+        CREATE TABLE IF NOT EXISTS media_items (
+            message_db_id INTEGER NOT NULL,
+            position SMALLINT NOT NULL,
+            media_type TEXT NOT NULL,
+            media_url TEXT,
+            PRIMARY KEY (message_db_id, position)
+        );
+        -- Превью для ленты; пустая строка — превью сделать не удалось
+        ALTER TABLE media_items ADD COLUMN IF NOT EXISTS thumb_url TEXT;
+        -- Когда превью взял в работу один из процессов приёма
+        ALTER TABLE media_items ADD COLUMN IF NOT EXISTS thumb_claimed_at TIMESTAMP;
+        ''')
+
+        # Части альбомов до сборки в одно сообщение
+        await conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_group_parts (
+            media_group_id VARCHAR(100) NOT NULL,
             message_id BIGINT NOT NULL,
             text TEXT,
             media_type TEXT,
             media_url TEXT,
-            media_group_id VARCHAR(100),
-            timestamp TIMESTAMP DEFAULT NOW()
+            file_id TEXT,
+            file_unique_id TEXT,
+            received_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (media_group_id, message_id)
+        );
+        -- Когда загрузку файла части взял один из процессов приёма
+        ALTER TABLE media_group_parts ADD COLUMN IF NOT EXISTS download_claimed_at TIMESTAMP;
+        ''')
+
+        # Обработанные сообщения: повторная доставка того же поста не скачивает
+        # медиа и не создаёт вторую строку. Отдельная таблица, потому что уникальный
+        # ключ секционированной messages обязан включать timestamp.
+        # done = false — пост ещё обрабатывается; такую заявку после MESSAGE_CLAIM_TTL
+        # может перехватить повторная доставка
+        await conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_claims (
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            claimed_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (chat_id, message_id)
+        );
+        ALTER TABLE message_claims ADD COLUMN IF NOT EXISTS done BOOLEAN NOT NULL DEFAULT true;
+        ''')
+
+        # Импорт истории: последний импортированный message_id по каждому источнику
+        await conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            source TEXT PRIMARY KEY,
+            last_message_id BIGINT NOT NULL,
+            imported INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+        ''')
+
+        # Общая очередь апдейтов для режима с несколькими процессами
+        await conn.execute('''
+        CREATE TABLE IF NOT EXISTS update_queue (
+            id BIGSERIAL PRIMARY KEY,
+            payload JSONB NOT NULL,
+            enqueued_at TIMESTAMP DEFAULT NOW(),
+            locked_at TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0
+        );
+        ''')
+
+        await conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_files (
+            file_unique_id TEXT PRIMARY KEY,
+            sha256 CHAR(64) NOT NULL,
+            path TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
         );
+        CREATE INDEX IF NOT EXISTS media_files_sha256_idx ON media_files (sha256);
+        CREATE INDEX IF NOT EXISTS media_files_path_idx ON media_files (path);
         ''')
+
+        # CONCURRENTLY нельзя выполнять внутри транзакции,
+        # поэтому каждый индекс создаётся отдельной командой
+        for index_sql in MEDIA_INDEXES:
+            await conn.execute(index_sql)
+
+        await migrate_legacy_media(conn)
+        await backfill_text_search(conn)
+
+
+def _parse_legacy_media(row):
+    if row["media_group_id"] is not None:
+        try:
+            media_types = json.loads(row["media_type"]) if row["media_type"] else []
+            media_urls = json.loads(row["media_url"]) if row["media_url"] else []
+            return media_types, media_urls
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return [row["media_type"]], [row["media_url"]]
+
+
+async def migrate_legacy_media(conn, batch_size=1000):
+    """
+    Переносит media_type/media_url из messages в media_items.
+    Каждая пачка — отдельная короткая транзакция, таблица остаётся доступной.
+    """
+    migrated = 0
+    while True:
+        async with conn.transaction():
+            rows = await conn.fetch('''
+            SELECT id, media_type, media_url, media_group_id
+            FROM messages
+            WHERE media_type IS NOT NULL OR media_url IS NOT NULL
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+            ''', batch_size)
+            if not rows:
+                break
+
+            items = []
+            for row in rows:
+                media_types, media_urls = _parse_legacy_media(row)
+                for position, (media_type, media_url) in enumerate(zip_longest(media_types, media_urls)):
+                    if media_type:
+                        items.append((row["id"], position, media_type, media_url))
+
+            if items:
+                await conn.execute('''
+                INSERT INTO media_items (message_db_id, position, media_type, media_url)
+                SELECT * FROM unnest($1::int[], $2::smallint[], $3::text[], $4::text[])
+                ON CONFLICT DO NOTHING
+                ''', *zip(*items))
+
+            await conn.execute(
+                "UPDATE messages SET media_type = NULL, media_url = NULL WHERE id = ANY($1::int[])",
+                [row["id"] for row in rows]
+            )
+            migrated += len(rows)
+
+    if migrated:
+        logger.info(f"✅ Медиа перенесены в media_items: {migrated} сообщений")
+
+
+async def backfill_text_search(conn, batch_size=5000):
+    """
+    Заполняет text_tsv для строк, сохранённых до появления поиска.
+    """
+    updated = 0
+    while True:
+        result = await conn.execute('''
+        UPDATE messages
+        SET text_tsv = to_tsvector('russian', coalesce(text, ''))
+        WHERE id IN (
+            SELECT id FROM messages
+            WHERE text_tsv IS NULL
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        ''', batch_size)
+        count = int(result.split()[-1])
+        if not count:
+            break
+        updated += count
+
+    if updated:
+        logger.info(f"✅ Поисковый индекс заполнен для {updated} сообщений")
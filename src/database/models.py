@@ -1,50 +1,687 @@
-import json
 import logging
 from datetime import datetime, timezone
 
+from metrics import acquire
+
 
 logger = logging.getLogger(__name__)
 
-async def save_message_to_db(pool, message_id, text, media_type=None, media_url=None):
+# Канал NOTIFY о новых сообщениях, payload — id строки
+MESSAGES_CHANNEL = "messages_changed"
+
+# Advisory lock ленты: feed_seq выдаётся под ним, а снимается он коммитом,
+# поэтому номера видимых строк идут без дыр в порядке коммитов
+FEED_LOCK_KEY = 0x616e6f03
+
+# Необязательный буфер отложенной записи (database.batcher.WriteBehindBatcher)
+_write_batcher = None
+
+def set_write_batcher(batcher):
+    global _write_batcher
+    _write_batcher = batcher
+
+async def lock_feed(conn):
+    # Только внутри транзакции: держим до коммита, берём последним перед вставкой
+    await conn.execute("SELECT pg_advisory_xact_lock($1)", FEED_LOCK_KEY)
+
+# Сообщение и его медиа вставляются одной командой (после lock_feed в той же транзакции)
+INSERT_MESSAGE_QUERY = """
+WITH inserted AS (
+    INSERT INTO messages (message_id, text, media_group_id, timestamp, text_tsv, feed_seq)
+    VALUES ($1, $2, $5, NOW(), to_tsvector('russian', coalesce($2, '')), nextval('messages_feed_seq'))
+    RETURNING id
+), items AS (
+    INSERT INTO media_items (message_db_id, position, media_type, media_url)
+    SELECT inserted.id, t.position - 1, t.media_type, t.media_url
+    FROM inserted, unnest($3::text[], $4::text[]) WITH ORDINALITY AS t(media_type, media_url, position)
+)
+SELECT id, pg_notify('messages_changed', id::text) FROM inserted;
+"""
+
+async def insert_messages_batch(pool, rows):
+    """
+    Вставка пачки строк (message_id, text, media_types, media_urls, media_group_id)
+    в одной транзакции. Возвращает id в порядке rows.
+    """
+    messages_query = """
+    INSERT INTO messages (message_id, text, media_group_id, timestamp, text_tsv, feed_seq)
+    SELECT message_id, text, media_group_id, NOW(), to_tsvector('russian', coalesce(text, '')),
+           nextval('messages_feed_seq')
+    FROM unnest($1::bigint[], $2::text[], $3::varchar[])
+        WITH ORDINALITY AS t(message_id, text, media_group_id, ord)
+    ORDER BY ord
+    RETURNING id, pg_notify('messages_changed', id::text);
+    """
+    items_query = """
+    INSERT INTO media_items (message_db_id, position, media_type, media_url)
+    SELECT * FROM unnest($1::int[], $2::smallint[], $3::text[], $4::text[]);
+    """
+
+    async with acquire(pool, "insert_messages_batch") as conn:
+        async with conn.transaction():
+            await lock_feed(conn)
+            records = await conn.fetch(
+                messages_query,
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                [row[4] for row in rows]
+            )
+            ids = [record["id"] for record in records]
+
+            items = [
+                (message_db_id, position, media_type, media_url)
+                for message_db_id, row in zip(ids, rows)
+                for position, (media_type, media_url) in enumerate(zip(row[2], row[3]))
+            ]
+            if items:
+                await conn.execute(items_query, *zip(*items))
+    return ids
+
+async def claim_message(pool, chat_id, message_id, ttl):
+    """
+    Отмечает сообщение как принятое в обработку. False — его уже обработали
+    или обрабатывают (Telegram доставил апдейт повторно). Незавершённую
+    заявку старше ttl секунд оставил упавший воркер — она перехватывается.
+    """
     query = """
-    INSERT INTO messages (message_id, text, media_type, media_url, timestamp)
-    VALUES ($1, $2, $3, $4, NOW())
-    RETURNING id;
+    INSERT INTO message_claims (chat_id, message_id, done)
+    VALUES ($1, $2, false)
+    ON CONFLICT (chat_id, message_id) DO UPDATE
+    SET claimed_at = NOW()
+    WHERE NOT message_claims.done
+      AND message_claims.claimed_at < NOW() - make_interval(secs => $3::float)
+    RETURNING true
     """
-    
+    async with acquire(pool, "claim_message") as conn:
+        return bool(await conn.fetchval(query, chat_id, message_id, ttl))
+
+async def complete_message_claim(pool, chat_id, message_id):
+    # Пост сохранён (или его часть альбома в staging) — повторы больше не обрабатываются
+    async with acquire(pool, "complete_message_claim") as conn:
+        await conn.execute(
+            "UPDATE message_claims SET done = true WHERE chat_id = $1 AND message_id = $2",
+            chat_id, message_id
+        )
+
+async def release_message_claim(pool, chat_id, message_id):
+    # Обработка не удалась — повторная доставка должна пройти заново
+    async with acquire(pool, "release_message_claim") as conn:
+        await conn.execute(
+            "DELETE FROM message_claims WHERE chat_id = $1 AND message_id = $2", chat_id, message_id
+        )
+
+async def save_message_to_db(pool, message_id, text, media_type=None, media_url=None, wait=True):
+    media_types = [media_type] if media_type else []
+    media_urls = [media_url] if media_type else []
+
+    if _write_batcher is not None:
+        future = _write_batcher.submit((message_id, text, media_types, media_urls, None), wait=wait)
+        if not wait:
+            return None
+        message_db_id = await future
+        logger.info(f"Сохранено сообщение {message_id} с ID {message_db_id}")
+        return message_db_id
+
     try:
-        async with pool.acquire() as conn:
-            message_db_id = await conn.fetchval(
-                query, message_id, text, media_type, media_url
-            )
+        async with acquire(pool, "save_message_to_db") as conn:
+            async with conn.transaction():
+                await lock_feed(conn)
+                message_db_id = await conn.fetchval(
+                    INSERT_MESSAGE_QUERY, message_id, text, media_types, media_urls, None
+                )
             logger.info(f"Сохранено сообщение {message_id} с ID {message_db_id}")
             return message_db_id
     except Exception as e:
         logger.error(f"Ошибка при сохранении сообщения {message_id}: {e}")
         raise
 
-async def save_media_group_to_db(pool, message_id, text, media_types, media_urls, media_group_id):
+async def save_media_group_to_db(pool, message_id, text, media_types, media_urls, media_group_id, wait=True):
+    media_types = list(media_types or [])
+    media_urls = list(media_urls or [])
+
+    if _write_batcher is not None:
+        future = _write_batcher.submit(
+            (message_id, text, media_types, media_urls, media_group_id), wait=wait
+        )
+        if not wait:
+            return None
+        message_db_id = await future
+        logger.info(f"Сохранена группа медиа {media_group_id} с ID {message_db_id}")
+        return message_db_id
+
     try:
-        media_types_json = json.dumps(media_types) if media_types else None
-        media_urls_json = json.dumps(media_urls) if media_urls else None
+        async with acquire(pool, "save_media_group_to_db") as conn:
+            async with conn.transaction():
+                await lock_feed(conn)
+                message_db_id = await conn.fetchval(
+                    INSERT_MESSAGE_QUERY, message_id, text, media_types, media_urls, media_group_id
+                )
+            logger.info(f"Сохранена группа медиа {media_group_id} с ID {message_db_id}")
+            return message_db_id
     except Exception as e:
-        logger.error(f"Ошибка при сериализации медиа данных: {e}")
-        media_types_json = None
-        media_urls_json = None
-    
+        logger.error(f"Ошибка при сохранении группы медиа {media_group_id}: {e}")
+        raise
+
+async def save_media_group_part(pool, media_group_id, message_id, text, media_type=None,
+                                media_url=None, file_id=None, file_unique_id=None):
+    """
+    Часть альбома во временной таблице: переживает рестарт до сборки группы.
+    Файл части качает сохранивший её процесс — загрузка сразу считается взятой.
+    """
     query = """
-    INSERT INTO messages (message_id, text, media_type, media_url, media_group_id, timestamp)
-    VALUES ($1, $2, $3, $4, $5, NOW())
-    RETURNING id;
+    INSERT INTO media_group_parts
+        (media_group_id, message_id, text, media_type, media_url, file_id, file_unique_id, download_claimed_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, CASE WHEN $6::text IS NOT NULL THEN NOW() END)
+    ON CONFLICT (media_group_id, message_id) DO UPDATE
+    SET media_url = coalesce(EXCLUDED.media_url, media_group_parts.media_url),
+        download_claimed_at = EXCLUDED.download_claimed_at,
+        received_at = NOW();
     """
-    
+
     try:
-        async with pool.acquire() as conn:
-            message_db_id = await conn.fetchval(
-                query, message_id, text, media_types_json, media_urls_json, media_group_id
+        async with acquire(pool, "save_media_group_part") as conn:
+            await conn.execute(
+                query, media_group_id, message_id, text, media_type, media_url, file_id, file_unique_id
             )
-            logger.info(f"Сохранена группа медиа {media_group_id} с ID {message_db_id}")
-            return message_db_id
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении части группы медиа {media_group_id}: {e}")
+        raise
+
+async def set_media_group_part_url(pool, media_group_id, message_id, media_url):
+    # received_at обновляется, чтобы альбом с идущими загрузками не сочли брошенным.
+    # Без media_url загрузка не удалась — file_id сбрасывается, часть больше не ждут
+    query = """
+    UPDATE media_group_parts
+    SET media_url = $3,
+        file_id = CASE WHEN $3::text IS NULL THEN NULL ELSE file_id END,
+        received_at = NOW()
+    WHERE media_group_id = $1 AND message_id = $2;
+    """
+    async with acquire(pool, "set_media_group_part_url") as conn:
+        await conn.execute(query, media_group_id, message_id, media_url)
+
+async def release_media_group_part_download(pool, media_group_id, message_id):
+    # Загрузку прервала остановка процесса — часть сразу может взять другой процесс
+    query = """
+    UPDATE media_group_parts SET download_claimed_at = NULL
+    WHERE media_group_id = $1 AND message_id = $2 AND media_url IS NULL
+    """
+    async with acquire(pool, "release_media_group_part_download") as conn:
+        await conn.execute(query, media_group_id, message_id)
+
+async def claim_media_group_parts_to_download(pool, ttl):
+    """
+    Берёт в работу части альбомов с нескачанным файлом, загрузку которых никто
+    не ведёт: отметку download_claimed_at старше ttl секунд оставил упавший
+    процесс. SKIP LOCKED не даёт двум процессам взять одну часть, а received_at
+    обновляется, чтобы альбом не собрали как брошенный, пока идёт загрузка.
+    """
+    query = """
+    UPDATE media_group_parts p
+    SET download_claimed_at = NOW(),
+        received_at = NOW()
+    FROM (
+        SELECT media_group_id, message_id
+        FROM media_group_parts
+        WHERE file_id IS NOT NULL AND media_url IS NULL
+          AND (download_claimed_at IS NULL OR download_claimed_at < NOW() - make_interval(secs => $1::float))
+        FOR UPDATE SKIP LOCKED
+    ) c
+    WHERE p.media_group_id = c.media_group_id AND p.message_id = c.message_id
+    RETURNING p.media_group_id, p.message_id, p.media_type, p.file_id, p.file_unique_id
+    """
+    async with acquire(pool, "claim_media_group_parts_to_download") as conn:
+        return await conn.fetch(query, ttl)
+
+async def get_pending_media_groups(pool, older_than=None):
+    """
+    Несобранные альбомы: (media_group_id, parts, first_received_at, last_received_at).
+    older_than — только группы без новых частей дольше стольких секунд.
+    """
+    query = """
+    SELECT media_group_id, count(*) AS parts,
+           min(received_at) AS first_received_at, max(received_at) AS last_received_at
+    FROM media_group_parts
+    GROUP BY media_group_id
+    HAVING $1::float IS NULL OR max(received_at) < NOW() - make_interval(secs => $1::float)
+    """
+    async with acquire(pool, "get_pending_media_groups") as conn:
+        return await conn.fetch(query, older_than)
+
+async def finalize_media_group(pool, media_group_id, force=False):
+    """
+    Забирает части альбома из staging и сохраняет одно сообщение в одной транзакции.
+    DELETE ... RETURNING гарантирует, что группу соберёт только один воркер.
+    Пока какая-то часть ещё качается (в том числе другим процессом), группа
+    не собирается — это сделает тот, кто докачает последнюю; force — собрать как есть.
+    """
+    try:
+        async with acquire(pool, "finalize_media_group") as conn:
+            async with conn.transaction():
+                parts = await conn.fetch("""
+                DELETE FROM media_group_parts
+                WHERE media_group_id = $1
+                  AND ($2 OR NOT EXISTS (
+                      SELECT 1 FROM media_group_parts
+                      WHERE media_group_id = $1 AND file_id IS NOT NULL AND media_url IS NULL
+                  ))
+                RETURNING message_id, text, media_type, media_url
+                """, media_group_id, force)
+                if not parts:
+                    return None
+
+                parts = sorted(parts, key=lambda part: part["message_id"])
+                media_types = [part["media_type"] for part in parts if part["media_url"]]
+                media_urls = [part["media_url"] for part in parts if part["media_url"]]
+                all_texts = [part["text"] for part in parts if part["text"]]
+                combined_text = ' '.join(all_texts) if all_texts else parts[0]["text"]
+
+                await lock_feed(conn)
+                message_db_id = await conn.fetchval(
+                    INSERT_MESSAGE_QUERY, parts[0]["message_id"], combined_text,
+                    media_types, media_urls, media_group_id
+                )
+        logger.info(f"Сохранена группа медиа {media_group_id} ({len(parts)} частей) с ID {message_db_id}")
+        return message_db_id
     except Exception as e:
         logger.error(f"Ошибка при сохранении группы медиа {media_group_id}: {e}")
         raise
+
+async def enqueue_update(pool, payload):
+    async with acquire(pool, "enqueue_update") as conn:
+        await conn.execute("""
+        WITH queued AS (
+            INSERT INTO update_queue (payload) VALUES ($1::jsonb) RETURNING id
+        )
+        SELECT pg_notify('updates_enqueued', id::text) FROM queued;
+        """, payload)
+
+async def claim_update(pool, visibility_timeout):
+    """
+    Берёт следующий апдейт из update_queue. Взятый, но не завершённый за
+    visibility_timeout секунд апдейт (воркер упал) снова становится доступен.
+    """
+    query = """
+    UPDATE update_queue
+    SET locked_at = NOW(), attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM update_queue
+        WHERE locked_at IS NULL OR locked_at < NOW() - make_interval(secs => $1::float)
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id, payload, attempts;
+    """
+    async with acquire(pool, "claim_update") as conn:
+        return await conn.fetchrow(query, visibility_timeout)
+
+async def complete_update(pool, queue_id):
+    async with acquire(pool, "complete_update") as conn:
+        await conn.execute("DELETE FROM update_queue WHERE id = $1", queue_id)
+
+async def count_queued_updates(pool):
+    async with acquire(pool, "count_queued_updates") as conn:
+        return await conn.fetchval("SELECT count(*) FROM update_queue")
+
+async def get_media_file(pool, file_unique_id):
+    async with acquire(pool, "get_media_file") as conn:
+        return await conn.fetchrow(
+            "SELECT file_unique_id, sha256, path, size FROM media_files WHERE file_unique_id = $1",
+            file_unique_id
+        )
+
+async def get_media_file_by_hash(pool, sha256):
+    async with acquire(pool, "get_media_file_by_hash") as conn:
+        return await conn.fetchrow(
+            "SELECT file_unique_id, sha256, path, size FROM media_files WHERE sha256 = $1 LIMIT 1",
+            sha256
+        )
+
+async def get_media_file_hash_by_path(pool, path):
+    async with acquire(pool, "get_media_file_hash_by_path") as conn:
+        return await conn.fetchval("SELECT sha256 FROM media_files WHERE path = $1 LIMIT 1", path)
+
+async def save_media_file(pool, file_unique_id, sha256, path, size):
+    query = """
+    INSERT INTO media_files (file_unique_id, sha256, path, size)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (file_unique_id) DO NOTHING;
+    """
+
+    try:
+        async with acquire(pool, "save_media_file") as conn:
+            await conn.execute(query, file_unique_id, sha256, path, size)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении файла {file_unique_id} в индекс: {e}")
+        raise
+
+async def claim_media_items_without_thumbs(pool, media_types, limit, ttl):
+    """
+    Берёт в работу медиа без превью, сначала новые — их лента покажет первыми.
+    SKIP LOCKED и отметка thumb_claimed_at не дают нескольким процессам делать
+    одно превью; отметку старше ttl секунд оставил упавший процесс.
+    """
+    query = """
+    UPDATE media_items i
+    SET thumb_claimed_at = NOW()
+    FROM (
+        SELECT message_db_id, position
+        FROM media_items
+        WHERE thumb_url IS NULL AND media_url IS NOT NULL AND media_type = ANY($1::text[])
+          AND (thumb_claimed_at IS NULL OR thumb_claimed_at < NOW() - make_interval(secs => $3::float))
+        ORDER BY message_db_id DESC
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    ) c
+    WHERE i.message_db_id = c.message_db_id AND i.position = c.position
+    RETURNING i.message_db_id, i.position, i.media_type, i.media_url
+    """
+    async with acquire(pool, "claim_media_items_without_thumbs") as conn:
+        return await conn.fetch(query, media_types, limit, ttl)
+
+async def set_media_item_thumbs(pool, items):
+    """
+    items — кортежи (message_db_id, position, thumb_url).
+    Сообщения с новыми превью попадают в NOTIFY, чтобы API сбросил кэш.
+    Импортированная история (feed_seq IS NULL) клиентам не рассылалась,
+    поэтому её превью NOTIFY не вызывают: страницы с ними обновятся по TTL кэша.
+    """
+    query = """
+    WITH updated AS (
+        UPDATE media_items i
+        SET thumb_url = t.thumb_url
+        FROM unnest($1::int[], $2::smallint[], $3::text[]) AS t(message_db_id, position, thumb_url)
+        WHERE i.message_db_id = t.message_db_id AND i.position = t.position
+        RETURNING i.message_db_id
+    )
+    SELECT pg_notify('messages_changed', m.id::text)
+    FROM messages m
+    WHERE m.id IN (SELECT message_db_id FROM updated) AND m.feed_seq IS NOT NULL;
+    """
+    async with acquire(pool, "set_media_item_thumbs") as conn:
+        await conn.execute(query, *zip(*items))
+
+# Сообщения вместе с медиа: массивы собираются в БД, без JSON на каждую строку
+MESSAGE_COLUMNS = """
+m.id, m.message_id, m.text, m.media_group_id, m.timestamp, m.feed_seq, i.media_types, i.media_urls, i.thumb_urls
+"""
+
+MEDIA_JOIN = """
+LEFT JOIN LATERAL (
+    SELECT array_agg(media_type ORDER BY position) AS media_types,
+           array_agg(media_url ORDER BY position) AS media_urls,
+           array_agg(nullif(thumb_url, '') ORDER BY position) AS thumb_urls
+    FROM media_items
+    WHERE message_db_id = m.id
+) i ON TRUE
+"""
+
+MESSAGES_SELECT = f"SELECT {MESSAGE_COLUMNS} FROM messages m {MEDIA_JOIN}"
+
+async def fetch_messages_page(pool, limit, before=None, after=None,
+                              media_type=None, media_group=None, media_group_id=None):
+    """
+    Страница сообщений с keyset-пагинацией по (timestamp, id).
+    before/after — кортежи (timestamp, id) из курсора.
+    Возвращает (rows, has_more); строки всегда от новых к старым.
+    """
+    conditions = []
+    args = []
+
+    def arg(value):
+        args.append(value)
+        return f"${len(args)}"
+
+    # Отдельное условие на timestamp нужно для отсечения секций:
+    # по сравнению кортежей планировщик секции не отбрасывает
+    if before:
+        conditions.append(f"m.timestamp <= {arg(before[0])}")
+        conditions.append(f"(m.timestamp, m.id) < (${len(args)}, {arg(before[1])})")
+    if after:
+        conditions.append(f"m.timestamp >= {arg(after[0])}")
+        conditions.append(f"(m.timestamp, m.id) > (${len(args)}, {arg(after[1])})")
+    if media_type:
+        conditions.append(
+            f"EXISTS (SELECT 1 FROM media_items f WHERE f.message_db_id = m.id "
+            f"AND f.media_type = {arg(media_type)})"
+        )
+    if media_group is True:
+        conditions.append("m.media_group_id IS NOT NULL")
+    elif media_group is False:
+        conditions.append("m.media_group_id IS NULL")
+    if media_group_id:
+        conditions.append(f"m.media_group_id = {arg(media_group_id)}")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # При движении к новым сообщениям читаем по возрастанию и разворачиваем
+    order = "ASC" if after and not before else "DESC"
+
+    query = f"""
+    {MESSAGES_SELECT}
+    {where}
+    ORDER BY m.timestamp {order}, m.id {order}
+    LIMIT {arg(limit + 1)}
+    """
+
+    async with acquire(pool, "fetch_messages_page") as conn:
+        rows = await conn.fetch(query, *args)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "ASC":
+        rows.reverse()
+    return rows, has_more
+
+async def fetch_messages_since(pool, since_seq, limit):
+    """
+    Сообщения с feed_seq больше since_seq в порядке коммитов — дельта для
+    переподключившихся клиентов. Возвращает (rows, has_more).
+    """
+    query = f"""
+    {MESSAGES_SELECT}
+    WHERE m.feed_seq > $1
+    ORDER BY m.feed_seq
+    LIMIT $2
+    """
+    async with acquire(pool, "fetch_messages_since") as conn:
+        rows = await conn.fetch(query, since_seq, limit + 1)
+    return rows[:limit], len(rows) > limit
+
+async def fetch_messages_by_ids(pool, ids):
+    query = f"""
+    {MESSAGES_SELECT}
+    WHERE m.id = ANY($1::int[])
+    ORDER BY m.id
+    """
+    async with acquire(pool, "fetch_messages_by_ids") as conn:
+        return await conn.fetch(query, ids)
+
+async def get_max_feed_seq(pool):
+    async with acquire(pool, "get_max_feed_seq") as conn:
+        return await conn.fetchval("SELECT coalesce(max(feed_seq), 0) FROM messages")
+
+async def search_messages(pool, query, limit, offset):
+    """
+    Полнотекстовый поиск по messages.text (русская морфология).
+    Возвращает (rows, has_more); строки по убыванию релевантности, в каждой есть rank.
+    """
+    sql = f"""
+    WITH hits AS (
+        SELECT id, ts_rank_cd(text_tsv, q) AS rank
+        FROM messages, websearch_to_tsquery('russian', $1) AS q
+        WHERE text_tsv @@ q
+        ORDER BY rank DESC, id DESC
+        LIMIT $2 OFFSET $3
+    )
+    SELECT {MESSAGE_COLUMNS}, h.rank
+    FROM hits h
+    JOIN messages m ON m.id = h.id
+    {MEDIA_JOIN}
+    ORDER BY h.rank DESC, m.id DESC
+    """
+
+    async with acquire(pool, "search_messages") as conn:
+        rows = await conn.fetch(sql, query, limit + 1, offset)
+
+    return rows[:limit], len(rows) > limit
+
+async def iter_messages(pool, batch_size, table="messages"):
+    """
+    Все сообщения пачками через серверный курсор — в памяти не больше одной пачки.
+    table — другая таблица той же структуры, например отключённая секция при архивации.
+    """
+    async with acquire(pool, "iter_messages") as conn:
+        # Серверный курсор живёт только внутри транзакции
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await conn.cursor(f"""
+            SELECT {MESSAGE_COLUMNS} FROM {table} m {MEDIA_JOIN}
+            ORDER BY m.timestamp DESC, m.id DESC
+            """)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+async def get_partition_media(pool, table):
+    """
+    Медиа сообщений из отключённой секции, которые не используются сообщениями
+    вне её (одинаковые файлы у разных сообщений хранятся один раз).
+    Возвращает (media_url, thumb_url).
+    """
+    query = f"""
+    SELECT i.media_url, max(nullif(i.thumb_url, '')) AS thumb_url
+    FROM media_items i
+    JOIN {table} m ON m.id = i.message_db_id
+    WHERE i.media_url IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM media_items o
+          WHERE o.media_url = i.media_url
+            AND NOT EXISTS (SELECT 1 FROM {table} a WHERE a.id = o.message_db_id)
+      )
+    GROUP BY i.media_url
+    """
+    async with acquire(pool, "get_partition_media") as conn:
+        return await conn.fetch(query)
+
+async def drop_archived_partition(pool, table, paths):
+    """
+    Удаляет из БД заархивированную секцию: её media_items, записи индекса
+    файлов для перенесённых в архив путей и саму таблицу.
+    """
+    async with acquire(pool, "drop_archived_partition") as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM media_files WHERE path = ANY($1::text[])", paths)
+            await conn.execute(f"DELETE FROM media_items WHERE message_db_id IN (SELECT id FROM {table})")
+            await conn.execute(f"DROP TABLE {table}")
+
+async def get_backfill_checkpoint(pool, source):
+    async with acquire(pool, "get_backfill_checkpoint") as conn:
+        return await conn.fetchval(
+            "SELECT last_message_id FROM backfill_checkpoints WHERE source = $1", source
+        ) or 0
+
+async def get_claimed_message_ids(pool, chat_id, message_ids):
+    async with acquire(pool, "get_claimed_message_ids") as conn:
+        rows = await conn.fetch(
+            "SELECT message_id FROM message_claims WHERE chat_id = $1 AND message_id = ANY($2::bigint[])",
+            chat_id, message_ids
+        )
+    return {row["message_id"] for row in rows}
+
+async def seed_message_claims(pool, chat_id):
+    """
+    Заявки для сообщений канала бота, сохранённых до появления message_claims:
+    без них импорт истории этого канала вставил бы такие посты второй раз.
+    В messages нет chat_id, поэтому вызывать только для канала бота.
+    """
+    async with acquire(pool, "seed_message_claims") as conn:
+        result = await conn.execute("""
+        INSERT INTO message_claims (chat_id, message_id)
+        SELECT DISTINCT $1::bigint, message_id FROM messages
+        ON CONFLICT DO NOTHING
+        """, chat_id)
+    return int(result.split()[-1])
+
+async def get_media_paths_by_hashes(pool, hashes):
+    async with acquire(pool, "get_media_paths_by_hashes") as conn:
+        rows = await conn.fetch(
+            "SELECT DISTINCT ON (sha256) sha256, path FROM media_files WHERE sha256 = ANY($1::text[])",
+            hashes
+        )
+    return {row["sha256"].strip(): row["path"] for row in rows}
+
+async def to_session_timestamps(pool, values):
+    """
+    Моменты времени (timestamptz) -> timestamp в TimeZone сессии, как у NOW()
+    живых строк, в том же порядке.
+    """
+    async with acquire(pool, "to_session_timestamps") as conn:
+        return await conn.fetchval("""
+        SELECT array_agg(value::timestamp ORDER BY n)
+        FROM unnest($1::timestamptz[]) WITH ORDINALITY AS t(value, n)
+        """, values)
+
+async def import_messages_batch(pool, source, chat_id, rows, files, last_message_id):
+    """
+    Импорт пачки истории одной транзакцией через COPY.
+    rows — кортежи (message_id, text, timestamp, media_type, media_url),
+    files — скопированные файлы (ключ, sha256, path, size) для media_files.
+    id сообщений берутся из последовательности заранее, поэтому media_items
+    тоже идут через COPY без RETURNING. Уже принятые сообщения (живым ботом
+    или прошлым запуском) пропускаются по message_claims; вместе с пачкой
+    сохраняется контрольная точка. История — не новые посты: NOTIFY не
+    отправляется, а feed_seq остаётся NULL, поэтому строки не попадают ни
+    в /apibot/messages/since, ни в досылку SSE по Last-Event-ID.
+    Возвращает число вставленных сообщений.
+    """
+    async with acquire(pool, "import_messages_batch") as conn:
+        async with conn.transaction():
+            claimed = await conn.fetch("""
+            INSERT INTO message_claims (chat_id, message_id)
+            SELECT $1, unnest($2::bigint[])
+            ON CONFLICT DO NOTHING
+            RETURNING message_id
+            """, chat_id, [row[0] for row in rows])
+            claimed = {record["message_id"] for record in claimed}
+            rows = [row for row in rows if row[0] in claimed]
+
+            if rows:
+                ids = await conn.fetch(
+                    "SELECT nextval('messages_id_seq') AS id FROM generate_series(1, $1)", len(rows)
+                )
+                ids = [record["id"] for record in ids]
+                # text_tsv заполнит backfill_text_search после импорта; feed_seq не выдаётся
+                await conn.copy_records_to_table(
+                    "messages",
+                    records=[(message_db_id, row[0], row[1], row[2]) for message_db_id, row in zip(ids, rows)],
+                    columns=["id", "message_id", "text", "timestamp"]
+                )
+                items = [
+                    (message_db_id, 0, row[3], row[4])
+                    for message_db_id, row in zip(ids, rows) if row[3]
+                ]
+                if items:
+                    await conn.copy_records_to_table(
+                        "media_items",
+                        records=items,
+                        columns=["message_db_id", "position", "media_type", "media_url"]
+                    )
+
+            if files:
+                await conn.executemany("""
+                INSERT INTO media_files (file_unique_id, sha256, path, size)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (file_unique_id) DO NOTHING
+                """, files)
+
+            await conn.execute("""
+            INSERT INTO backfill_checkpoints (source, last_message_id, imported)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (source) DO UPDATE
+            SET last_message_id = EXCLUDED.last_message_id,
+                imported = backfill_checkpoints.imported + EXCLUDED.imported,
+                updated_at = NOW()
+            """, source, last_message_id, len(rows))
+    return len(rows)
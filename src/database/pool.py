@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+import metrics
+from config import (
+    DB_CONFIG,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_ACQUIRE_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_HEALTH_INTERVAL,
+    DB_HEALTH_TIMEOUT,
+    DB_RECONNECT_MAX_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolManager:
+    """
+    Общий пул asyncpg для бота и API.
+    Снаружи выглядит как asyncpg.Pool (acquire, get_size, close), поэтому
+    его можно передавать везде, где раньше передавался пул.
+
+    Фоновая проверка делает SELECT 1 раз в DB_HEALTH_INTERVAL по отдельному
+    соединению вне пула: занятый долгими запросами пул — не сбой. Если она не прошла,
+    создаётся новый пул с экспоненциальной задержкой между попытками и
+    подменяет старый одним присваиванием — все потребители сразу получают
+    соединения из нового пула, а старый закрывается в фоне.
+    LISTEN-подписки живут на отдельном соединении и восстанавливаются вместе с пулом.
+    """
+
+    def __init__(self, connect_kwargs: dict = None, min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE, acquire_timeout: float = DB_ACQUIRE_TIMEOUT,
+                 statement_cache_size: int = DB_STATEMENT_CACHE_SIZE, name: str = "main", **pool_kwargs):
+        self.connect_kwargs = connect_kwargs or DB_CONFIG
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.statement_cache_size = statement_cache_size
+        self.name = name
+        self.pool_kwargs = pool_kwargs
+
+        self._pool = None
+        self._start_lock = asyncio.Lock()
+        self._health_task = None
+        self._listener_conn = None
+        self._probe_conn = None
+        # channel -> [callback]
+        self._listeners = {}
+
+        self.healthy = False
+        self.failed_checks = 0
+        self.reconnects = 0
+        self.last_recovery = None
+
+    async def _create_pool(self):
+        return await asyncpg.create_pool(
+            **self.connect_kwargs,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            # asyncpg готовит запрос один раз на соединение и дальше берёт его из кэша;
+            # 0 — для pgbouncer в режиме transaction
+            statement_cache_size=self.statement_cache_size,
+            **self.pool_kwargs
+        )
+
+    async def start(self):
+        """
+        Создаёт пул и запускает проверку здоровья. Повторный вызов ничего не делает.
+        """
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            self._pool = await self._create_pool()
+            self.healthy = True
+            metrics.track_pool(self, self.name)
+            metrics.set_gauge(metrics.DB_POOL_HEALTHY, 1)
+            self._health_task = asyncio.create_task(self._monitor(), name=f"db-health-{self.name}")
+            logger.info(f"✅ Пул БД создан ({self.min_size}–{self.max_size} соединений)")
+
+    def acquire(self, timeout: float = None):
+        return self._pool.acquire(timeout=timeout or self.acquire_timeout)
+
+    async def release(self, conn):
+        await self._pool.release(conn)
+
+    def get_size(self):
+        return self._pool.get_size()
+
+    def get_idle_size(self):
+        return self._pool.get_idle_size()
+
+    def get_max_size(self):
+        return self._pool.get_max_size()
+
+    async def add_listener(self, channel: str, callback):
+        self._listeners.setdefault(channel, []).append(callback)
+        if self._listener_conn is not None and not self._listener_conn.is_closed():
+            await self._listener_conn.add_listener(channel, callback)
+        else:
+            await self._connect_listener()
+
+    async def remove_listener(self, channel: str, callback):
+        callbacks = self._listeners.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if self._listener_conn is not None and not self._listener_conn.is_closed():
+            await self._listener_conn.remove_listener(channel, callback)
+
+    async def _connect_listener(self):
+        old = self._listener_conn
+        self._listener_conn = None
+        if old is not None and not old.is_closed():
+            old.terminate()
+
+        conn = await asyncpg.connect(**self.connect_kwargs)
+        for channel, callbacks in self._listeners.items():
+            for callback in callbacks:
+                await conn.add_listener(channel, callback)
+        self._listener_conn = conn
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(DB_HEALTH_INTERVAL)
+            if await self._check():
+                continue
+            self.healthy = False
+            self.failed_checks += 1
+            metrics.set_gauge(metrics.DB_POOL_HEALTHY, 0)
+            await self._reconnect()
+
+    async def _probe(self):
+        if self._probe_conn is None or self._probe_conn.is_closed():
+            self._probe_conn = await asyncpg.connect(**self.connect_kwargs, timeout=DB_HEALTH_TIMEOUT)
+        await self._probe_conn.fetchval("SELECT 1", timeout=DB_HEALTH_TIMEOUT)
+
+    def _drop_probe(self):
+        if self._probe_conn is not None:
+            self._probe_conn.terminate()
+            self._probe_conn = None
+
+    async def _check(self) -> bool:
+        try:
+            await self._probe()
+        except Exception:
+            # Оборванное проверочное соединение ещё не значит, что база недоступна
+            self._drop_probe()
+            try:
+                await self._probe()
+            except Exception as e:
+                self._drop_probe()
+                logger.warning(f"⚠️ Проблема с БД: {e!r}. Пересоздание пула...")
+                return False
+
+        if self._listeners and (self._listener_conn is None or self._listener_conn.is_closed()):
+            try:
+                await self._connect_listener()
+                logger.info("♻️ LISTEN-соединение восстановлено")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось восстановить LISTEN-соединение: {e!r}")
+        return True
+
+    async def _reconnect(self):
+        started = time.monotonic()
+        delay = 0.1
+        while True:
+            try:
+                new_pool = await asyncio.wait_for(self._create_pool(), DB_HEALTH_TIMEOUT * 2)
+                break
+            except Exception as e:
+                logger.error(f"❌ Не удалось пересоздать пул БД: {e!r}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DB_RECONNECT_MAX_DELAY)
+
+        old_pool, self._pool = self._pool, new_pool
+        self.healthy = True
+        self.reconnects += 1
+        self.last_recovery = time.monotonic() - started
+        metrics.set_gauge(metrics.DB_POOL_HEALTHY, 1)
+        metrics.inc(metrics.DB_POOL_RECONNECTS)
+        logger.info(f"♻️ Пул БД пересоздан за {self.last_recovery:.2f} с")
+
+        asyncio.create_task(self._retire(old_pool))
+        if self._listeners:
+            try:
+                await self._connect_listener()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось восстановить LISTEN-соединение: {e!r}")
+
+    async def _retire(self, pool):
+        # Соединения старого пула скорее всего мертвы — ждём недолго
+        try:
+            await asyncio.wait_for(pool.close(), DB_HEALTH_TIMEOUT)
+        except Exception:
+            pool.terminate()
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        self._drop_probe()
+        if self._listener_conn is not None:
+            self._listener_conn.terminate()
+            self._listener_conn = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "size": self._pool.get_size() if self._pool else 0,
+            "idle": self._pool.get_idle_size() if self._pool else 0,
+            "max": self.max_size,
+            "failed_checks": self.failed_checks,
+            "reconnects": self.reconnects,
+            "last_recovery_s": round(self.last_recovery, 3) if self.last_recovery is not None else None,
+        }
+
+
+# Общий экземпляр: его используют и main(), и API
+pool_manager = PoolManager()
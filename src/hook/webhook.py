@@ -1,32 +1,46 @@
 import asyncio
+import asyncpg
 import logging
 from aiogram import Bot
 from config import (
     WEBHOOK_URL, 
     WEBHOOK_PATH, 
     WEBHOOK_INTERVAL, 
-    ADMIN_CHAT_ID
+    WEBHOOK_LOCK_RETRY,
+    WEBHOOK_DROP_PENDING,
+    ADMIN_CHAT_ID,
+    DB_CONFIG
 )
 
 logger = logging.getLogger(__name__)
 
+# Ключ advisory lock: вебхуком управляет только воркер, который его держит
+WEBHOOK_LOCK_KEY = 7_140_001
+
 class WebhookManager:
     def __init__(self, bot: Bot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
 
-    async def setup_webhook(self):
+    async def setup_webhook(self, force=False):
         """
-        Настройка вебхука с Telegram
+        Настройка вебхука с Telegram. Если он уже указывает на WEBHOOK_URL,
+        setWebhook не вызывается: перезапуск не теряет и не задерживает апдейты.
         """
         try:
-            await self.bot.delete_webhook(drop_pending_updates=True)
-            self.logger.info("🧹 Старый вебхук удалён")
+            if not force:
+                info = await self.bot.get_webhook_info()
+                if info.url == WEBHOOK_URL:
+                    self.logger.info(
+                        f"✅ Вебхук уже установлен: {WEBHOOK_URL}, ожидают доставки: {info.pending_update_count}"
+                    )
+                    return True
 
+            # setWebhook заменяет старый вебхук, отдельный deleteWebhook не нужен
             await self.bot.set_webhook(
                 url=WEBHOOK_URL,
                 allowed_updates=None,  # Можно уточнить типы апдейтов
-                drop_pending_updates=True
+                drop_pending_updates=WEBHOOK_DROP_PENDING
             )
             self.logger.info(f"✅ Вебхук установлен: {WEBHOOK_URL}")
             return True
@@ -34,19 +48,45 @@ class WebhookManager:
             self.logger.error(f"❌ Ошибка при настройке вебхука: {e}", exc_info=True)
             return False
 
-    async def monitor_webhook(self, interval=None):
+    async def lead(self):
+        """
+        Настройка и мониторинг вебхука под advisory lock.
+        Из нескольких воркеров этим занимается ровно один; если он падает,
+        блокировка освобождается и её подхватывает другой.
+        """
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**DB_CONFIG)
+                if await conn.fetchval("SELECT pg_try_advisory_lock($1)", WEBHOOK_LOCK_KEY):
+                    self.logger.info("👑 Этот воркер управляет вебхуком")
+                    await self.setup_webhook()
+                    await self.monitor_webhook(lock_conn=conn)
+            except Exception as e:
+                self.logger.error(f"❌ Потеряна блокировка вебхука: {e}")
+            finally:
+                if conn:
+                    await conn.close()
+            await asyncio.sleep(WEBHOOK_LOCK_RETRY)
+
+    async def monitor_webhook(self, interval=None, lock_conn=None):
         """
         Периодическая проверка состояния вебхука
         """
         interval = interval or WEBHOOK_INTERVAL
         while True:
+            # Вебхук только что настроен — первая проверка через interval
+            await asyncio.sleep(interval)
+            if lock_conn is not None:
+                # Соединение с блокировкой оборвалось — значит, и блокировки больше нет
+                await lock_conn.execute("SELECT 1")
             try:
                 info = await self.bot.get_webhook_info()
                 current_url = info.url
                 
                 if current_url != WEBHOOK_URL:
                     self.logger.warning(f"⚠️ Вебхук изменён: {current_url} ≠ {WEBHOOK_URL}")
-                    success = await self.setup_webhook()
+                    success = await self.setup_webhook(force=True)
                     
                     if success:
                         self.logger.info("🔄 Вебхук восстановлен")
@@ -58,8 +98,6 @@ class WebhookManager:
             
             except Exception as e:
                 self.logger.error(f"❌ Ошибка при проверке вебхука: {e}", exc_info=True)
-            
-            await asyncio.sleep(interval)
 
     async def send_alert_to_admin(self, message_text):
         """
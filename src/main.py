@@ -1,24 +1,41 @@
 import asyncio
+import multiprocessing
+import signal
 import uvicorn
 import asyncpg
 import logging
 import sys
 import os
+import time
 
 from fastapi import Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import Message, Update
 from aiogram.enums import ChatType
 
 from config import (
-    API_TOKEN, MEDIA_ROOT, DB_CONFIG,
-    WEBHOOK_PATH, API_HOST, API_PORT, SSL_KEYFILE, SSL_CERTFILE
+    API_TOKEN, TELEGRAM_API_SERVER, MEDIA_ROOT, DB_CONFIG,
+    WEBHOOK_PATH, API_HOST, API_PORT, API_SHUTDOWN_TIMEOUT, SSL_KEYFILE, SSL_CERTFILE,
+    UPDATE_QUEUE_SIZE, UPDATE_WORKERS, UPDATE_QUEUE_PUT_TIMEOUT, UPDATE_QUEUE_DRAIN_TIMEOUT,
+    UPDATE_QUEUE_BACKEND, UPDATE_QUEUE_VISIBILITY_TIMEOUT, UPDATE_QUEUE_MAX_ATTEMPTS, UPDATE_DEDUP_WINDOW,
+    APP_ROLE, API_WORKERS, INGEST_WORKERS, THUMBNAILS_ENABLED, FAST_START, ensure_media_dirs,
+    DB_WRITE_BEHIND, DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_DELAY
 )
 from database.db import init_db
-from api.routes import app
+from database.pool import pool_manager
+from database.batcher import WriteBehindBatcher
+from database.models import set_write_batcher
+from api.routes import app, broadcaster, stats_providers
 from services.media import MediaProcessor
+from services.partitions import PartitionMaintainer
+from services.queue import UpdateQueue, PostgresUpdateQueue
+from services.dedup import RecentUpdates
 from hook.webhook import WebhookManager
+import metrics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,23 +44,104 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=API_TOKEN)
+def create_bot():
+    if TELEGRAM_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+        return Bot(token=API_TOKEN, session=session)
+    return Bot(token=API_TOKEN)
+
+bot = create_bot()
 dp = Dispatcher()
+update_queue = None
+recent_updates = RecentUpdates(UPDATE_DEDUP_WINDOW)
+stats_providers["dedup"] = recent_updates.stats
+
+def create_update_queue(pool, workers):
+    handler = lambda update: dp.feed_update(bot, update)
+    if UPDATE_QUEUE_BACKEND == "postgres":
+        return PostgresUpdateQueue(
+            pool, handler,
+            maxsize=UPDATE_QUEUE_SIZE,
+            workers=workers,
+            visibility_timeout=UPDATE_QUEUE_VISIBILITY_TIMEOUT,
+            max_attempts=UPDATE_QUEUE_MAX_ATTEMPTS
+        )
+    return UpdateQueue(handler, maxsize=UPDATE_QUEUE_SIZE, workers=workers)
 
 @app.post(WEBHOOK_PATH)
 async def webhook_handler(request: Request):
     logger.debug("📥 Получен POST-запрос на вебхук")
+    started = time.perf_counter()
+    status = "error"
     try:
         data = await request.json()
+        update_id = data.get("update_id")
+        if recent_updates.seen(update_id):
+            # Повторная доставка уже принятого апдейта: подтверждаем, ничего не делая
+            status = "duplicate"
+            metrics.inc(metrics.UPDATES_DUPLICATES, "webhook")
+            return {"status": "ok"}
         update = Update(**data)
-        await dp.feed_update(bot, update)
-        logger.debug("📨 Апдейт передан диспетчеру")
+        recent_updates.add(update_id)
+        if update_queue is None or not await update_queue.put(update, timeout=UPDATE_QUEUE_PUT_TIMEOUT):
+            recent_updates.discard(update_id)
+            # Telegram повторит доставку, когда очередь освободится
+            status = "busy"
+            return JSONResponse(status_code=503, content={"status": "busy"})
+        logger.debug("📨 Апдейт поставлен в очередь")
+        status = "ok"
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"❌ Ошибка при обработке вебхука: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
+    finally:
+        metrics.observe(metrics.WEBHOOK_SECONDS, time.perf_counter() - started, status)
+
+def register_handlers(media_processor):
+    dp.message.register(
+        media_processor.process_message_media, 
+        lambda message: message.chat.type != ChatType.PRIVATE
+    )
+    dp.channel_post.register(media_processor.process_message_media)
+
+class StartupTimer:
+    """
+    Длительность шагов запуска — пишется в лог и в /apibot/stats (startup).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = {}
+        self.ready = None
+
+    async def step(self, name, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[name] = round(time.perf_counter() - started, 3)
+
+    def finish(self):
+        self.ready = round(time.perf_counter() - self.started, 3)
+        steps = ", ".join(f"{name} {seconds:.2f}" for name, seconds in self.steps.items())
+        logger.info(f"⏱ Готов к приёму апдейтов за {self.ready:.2f} с ({steps})")
+
+    def stats(self) -> dict:
+        return {"fast_start": FAST_START, "ready_s": self.ready, "steps": self.steps}
+
+async def report_ready(server, timer):
+    while not server.started:
+        await asyncio.sleep(0.01)
+    timer.finish()
 
-async def start_api_server():
+async def close_streams_on_exit(server):
+    # uvicorn ждёт завершения открытых ответов, а поток SSE сам не кончается:
+    # без этого остановка висит, пока подключён хоть один клиент
+    while not server.should_exit:
+        await asyncio.sleep(0.1)
+    broadcaster.close()
+
+async def start_api_server(sockets=None, timer=None):
     try:
         if not os.path.exists(SSL_KEYFILE):
             logger.critical(f"❌ SSL ключ не найден: {SSL_KEYFILE}")
@@ -57,82 +155,191 @@ async def start_api_server():
             host=API_HOST,
             port=API_PORT,
             ssl_keyfile=SSL_KEYFILE,
-            ssl_certfile=SSL_CERTFILE
+            ssl_certfile=SSL_CERTFILE,
+            timeout_graceful_shutdown=API_SHUTDOWN_TIMEOUT
         )
         server = uvicorn.Server(config)
+        if timer:
+            asyncio.create_task(report_ready(server, timer))
+        asyncio.create_task(close_streams_on_exit(server))
         logger.info(f"🟢 API сервер запущен на https://{API_HOST}:{API_PORT}")    
-        await server.serve()
+        await server.serve(sockets=sockets)
     except Exception as e:
         logger.error(f"❌ Не удалось запустить API сервер: {e}")
         raise
 
-async def keep_db_connection_alive(pool):
-    while True:
-        try:
-            async with pool.acquire() as conn:
-                await conn.execute("SELECT 1")
-            logger.debug("🔁 Соединение с БД активно")
-        except Exception as e:
-            logger.warning(f"⚠️ Проблема с БД: {e}. Пересоздание пула...")
-            try:
-                pool = await asyncpg.create_pool(**DB_CONFIG)
-                logger.info("♻️ Пул БД пересоздан")
-            except Exception as e:
-                logger.error(f"❌ Не удалось пересоздать пул БД: {e}")
-        await asyncio.sleep(1800)
-
+async def wait_for_shutdown():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
 
+async def main(role=APP_ROLE, sockets=None, run_init_db=True):
+    """
+    role: all — бот и API в одном процессе, api — только HTTP (вебхук кладёт
+    апдейты в общую очередь), ingest — обработка апдейтов и управление вебхуком.
+    """
+    global update_queue
+    logger.info(f"🔄 Запуск бота и API сервера (роль: {role})")
 
-async def main():
-    logger.info("🔄 Запуск бота и API сервера")
+    if role in ("api", "ingest") and UPDATE_QUEUE_BACKEND != "postgres":
+        raise RuntimeError("Роли api/ingest требуют UPDATE_QUEUE_BACKEND=postgres")
+    ingest = role in ("all", "ingest")
 
-    pool = None
+    pool = pool_manager
+    write_batcher = None
+    media_processor = None
+    partitions = None
+    webhook_manager = WebhookManager(bot)
+    timer = StartupTimer()
+    stats_providers["startup"] = timer.stats
     try:
-        # Создаём пул к БД
-        pool = await asyncpg.create_pool(**DB_CONFIG, min_size=5, max_size=20)
-        await init_db(pool)
-        logger.info("✅ Подключение к БД установлено")
-
-        # Инициализируем сервисы
-        media_processor = MediaProcessor(bot, pool)
-        webhook_manager = WebhookManager(bot)
-
-        # Регистрируем хендлеры
-        dp.message.register(
-            media_processor.process_message_media, 
-            lambda message: message.chat.type != ChatType.PRIVATE
-        )
-        dp.channel_post.register(media_processor.process_message_media)
+        async def prepare_db():
+            # Общий пул к БД: им же пользуется API
+            await timer.step("db_pool", pool_manager.start())
+            stats_providers["db_pool"] = pool_manager.stats
+            if run_init_db:
+                await timer.step("init_db", init_db(pool))
+            logger.info("✅ Подключение к БД установлено")
 
-        # Получаем информацию о боте
-        me = await bot.get_me()
-        logger.info(f"🤖 Бот авторизован как @{me.username}")
-        await webhook_manager.send_alert_to_admin(f"🟢 Бот запущен как @{me.username}")
+        steps = {
+            "db": prepare_db(),
+            "media_dirs": asyncio.to_thread(ensure_media_dirs),
+        }
+        if ingest:
+            steps["get_me"] = bot.get_me()
+        if role == "all":
+            # Настраиваем вебхук; при совпадающем URL setWebhook не вызывается
+            steps["webhook"] = webhook_manager.setup_webhook()
 
-        # Настраиваем вебхук
-        if not await webhook_manager.setup_webhook():
+        if FAST_START:
+            # Шаги друг от друга не зависят: запуск занимает время самого долгого
+            results = await asyncio.gather(*(timer.step(name, step) for name, step in steps.items()))
+            results = dict(zip(steps, results))
+        else:
+            results = {name: await timer.step(name, step) for name, step in steps.items()}
+
+        if role == "all" and not results["webhook"]:
             logger.error("❌ Не удалось настроить вебхук")
             return
 
+        if ingest:
+            if DB_WRITE_BEHIND:
+                write_batcher = WriteBehindBatcher(pool, DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_DELAY)
+                write_batcher.start()
+                set_write_batcher(write_batcher)
+                stats_providers["write_behind"] = write_batcher.stats
+
+            # Инициализируем сервисы
+            media_processor = MediaProcessor(bot, pool)
+            stats_providers["media_store"] = media_processor.store.stats
+            stats_providers["media_groups"] = media_processor.media_groups.stats
+            stats_providers["thumbnails"] = media_processor.thumbnails.stats
+
+            # Регистрируем хендлеры
+            register_handlers(media_processor)
+
+            me = results["get_me"]
+            logger.info(f"🤖 Бот авторизован как @{me.username}")
+            # Уведомление не задерживает приём апдейтов
+            asyncio.create_task(webhook_manager.send_alert_to_admin(f"🟢 Бот запущен как @{me.username}"))
+
         # Фоновые задачи
-        asyncio.create_task(keep_db_connection_alive(pool))
-        asyncio.create_task(webhook_manager.monitor_webhook())
+        update_queue = create_update_queue(pool, UPDATE_WORKERS if ingest else 0)
+        stats_providers["updates"] = update_queue.stats
+        if media_processor:
+            await media_processor.media_groups.start()
+            if THUMBNAILS_ENABLED:
+                media_processor.thumbnails.start()
+            # Секции наперёд и архивация; в кластере работу берёт один процесс
+            partitions = PartitionMaintainer(pool)
+            stats_providers["partitions"] = partitions.stats
+            partitions.start()
+        update_queue.start()
+        if role == "all":
+            asyncio.create_task(webhook_manager.monitor_webhook())
+        elif role == "ingest":
+            asyncio.create_task(webhook_manager.lead())
 
-        # Запуск API сервера
-        logger.info("🟢 Запуск API сервера...")
-        await start_api_server()
+        if role == "ingest":
+            logger.info("🟢 Воркер приёма апдейтов запущен")
+            timer.finish()
+            await wait_for_shutdown()
+        else:
+            # Запуск API сервера
+            logger.info("🟢 Запуск API сервера...")
+            await start_api_server(sockets, timer)
 
     except Exception as e:
         logger.critical(f"🔥 Критическая ошибка: {e}", exc_info=True)
         await webhook_manager.send_alert_to_admin(f"🔥 Критическая ошибка: {e}")
     
     finally:
-        if pool:
-            await pool.close()
+        if update_queue:
+            await update_queue.stop(timeout=UPDATE_QUEUE_DRAIN_TIMEOUT)
+        if media_processor:
+            await media_processor.media_groups.stop()
+            await media_processor.thumbnails.stop()
+        if partitions:
+            await partitions.stop()
+        if write_batcher:
+            set_write_batcher(None)
+            await write_batcher.stop()
+        await pool_manager.close()
         await bot.session.close()
         logger.info("🧹 Все ресурсы освобождены")
 
 
+def run_worker(role, sockets):
+    asyncio.run(main(role, sockets=sockets, run_init_db=False))
+
+def run_cluster():
+    """
+    API_WORKERS процессов API на общем сокете и INGEST_WORKERS процессов приёма.
+    Общее состояние — очередь апдейтов, альбомы, дедупликация — живёт в Postgres.
+    """
+    if UPDATE_QUEUE_BACKEND != "postgres":
+        raise RuntimeError("Режим cluster требует UPDATE_QUEUE_BACKEND=postgres")
+
+    async def prepare():
+        pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=2)
+        try:
+            await init_db(pool)
+        finally:
+            await pool.close()
+
+    asyncio.run(prepare())
+
+    # Сокет открывается один раз и наследуется API-воркерами
+    sock = uvicorn.Config(app, host=API_HOST, port=API_PORT).bind_socket()
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=run_worker, args=("api", [sock]), name=f"api-{n}")
+        for n in range(API_WORKERS)
+    ] + [
+        context.Process(target=run_worker, args=("ingest", None), name=f"ingest-{n}")
+        for n in range(INGEST_WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"🟢 Кластер запущен: API воркеров {API_WORKERS}, воркеров приёма {INGEST_WORKERS}")
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for process in processes:
+        process.join()
+    sock.close()
+
+
 if __name__ == "__main__":
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    asyncio.run(main())
\ No newline at end of file
+    if APP_ROLE == "cluster":
+        run_cluster()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,161 @@
+"""
+Метрики Prometheus для горячих путей бота и API.
+
+METRICS_ENABLED=false выключает сбор: помощники ниже становятся
+пустыми обёртками, а /metrics не регистрируется.
+В режиме cluster задайте PROMETHEUS_MULTIPROC_DIR — тогда /metrics
+отдаёт сумму по всем процессам.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from config import METRICS_ENABLED
+
+# Запросы к БД и ожидание пула короче HTTP-запросов — нужны мелкие корзины
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ROWS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500)
+
+WEBHOOK_SECONDS = Histogram(
+    "bot_webhook_seconds", "Время ответа на запрос вебхука", ["status"]
+)
+MEDIA_GET_FILE_SECONDS = Histogram(
+    "bot_media_get_file_seconds", "Время вызова getFile", ["media_type"]
+)
+MEDIA_DOWNLOAD_SECONDS = Histogram(
+    "bot_media_download_seconds", "Время скачивания файла без записи на диск", ["media_type"]
+)
+MEDIA_DISK_WRITE_SECONDS = Histogram(
+    "bot_media_disk_write_seconds", "Время записи файла на диск", ["media_type"], buckets=DB_BUCKETS
+)
+UPDATES_DUPLICATES = Counter(
+    "bot_updates_duplicates", "Повторные доставки апдейтов: webhook — окно update_id, claim — БД", ["layer"]
+)
+MEDIA_GROUPS_PENDING = Gauge(
+    "bot_media_groups_pending", "Альбомы, ожидающие сборки", multiprocess_mode="livesum"
+)
+DB_ACQUIRE_SECONDS = Histogram(
+    "db_acquire_wait_seconds", "Ожидание соединения из пула", ["function"], buckets=DB_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Время работы с соединением", ["function"], buckets=DB_BUCKETS
+)
+DB_ACQUIRE_TIMEOUTS = Counter(
+    "db_acquire_timeouts", "Не дождались соединения из пула", ["function"]
+)
+DB_POOL_HEALTHY = Gauge(
+    "db_pool_healthy", "1 — последняя проверка БД прошла", multiprocess_mode="min"
+)
+DB_POOL_RECONNECTS = Counter(
+    "db_pool_reconnects", "Пересозданий пула после сбоя БД"
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Соединения пула: busy, idle, max", ["pool", "state"], multiprocess_mode="livesum"
+)
+API_MESSAGES_SECONDS = Histogram(
+    "api_messages_seconds", "Время ответа /apibot/messages", ["cache"], buckets=DB_BUCKETS
+)
+API_MESSAGES_ROWS = Histogram(
+    "api_messages_rows", "Строк на странице /apibot/messages", buckets=ROWS_BUCKETS
+)
+API_SSE_CLIENTS = Gauge(
+    "api_sse_clients", "Открытые соединения /apibot/messages/stream", multiprocess_mode="livesum"
+)
+
+# id(pool) -> имя для метки pool
+_pool_names = {}
+
+
+def track_pool(pool, name: str):
+    _pool_names[id(pool)] = name
+
+
+def _observe_pool(pool):
+    name = _pool_names.get(id(pool), "default")
+    size, idle = pool.get_size(), pool.get_idle_size()
+    DB_POOL_CONNECTIONS.labels(name, "busy").set(size - idle)
+    DB_POOL_CONNECTIONS.labels(name, "idle").set(idle)
+    DB_POOL_CONNECTIONS.labels(name, "max").set(pool.get_max_size())
+
+
+@asynccontextmanager
+async def acquire(pool, function: str):
+    """
+    pool.acquire() с замером ожидания соединения и времени работы с ним.
+    """
+    if not METRICS_ENABLED:
+        async with pool.acquire() as conn:
+            yield conn
+        return
+
+    started = time.perf_counter()
+    acquired = None
+    try:
+        async with pool.acquire() as conn:
+            acquired = time.perf_counter()
+            DB_ACQUIRE_SECONDS.labels(function).observe(acquired - started)
+            _observe_pool(pool)
+            try:
+                yield conn
+            finally:
+                DB_QUERY_SECONDS.labels(function).observe(time.perf_counter() - acquired)
+    except asyncio.TimeoutError:
+        if acquired is None:
+            DB_ACQUIRE_TIMEOUTS.labels(function).inc()
+        raise
+
+
+@contextmanager
+def timer(histogram, *labels):
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - started, *labels)
+
+
+def observe(histogram, value: float, *labels):
+    if METRICS_ENABLED:
+        (histogram.labels(*labels) if labels else histogram).observe(value)
+
+
+def inc(counter, *labels):
+    if METRICS_ENABLED:
+        (counter.labels(*labels) if labels else counter).inc()
+
+
+def set_gauge(gauge, value: float):
+    if METRICS_ENABLED:
+        gauge.set(value)
+
+
+def inc_gauge(gauge, amount: float = 1):
+    if METRICS_ENABLED:
+        gauge.inc(amount)
+
+
+# Тип ответа /metrics: формат, в котором render() отдаёт метрики
+RENDER_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def render() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
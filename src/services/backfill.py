@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import ijson
+
+from config import (
+    BACKFILL_BATCH_SIZE,
+    BACKFILL_COPY_WORKERS,
+    CHANNEL_ID,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_MAX_FILE_SIZE
+)
+from database.db import backfill_text_search, ensure_message_partitions
+from database.models import (
+    get_backfill_checkpoint,
+    get_claimed_message_ids,
+    get_media_paths_by_hashes,
+    import_messages_batch,
+    seed_message_claims,
+    to_session_timestamps
+)
+from metrics import acquire
+from services.download import place_file
+from services.media import media_directory_and_extension
+from services.store import content_filename
+
+# media_type экспорта → тип медиа бота; остальные файлы считаются документами
+EXPORT_MEDIA_TYPES = {
+    "video_file": "video",
+    "video_message": "video",
+    "animation": "animation",
+    "audio_file": "audio",
+    "voice_message": "voice",
+}
+# Стикеры бот не сохраняет и при живом приёме
+SKIPPED_MEDIA_TYPES = {"sticker"}
+# Так экспорт помечает файлы, не выбранные при выгрузке
+NOT_INCLUDED_PREFIX = "(File not included"
+# У файлов из экспорта нет file_unique_id — в media_files они попадают под этим ключом
+FILE_KEY_PREFIX = "backfill:"
+
+
+def export_text(value) -> str:
+    """
+    text в экспорте — строка или список из строк и сущностей {"type", "text"}.
+    """
+    if isinstance(value, str):
+        return value
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in value)
+
+
+def export_media(message):
+    """
+    (тип медиа, относительный путь в экспорте) или (None, None).
+    """
+    if message.get("photo"):
+        return "photo", message["photo"]
+    file = message.get("file")
+    if not file or message.get("media_type") in SKIPPED_MEDIA_TYPES:
+        return None, None
+    return EXPORT_MEDIA_TYPES.get(message.get("media_type"), "document"), file
+
+
+def export_timestamp(message) -> datetime:
+    # date_unixtime есть в новых экспортах — момент в UTC, в локальное время сервера
+    # его переводит БД; date — уже локальное время выгрузившего
+    if "date_unixtime" in message:
+        return datetime.fromtimestamp(int(message["date_unixtime"]), timezone.utc)
+    return datetime.fromisoformat(message["date"])
+
+
+def export_chat_id(export) -> int:
+    # У каналов и супергрупп в экспорте id без префикса -100
+    chat_id = int(export["id"])
+    if export.get("type", "").endswith(("channel", "supergroup")):
+        return -(10 ** 12 + chat_id)
+    return chat_id
+
+
+def read_export_chat_id(path: Path) -> int:
+    """
+    chat_id из заголовка result.json: id и type идут до messages, весь файл не читается.
+    """
+    header = {}
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f):
+            if prefix in ("id", "type"):
+                header[prefix] = value
+                if len(header) == 2:
+                    break
+    if "id" not in header:
+        raise ValueError(f"В {path} нет id чата")
+    return export_chat_id(header)
+
+
+class ExportReader:
+    """
+    Потоковое чтение messages из result.json: в памяти одна пачка, а не весь
+    экспорт. Telegram Desktop пишет сообщения по возрастанию id, на этом
+    держится контрольная точка.
+    """
+
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._items = ijson.items(self._file, "messages.item")
+
+    @property
+    def position(self) -> int:
+        # ijson читает файл блоками — для прогресса точности хватает
+        return self._file.tell()
+
+    def read_batch(self, after_id: int, size: int):
+        batch = []
+        for message in self._items:
+            if message.get("type") == "message" and message["id"] > after_id:
+                batch.append(message)
+                if len(batch) == size:
+                    break
+        return batch
+
+    def close(self):
+        self._file.close()
+
+
+def hash_file(path: Path):
+    """
+    (размер, sha256) файла экспорта; None, если файла нет.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(MEDIA_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        return None
+    return size, digest.hexdigest()
+
+
+def copy_file(source: Path, target: Path):
+    # Через временный файл: прерванный импорт не оставит обрезанный файл под рабочим именем,
+    # а уже лежащий под target файл не заменяется
+    tmp_target = target.with_name(f".{uuid.uuid4().hex}.part")
+    try:
+        shutil.copyfile(source, tmp_target)
+        place_file(tmp_target, target)
+    finally:
+        tmp_target.unlink(missing_ok=True)
+
+
+class Backfill:
+    """
+    Импорт истории канала из экспорта Telegram Desktop (result.json и файлы рядом).
+
+    result.json читается потоково, сообщения идут пачками по batch_size. Для пачки
+    файлы хешируются и копируются пулом потоков под именами из sha256, как у бота
+    (файлы живого канала не перезаписываются), затем строки messages и media_items
+    пишутся COPY одной транзакцией вместе с контрольной точкой, поэтому
+    повторный запуск продолжает с первой незавершённой пачки. Сообщения,
+    уже принятые живым ботом, пропускаются по message_claims; для постов,
+    сохранённых ботом до появления заявок, они создаются перед импортом. Одинаковые
+    файлы копируются один раз: sha256 сверяется с media_files, куда
+    попадают и файлы импорта, так что бот потом тоже не скачает их заново.
+    """
+
+    def __init__(self, pool, export_dir, batch_size=BACKFILL_BATCH_SIZE, workers=BACKFILL_COPY_WORKERS):
+        self.pool = pool
+        self.export_dir = Path(export_dir)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.logger = logging.getLogger(__name__)
+        self._executor = None
+        self._known = {}
+
+        self.total_bytes = 0
+        self.read_bytes = 0
+        self.done = 0
+        self.imported = 0
+        self.skipped = 0
+        self.files = 0
+        self.bytes = 0
+        self.deduplicated = 0
+        self.missing = 0
+        self.seeded = 0
+        self.started = None
+
+    async def run(self):
+        path = self.export_dir / "result.json"
+        chat_id = await asyncio.to_thread(read_export_chat_id, path)
+        source = str(chat_id)
+        checkpoint = await get_backfill_checkpoint(self.pool, source)
+        if checkpoint:
+            self.logger.info(f"⏩ Продолжаем импорт {source} после сообщения {checkpoint}")
+        if chat_id == CHANNEL_ID:
+            self.seeded = await seed_message_claims(self.pool, chat_id)
+            if self.seeded:
+                self.logger.info(f"🔖 Заявки для уже сохранённых сообщений канала: {self.seeded}")
+        else:
+            self.logger.warning(
+                f"⚠️ Экспорт не из канала бота ({CHANNEL_ID}): сохранённые ботом сообщения не сверяются"
+            )
+
+        reader = await asyncio.to_thread(ExportReader, path)
+        self.total_bytes = reader.size
+        self.started = time.monotonic()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="backfill")
+        try:
+            # Разбор JSON — работа для CPU, поэтому в потоке, пачка за пачкой
+            while batch := await asyncio.to_thread(reader.read_batch, checkpoint, self.batch_size):
+                await self._import_batch(source, chat_id, batch)
+                self.read_bytes = reader.position
+                self._report()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            await asyncio.to_thread(reader.close)
+
+        if not self.done:
+            self.logger.info(f"✅ Импорт {source}: новых сообщений нет")
+            return self.stats()
+
+        async with acquire(self.pool, "backfill_text_search") as conn:
+            await backfill_text_search(conn)
+        self.logger.info(f"✅ Импорт {source} завершён: {self.stats()}")
+        return self.stats()
+
+    async def _import_batch(self, source, chat_id, batch):
+        timestamps = [export_timestamp(m) for m in batch]
+        # Живые строки пишут NOW() в TimeZone сессии — импорт кладёт время в той же зоне
+        moments = [i for i, value in enumerate(timestamps) if value.tzinfo]
+        if moments:
+            local = await to_session_timestamps(self.pool, [timestamps[i] for i in moments])
+            for i, value in zip(moments, local):
+                timestamps[i] = value
+        timestamps = {m["id"]: value for m, value in zip(batch, timestamps)}
+
+        # Секции по всем датам пачки: возрастание id не гарантирует возрастание дат
+        async with acquire(self.pool, "backfill_partitions") as conn:
+            await ensure_message_partitions(conn, min(timestamps.values()), max(timestamps.values()))
+
+        claimed = await get_claimed_message_ids(self.pool, chat_id, [m["id"] for m in batch])
+        todo = [m for m in batch if m["id"] not in claimed]
+        self.skipped += len(batch) - len(todo)
+
+        media_urls, files = await self._copy_media(todo)
+        rows = []
+        for message in todo:
+            media_type, media_url = media_urls.get(message["id"], (None, None))
+            rows.append((
+                message["id"],
+                export_text(message.get("text", "")),
+                timestamps[message["id"]],
+                media_type,
+                media_url,
+            ))
+
+        inserted = await import_messages_batch(
+            self.pool, source, chat_id, rows, files, max(m["id"] for m in batch)
+        )
+        self.imported += inserted
+        self.skipped += len(rows) - inserted
+        self.done += len(batch)
+
+    async def _copy_media(self, messages):
+        """
+        Хеширует и копирует файлы пачки. Возвращает {message_id: (тип, media_url)}
+        и новые файлы для media_files.
+        """
+        loop = asyncio.get_running_loop()
+        sources = {}
+        for message in messages:
+            media_type, file = export_media(message)
+            if not media_type:
+                continue
+            if file.startswith(NOT_INCLUDED_PREFIX):
+                self.missing += 1
+                continue
+            sources[message["id"]] = (media_type, self.export_dir / file)
+
+        hashed = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, hash_file, path) for _, path in sources.values()
+        ))
+
+        planned = {}
+        for (message_id, (media_type, path)), result in zip(sources.items(), hashed):
+            if result is None:
+                self.missing += 1
+                continue
+            size, sha256 = result
+            if size > MEDIA_MAX_FILE_SIZE:
+                self.logger.warning(f"⚠️ Файл {path.name} больше лимита MEDIA_MAX_FILE_SIZE, пропущен")
+                self.missing += 1
+                continue
+            planned[message_id] = (media_type, path, size, sha256)
+
+        unknown = list({item[3] for item in planned.values()} - self._known.keys())
+        if unknown:
+            self._known.update(await get_media_paths_by_hashes(self.pool, unknown))
+
+        result = {}
+        files = []
+        copies = []
+        for message_id, (media_type, path, size, sha256) in planned.items():
+            known = self._known.get(sha256)
+            if known:
+                self.deduplicated += 1
+                result[message_id] = (media_type, known)
+                continue
+            directory, extension = media_directory_and_extension(media_type, path.name)
+            filename = content_filename(sha256, extension)
+            relative_path = f"uploads/{directory.name}/{filename}"
+            self._known[sha256] = relative_path
+            files.append((f"{FILE_KEY_PREFIX}{sha256}", sha256, relative_path, size))
+            result[message_id] = (media_type, relative_path)
+            copies.append(loop.run_in_executor(self._executor, copy_file, path, directory / filename))
+            self.files += 1
+            self.bytes += size
+
+        await asyncio.gather(*copies)
+        return result, files
+
+    def _report(self):
+        # Сколько сообщений осталось, без чтения файла целиком не узнать — ETA по прочитанным байтам
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.done / elapsed
+        progress = self.read_bytes / self.total_bytes if self.total_bytes else 1
+        eta = elapsed * (1 - progress) / progress if progress else 0
+        self.logger.info(
+            f"📥 Импорт: {self.done} сообщений ({progress:.0%} файла), {rate:.0f} сообщ/с, "
+            f"файлов {self.files} ({self.bytes / elapsed / 1024 / 1024:.1f} МБ/с), "
+            f"осталось ~{eta:.0f} с"
+        )
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "read": self.done,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "files": self.files,
+            "bytes": self.bytes,
+            "deduplicated": self.deduplicated,
+            "missing": self.missing,
+            "seeded_claims": self.seeded,
+            "seconds": round(elapsed, 1),
+            "messages_per_second": round(self.done / elapsed) if elapsed else 0,
+        }
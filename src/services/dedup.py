@@ -0,0 +1,41 @@
+from collections import deque
+
+
+class RecentUpdates:
+    """
+    Окно последних принятых update_id. Telegram повторяет доставку, если вебхук
+    ответил ошибкой или не уложился в таймаут; такие повторы отбрасываются
+    ещё до разбора апдейта. Окно живёт в процессе, поэтому повтор, попавший
+    в другой воркер или пришедший после рестарта, ловит message_claims в БД.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._seen = set()
+        self._order = deque()
+        self.duplicates = 0
+
+    def seen(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, update_id: int):
+        if not self.size:
+            return
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.size:
+            self._seen.discard(self._order.popleft())
+
+    def discard(self, update_id: int):
+        # Апдейт не поставлен в очередь — повтор от Telegram нужно принять
+        self._seen.discard(update_id)
+
+    def stats(self) -> dict:
+        return {
+            "window": self.size,
+            "remembered": len(self._seen),
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import aiofiles
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class ByteBudget:
+    """
+    Общий лимит байт, которые скачиваются одновременно.
+    Файл резервирует свой размер до начала загрузки и ждёт, если лимит исчерпан.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        # Файл крупнее лимита всё равно должен когда-нибудь пройти
+        size = min(size, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + size <= self.limit)
+            self.in_use += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= size
+                self._condition.notify_all()
+
+
+async def stream_to_temp(chunks, directory: Path, max_bytes: int, timings: dict = None):
+    """
+    Пишет поток чанков во временный файл в directory: имя итогового файла
+    зависит от содержимого и известно только после загрузки.
+    При ошибке или превышении max_bytes временный файл удаляется.
+    Возвращает (путь временного файла, размер, sha256 содержимого). В timings,
+    если передан, кладутся total и write — общее время и время записи на диск, в секундах.
+    """
+    tmp_path = directory / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    started = time.perf_counter()
+    write_time = 0.0
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"{directory.name}: больше {max_bytes} байт")
+                digest.update(chunk)
+                write_started = time.perf_counter()
+                await f.write(chunk)
+                write_time += time.perf_counter() - write_started
+        if timings is not None:
+            timings["total"] = time.perf_counter() - started
+            timings["write"] = write_time
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path, size, digest.hexdigest()
+
+
+def place_file(source: Path, target: Path):
+    """
+    Переносит готовый файл под имя target, никогда не заменяя существующий:
+    имя — sha256 содержимого, так что уже лежащий там файл тот же самый,
+    а отданные по этому адресу байты не меняются. source удаляется.
+    """
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    finally:
+        source.unlink(missing_ok=True)
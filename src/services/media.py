@@ -1,8 +1,6 @@
-import asyncio
-import aiofiles
-from collections import defaultdict
 from aiogram import Bot
 from aiogram.types import Message
+import asyncio
 import logging
 from pathlib import Path
 
@@ -10,59 +8,133 @@ from config import (
     IMAGE_DIR, 
     VIDEO_DIR, 
     AUDIO_DIR, 
-    DOCUMENT_DIR
+    DOCUMENT_DIR,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_MAX_FILE_SIZE,
+    MEDIA_MAX_INFLIGHT_BYTES,
+    MEDIA_DOWNLOAD_CONCURRENCY,
+    MESSAGE_CLAIM_TTL
 )
 
-from database.models import save_message_to_db, save_media_group_to_db
-
-media_groups: dict = defaultdict(list)
-media_group_timers: dict = {}
+from database.models import (
+    save_message_to_db,
+    claim_message,
+    complete_message_claim,
+    release_message_claim
+)
+from metrics import (
+    MEDIA_GET_FILE_SECONDS,
+    MEDIA_DOWNLOAD_SECONDS,
+    MEDIA_DISK_WRITE_SECONDS,
+    UPDATES_DUPLICATES,
+    timer,
+    observe,
+    inc
+)
+from services.download import ByteBudget, stream_to_temp
+from services.store import MediaStore
+from services.media_groups import MediaGroupAggregator
+from services.thumbnails import ThumbnailGenerator
+
+def media_directory_and_extension(media_type: str, file_path: str):
+    """
+    Каталог и расширение файла по типу медиа; то же раскладывание использует импорт истории.
+    """
+    if media_type == "photo":
+        return IMAGE_DIR, "jpg"
+    elif media_type == "video":
+        return VIDEO_DIR, "mp4"
+    elif media_type in ["audio", "voice"]:
+        return AUDIO_DIR, "mp3"
+    elif media_type == "document":
+        extension = file_path.split(".")[-1] if "." in file_path else "file"
+        return DOCUMENT_DIR, extension
+    elif media_type == "animation":
+        return VIDEO_DIR, "mp4"
+    else:
+        return None, None
 
 class MediaProcessor:
     def __init__(self, bot: Bot, pool):
         self.bot = bot
         self.pool = pool
         self.logger = logging.getLogger(__name__)
+        self.download_budget = ByteBudget(MEDIA_MAX_INFLIGHT_BYTES)
+        # Общий лимит одновременных обращений к Telegram за файлами
+        self.download_slots = asyncio.Semaphore(MEDIA_DOWNLOAD_CONCURRENCY)
+        self.store = MediaStore(pool)
+        self.thumbnails = ThumbnailGenerator(pool)
+        self.media_groups = MediaGroupAggregator(
+            pool, self.download_and_save_media, on_finalized=self.thumbnails.wake
+        )
+        self.duplicates = 0
 
-    async def download_and_save_media(self, file_id: str, media_type: str, message_id: int):
+    async def download_and_save_media(self, file_id: str, media_type: str, message_id: int, file_unique_id: str = None):
         try:
-            file_info = await self.bot.get_file(file_id)
-            file_path = file_info.file_path
-
-            # Определение директории и расширения
-            directory, extension = self._get_media_directory_and_extension(media_type, file_path)
-            
-            filename = f"{message_id}_{media_type}.{extension}"
-            filepath = directory / filename
-            relative_path = f"uploads/{directory.name}/{filename}"
-
-            # Скачивание файла
-            file_content = await self.bot.download_file(file_path)
-            async with aiofiles.open(filepath, 'wb') as f:
-                await f.write(file_content.read())
-
-            self.logger.info(f"📥 Сохранён файл: {relative_path}")
-            return relative_path
+            # Тот же файл уже публиковался — скачивать не нужно
+            stored_path = await self.store.lookup(file_unique_id)
+            if stored_path:
+                return stored_path
+
+            async with self.download_slots:
+                with timer(MEDIA_GET_FILE_SECONDS, media_type):
+                    file_info = await self.bot.get_file(file_id)
+                file_path = file_info.file_path
+
+                if file_info.file_size and file_info.file_size > MEDIA_MAX_FILE_SIZE:
+                    self.logger.warning(f"⚠️ Файл {file_id} слишком большой: {file_info.file_size} байт")
+                    return None
+
+                # Определение директории и расширения
+                directory, extension = self._get_media_directory_and_extension(media_type, file_path)
+
+                # Потоковое скачивание: чанки сразу пишутся на диск, имя файла — по хешу после загрузки
+                async with self.download_budget.reserve(file_info.file_size or MEDIA_MAX_FILE_SIZE):
+                    chunks = self.bot.session.stream_content(
+                        url=self.bot.session.api.file_url(self.bot.token, file_path),
+                        chunk_size=MEDIA_CHUNK_SIZE,
+                        raise_for_status=True
+                    )
+                    timings = {}
+                    tmp_path, size, sha256 = await stream_to_temp(chunks, directory, MEDIA_MAX_FILE_SIZE, timings)
+                observe(MEDIA_DOWNLOAD_SECONDS, timings["total"] - timings["write"], media_type)
+                observe(MEDIA_DISK_WRITE_SECONDS, timings["write"], media_type)
+
+            try:
+                stored_path = await self.store.register(
+                    file_unique_id or file_info.file_unique_id, sha256, tmp_path, directory, extension, size
+                )
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+            self.logger.info(f"📥 Сохранён файл: {stored_path}")
+            return stored_path
         except Exception as e:
             self.logger.error(f"❌ Ошибка при скачивании файла {file_id}: {e}")
             return None
 
     def _get_media_directory_and_extension(self, media_type: str, file_path: str):
-        if media_type == "photo":
-            return IMAGE_DIR, "jpg"
-        elif media_type == "video":
-            return VIDEO_DIR, "mp4"
-        elif media_type in ["audio", "voice"]:
-            return AUDIO_DIR, "mp3"
-        elif media_type == "document":
-            extension = file_path.split(".")[-1] if "." in file_path else "file"
-            return DOCUMENT_DIR, extension
-        elif media_type == "animation":
-            return VIDEO_DIR, "mp4"
-        else:
-            return None, None
+        return media_directory_and_extension(media_type, file_path)
 
     async def process_message_media(self, message: Message):
+        # Повторная доставка уже обработанного поста: ни скачивания, ни второй строки
+        if not await claim_message(self.pool, message.chat.id, message.message_id, MESSAGE_CLAIM_TTL):
+            self.duplicates += 1
+            inc(UPDATES_DUPLICATES, "claim")
+            self.logger.info(f"♻️ Сообщение {message.message_id} уже обработано, повтор пропущен")
+            return
+
+        try:
+            await self._process_message(message)
+        except BaseException:
+            # В том числе отмена по таймауту остановки: иначе повтор апдейта из очереди
+            # упрётся в заявку, и пост потеряется. Если процесс убит, заявку
+            # перехватит повтор после MESSAGE_CLAIM_TTL
+            await asyncio.shield(release_message_claim(self.pool, message.chat.id, message.message_id))
+            raise
+        await complete_message_claim(self.pool, message.chat.id, message.message_id)
+
+    async def _process_message(self, message: Message):
         content = message.text or message.caption or ""
         
         media_type = None
@@ -70,86 +142,46 @@ class MediaProcessor:
         media_url = None
 
         # Определение типа медиа
-        media_type, file_id = self._detect_media_type(message)
-
-        if media_type and file_id:
-            media_url = await self.download_and_save_media(file_id, media_type, message.message_id)
+        media_type, file_id, file_unique_id = self._detect_media_type(message)
 
-        # Обработка группового медиа
+        # Части альбома качаются параллельно в агрегаторе, хендлер их не ждёт
         if message.media_group_id:
-            await self._process_media_group(message, content, media_type, media_url)
-        else:
-            await save_message_to_db(
-                self.pool,
+            await self.media_groups.add_part(
+                message.media_group_id,
                 message_id=message.message_id,
                 text=content,
                 media_type=media_type,
-                media_url=media_url
+                file_id=file_id,
+                file_unique_id=file_unique_id
             )
+            return
+
+        if media_type and file_id:
+            media_url = await self.download_and_save_media(file_id, media_type, message.message_id, file_unique_id)
+
+        await save_message_to_db(
+            self.pool,
+            message_id=message.message_id,
+            text=content,
+            media_type=media_type,
+            media_url=media_url
+        )
+        if media_url:
+            self.thumbnails.wake()
 
     def _detect_media_type(self, message: Message):
         media_mappings = [
-            ("photo", lambda m: m.photo and m.photo[-1].file_id),
-            ("video", lambda m: m.video and m.video.file_id),
-            ("document", lambda m: m.document and m.document.file_id),
-            ("audio", lambda m: m.audio and m.audio.file_id),
-            ("voice", lambda m: m.voice and m.voice.file_id),
-            ("animation", lambda m: m.animation and m.animation.file_id)
+            ("photo", lambda m: m.photo and m.photo[-1]),
+            ("video", lambda m: m.video),
+            ("document", lambda m: m.document),
+            ("audio", lambda m: m.audio),
+            ("voice", lambda m: m.voice),
+            ("animation", lambda m: m.animation)
         ]
 
         for media_type, getter in media_mappings:
-            file_id = getter(message)
-            if file_id:
-                return media_type, file_id
+            media = getter(message)
+            if media:
+                return media_type, media.file_id, media.file_unique_id
         
-        return None, None
-
-    async def _process_media_group(self, message: Message, content: str, media_type: str, media_url: str):
-        media_groups[message.media_group_id].append({
-            'message_id': message.message_id,
-            'text': content,
-            'media_type': media_type,
-            'media_url': media_url
-        })
-
-        if message.media_group_id in media_group_timers:
-            media_group_timers[message.media_group_id].cancel()
-
-        async def delayed_process():
-            await asyncio.sleep(2)
-            await self._save_media_group(message.media_group_id)
-
-        media_group_timers[message.media_group_id] = asyncio.create_task(delayed_process())
-
-    async def _save_media_group(self, media_group_id: str):
-        if media_group_id not in media_groups or not media_groups[media_group_id]:
-            return
-
-        messages = media_groups[media_group_id]
-        main_message = messages[0]
-
-        media_urls = []
-        media_types = []
-        all_texts = []
-
-        for msg_data in messages:
-            if msg_data['media_url']:
-                media_urls.append(msg_data['media_url'])
-                media_types.append(msg_data['media_type'])
-            if msg_data['text']:
-                all_texts.append(msg_data['text'])
-
-        combined_text = ' '.join(all_texts) if all_texts else main_message['text']
-
-        await save_media_group_to_db(
-            self.pool,
-            message_id=main_message['message_id'],
-            text=combined_text,
-            media_types=media_types,
-            media_urls=media_urls,
-            media_group_id=media_group_id
-        )
-
-        del media_groups[media_group_id]
-        if media_group_id in media_group_timers:
-            del media_group_timers[media_group_id]
+        return None, None, None
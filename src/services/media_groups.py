@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import logging
+
+from config import (
+    MEDIA_GROUP_DELAY,
+    MEDIA_GROUP_PART_DELAY,
+    MEDIA_GROUP_MAX_DELAY,
+    MEDIA_GROUP_MAX_AGE,
+    MEDIA_GROUP_MAX_PENDING,
+    MEDIA_GROUP_DOWNLOAD_TTL
+)
+from database.models import (
+    save_media_group_part,
+    set_media_group_part_url,
+    get_pending_media_groups,
+    claim_media_group_parts_to_download,
+    release_media_group_part_download,
+    finalize_media_group
+)
+from metrics import MEDIA_GROUPS_PENDING, set_gauge
+
+# Больше частей в альбоме Telegram не присылает — ждать дальше нечего
+MEDIA_GROUP_MAX_PARTS = 10
+
+
+class MediaGroupAggregator:
+    """
+    Сборка альбомов из отдельных апдейтов.
+    Части сразу пишутся в media_group_parts, а сборкой управляет одна
+    задача-планировщик с кучей дедлайнов вместо таймера на каждую часть.
+    Файлы частей качаются параллельно, альбом сохраняется, когда
+    прошёл дедлайн и все загрузки завершились.
+
+    download(file_id, media_type, message_id, file_unique_id) -> media_url
+    on_finalized() вызывается после сохранения альбома.
+    """
+
+    def __init__(self, pool, download, on_finalized=None):
+        self.pool = pool
+        self.download = download
+        self.on_finalized = on_finalized
+        self.logger = logging.getLogger(__name__)
+
+        # media_group_id -> {"parts", "deadline", "expires_at", "downloads"}
+        self._groups = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._finalizing = set()
+
+        self.finalized = 0
+        self.evicted = 0
+        self.recovered = 0
+
+    def _debounce(self, parts: int) -> float:
+        # Большие альбомы приходят дольше — ждём пропорционально числу частей
+        return min(MEDIA_GROUP_DELAY + MEDIA_GROUP_PART_DELAY * parts, MEDIA_GROUP_MAX_DELAY)
+
+    def _schedule(self, media_group_id: str, parts: int = 1):
+        now = asyncio.get_running_loop().time()
+        group = self._groups.get(media_group_id)
+        if group is None:
+            group = {"parts": 0, "expires_at": now + MEDIA_GROUP_MAX_AGE, "downloads": []}
+            self._groups[media_group_id] = group
+        group["parts"] += parts
+
+        if group["parts"] >= MEDIA_GROUP_MAX_PARTS:
+            deadline = now
+        else:
+            deadline = min(now + self._debounce(group["parts"]), group["expires_at"])
+        group["deadline"] = deadline
+        heapq.heappush(self._heap, (deadline, media_group_id))
+
+        if len(self._groups) > MEDIA_GROUP_MAX_PENDING:
+            self._evict_oldest()
+        set_gauge(MEDIA_GROUPS_PENDING, len(self._groups))
+        self._wakeup.set()
+
+    def _evict_oldest(self):
+        # Части уже в БД, поэтому вытеснение — это досрочная сборка, а не потеря
+        media_group_id = min(self._groups, key=lambda gid: self._groups[gid]["expires_at"])
+        self.evicted += 1
+        self.logger.warning(f"⚠️ Слишком много незавершённых альбомов, досрочно собираем {media_group_id}")
+        self._groups[media_group_id]["deadline"] = 0.0
+        heapq.heappush(self._heap, (0.0, media_group_id))
+
+    async def add_part(self, media_group_id: str, message_id: int, text: str, media_type: str = None,
+                       file_id: str = None, file_unique_id: str = None):
+        """
+        Сохраняет часть и сразу возвращается: загрузка файла идёт в фоне.
+        """
+        await save_media_group_part(
+            self.pool, media_group_id, message_id, text, media_type, None, file_id, file_unique_id
+        )
+        self._schedule(media_group_id)
+        if media_type and file_id:
+            self._start_download(media_group_id, message_id, media_type, file_id, file_unique_id)
+
+    def _start_download(self, media_group_id, message_id, media_type, file_id, file_unique_id):
+        async def download_part():
+            try:
+                media_url = await self.download(file_id, media_type, message_id, file_unique_id)
+            except asyncio.CancelledError:
+                await asyncio.shield(release_media_group_part_download(self.pool, media_group_id, message_id))
+                raise
+            await set_media_group_part_url(self.pool, media_group_id, message_id, media_url)
+
+        task = asyncio.create_task(download_part())
+        group = self._groups.get(media_group_id)
+        if group is not None:
+            group["downloads"].append(task)
+        else:
+            self._finalizing.add(task)
+            task.add_done_callback(self._finalizing.discard)
+
+    async def start(self):
+        """
+        Подхватывает альбомы, оставшиеся в staging после рестарта, и запускает планировщик.
+        """
+        for row in await get_pending_media_groups(self.pool):
+            self._schedule(row["media_group_id"], parts=row["parts"])
+            self.recovered += 1
+        await self._recover_downloads()
+        if self.recovered:
+            self.logger.info(f"♻️ Восстановлено незавершённых альбомов: {self.recovered}")
+        self._task = asyncio.create_task(self._run(), name="media-groups")
+
+    async def _recover_downloads(self):
+        """
+        Заново запускает загрузки, прерванные рестартом или упавшим процессом.
+        Части, которые сейчас качает живой процесс, не берутся.
+        """
+        for part in await claim_media_group_parts_to_download(self.pool, MEDIA_GROUP_DOWNLOAD_TTL):
+            media_group_id = part["media_group_id"]
+            if media_group_id not in self._groups:
+                # Сборка альбома дождётся загрузки, а не соберёт его без этой части
+                self._schedule(media_group_id, parts=0)
+            self._start_download(
+                media_group_id, part["message_id"], part["media_type"],
+                part["file_id"], part["file_unique_id"]
+            )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time() + MEDIA_GROUP_MAX_AGE
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, media_group_id = heapq.heappop(self._heap)
+                group = self._groups.get(media_group_id)
+                # Устаревшая запись кучи: группа уже собрана или дедлайн сдвинут
+                if group is None or group["deadline"] != deadline:
+                    continue
+                del self._groups[media_group_id]
+                self._start_finalize(media_group_id, group["downloads"])
+                set_gauge(MEDIA_GROUPS_PENDING, len(self._groups))
+
+            if now >= next_sweep:
+                next_sweep = now + MEDIA_GROUP_MAX_AGE
+                self._start_finalize(None, [])
+
+            timeout = min(self._heap[0][0], next_sweep) - now if self._heap else next_sweep - now
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_finalize(self, media_group_id, downloads):
+        task = asyncio.create_task(
+            self._finalize(media_group_id, downloads) if media_group_id else self._sweep_abandoned()
+        )
+        self._finalizing.add(task)
+        task.add_done_callback(self._finalizing.discard)
+
+    async def _finalize(self, media_group_id: str, downloads=(), force=False):
+        # Альбом готов, когда скачалась самая медленная часть
+        for result in await asyncio.gather(*downloads, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.error(f"❌ Ошибка при загрузке части альбома {media_group_id}: {result}")
+        try:
+            if await finalize_media_group(self.pool, media_group_id, force=force):
+                self.finalized += 1
+                if self.on_finalized:
+                    self.on_finalized()
+        except Exception as e:
+            self.logger.error(f"❌ Не удалось собрать альбом {media_group_id}: {e}")
+
+    async def _sweep_abandoned(self):
+        """
+        Собирает альбомы и подхватывает загрузки, брошенные другими воркерами (например, упавшим процессом).
+        """
+        try:
+            await self._recover_downloads()
+            for row in await get_pending_media_groups(self.pool, older_than=MEDIA_GROUP_MAX_AGE):
+                if row["media_group_id"] not in self._groups:
+                    await self._finalize(row["media_group_id"], force=True)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка при поиске брошенных альбомов: {e}")
+
+    async def stop(self):
+        """
+        Останавливает планировщик. Несобранные альбомы остаются в staging до следующего запуска.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._finalizing, return_exceptions=True)
+        # Недокачанные части отпускаются и перезапустятся из staging при следующем старте
+        downloads = [task for group in self._groups.values() for task in group["downloads"]]
+        for task in downloads:
+            task.cancel()
+        await asyncio.gather(*downloads, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._groups),
+            "downloading": sum(
+                1 for group in self._groups.values() for task in group["downloads"] if not task.done()
+            ),
+            "finalized": self.finalized,
+            "evicted": self.evicted,
+            "recovered": self.recovered,
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import gzip
+import logging
+import os
+import tarfile
+import time
+
+import orjson
+
+from config import (
+    ARCHIVE_DIR,
+    EXPORT_BATCH_SIZE,
+    MESSAGES_RETENTION_MONTHS,
+    PARTITION_MAINTENANCE_INTERVAL,
+    PARTITION_MONTHS_AHEAD
+)
+from database.db import (
+    add_months,
+    detach_message_partition,
+    ensure_future_partitions,
+    list_message_partitions,
+    month_start
+)
+from database.models import drop_archived_partition, get_partition_media, iter_messages
+from metrics import acquire
+from services.thumbnails import media_path
+
+# Ключ advisory lock: обслуживание секций выполняет один процесс кластера
+MAINTENANCE_LOCK_KEY = 0x616e6f02
+
+
+def write_media_tar(target, files):
+    """
+    Складывает файлы в tar без сжатия — фото и видео уже сжаты.
+    files — пары (путь на диске, имя в архиве). Возвращает (файлов, байт).
+    """
+    tmp_target = target.with_name(f"{target.name}.part")
+    added = size = 0
+    with tarfile.open(tmp_target, "w") as tar:
+        for path, arcname in files:
+            if path.is_file():
+                tar.add(path, arcname=arcname)
+                added += 1
+                size += path.stat().st_size
+    os.replace(tmp_target, target)
+    return added, size
+
+
+class PartitionMaintainer:
+    """
+    Обслуживание секций messages: заранее создаёт секции на PARTITION_MONTHS_AHEAD
+    месяцев вперёд и, если задан MESSAGES_RETENTION_MONTHS, архивирует старые.
+
+    Архивация секции: DETACH, сообщения в <секция>.ndjson.gz, файлы медиа,
+    не нужные более новым сообщениям, в <секция>.media.tar, затем удаление файлов,
+    строк media_items и самой таблицы. NDJSON записывается последним и служит
+    признаком готового архива, поэтому прерванная архивация продолжается
+    со следующего запуска без потери файлов.
+    """
+
+    def __init__(self, pool, archive_dir=ARCHIVE_DIR, retention_months=MESSAGES_RETENTION_MONTHS):
+        self.pool = pool
+        self.archive_dir = archive_dir
+        self.retention_months = retention_months
+        self.logger = logging.getLogger(__name__)
+        self._task = None
+
+        self.created = 0
+        self.archived = 0
+        self.archived_messages = 0
+        self.archived_files = 0
+        self.archived_bytes = 0
+        self.last_run = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="partitions")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка обслуживания секций messages: {e}")
+            await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+    async def run_once(self):
+        async with acquire(self.pool, "partition_maintenance") as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_KEY):
+                return
+            try:
+                created = await ensure_future_partitions(conn, PARTITION_MONTHS_AHEAD)
+                self.created += len(created)
+                if self.retention_months > 0:
+                    now = await conn.fetchval("SELECT NOW()::timestamp")
+                    cutoff = add_months(month_start(now), -self.retention_months)
+                    for name, month, attached in await list_message_partitions(conn):
+                        # Отключённая секция — прерванная архивация, доводим её до конца
+                        if month < cutoff or not attached:
+                            await self.archive_partition(conn, name, attached)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_KEY)
+        self.last_run = time.time()
+
+    async def archive_partition(self, conn, name, attached=True):
+        started = time.monotonic()
+        if attached:
+            await detach_message_partition(conn, name)
+
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        rows_target = self.archive_dir / f"{name}.ndjson.gz"
+        media_target = self.archive_dir / f"{name}.media.tar"
+
+        media = await get_partition_media(self.pool, name)
+        files = []
+        for item in media:
+            for url in (item["media_url"], item["thumb_url"]):
+                if url:
+                    files.append((media_path(url), url))
+
+        if not rows_target.exists():
+            added, size = await asyncio.to_thread(write_media_tar, media_target, files)
+            count = await self._write_rows(name, rows_target)
+            self.archived_messages += count
+            self.archived_files += added
+            self.archived_bytes += size
+
+        for path, _ in files:
+            await asyncio.to_thread(path.unlink, missing_ok=True)
+        await drop_archived_partition(self.pool, name, [item["media_url"] for item in media])
+
+        self.archived += 1
+        self.logger.info(
+            f"🗄 Секция {name} перенесена в архив {self.archive_dir} за {time.monotonic() - started:.1f} с"
+        )
+
+    async def _write_rows(self, name, target):
+        tmp_target = target.with_name(f"{target.name}.part")
+        count = 0
+        archive = await asyncio.to_thread(gzip.open, tmp_target, "wb")
+        try:
+            async for rows in iter_messages(self.pool, EXPORT_BATCH_SIZE, table=name):
+                chunk = b"".join(orjson.dumps(dict(row)) + b"\n" for row in rows)
+                await asyncio.to_thread(archive.write, chunk)
+                count += len(rows)
+        finally:
+            await asyncio.to_thread(archive.close)
+        os.replace(tmp_target, target)
+        return count
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "created": self.created,
+            "archived": self.archived,
+            "archived_messages": self.archived_messages,
+            "archived_files": self.archived_files,
+            "archived_bytes": self.archived_bytes,
+            "retention_months": self.retention_months,
+            "last_run": self.last_run,
+        }
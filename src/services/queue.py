@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+
+from aiogram.types import Update
+
+from database.models import enqueue_update, claim_update, complete_update, count_queued_updates
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь апдейтов с пулом воркеров.
+    Вебхук кладёт апдейт и сразу отвечает Telegram, обработка идёт в фоне.
+    """
+
+    def __init__(self, handler, maxsize: int, workers: int):
+        self.handler = handler
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.workers_count = workers
+        self.logger = logging.getLogger(__name__)
+
+        self._workers = []
+        self._closing = False
+        self._started_at = None
+
+        self.busy = 0
+        self.busy_time = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._workers = [
+            asyncio.create_task(self._worker(n), name=f"update-worker-{n}")
+            for n in range(self.workers_count)
+        ]
+        self.logger.info(f"🧵 Запущено воркеров апдейтов: {self.workers_count}")
+
+    async def put(self, update, timeout: float) -> bool:
+        """
+        Ставит апдейт в очередь. Если очередь полна дольше timeout — False,
+        вебхук отвечает ошибкой и Telegram повторит доставку позже.
+        """
+        if self._closing:
+            self.rejected += 1
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put(update), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            self.logger.warning(f"⏳ Очередь апдейтов переполнена ({self.queue.qsize()})")
+            return False
+
+    async def _worker(self, n: int):
+        while True:
+            update = await self.queue.get()
+            self.busy += 1
+            started = time.monotonic()
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.error(f"❌ Ошибка при обработке апдейта в воркере {n}: {e}", exc_info=True)
+            finally:
+                self.busy -= 1
+                self.busy_time += time.monotonic() - started
+                self.queue.task_done()
+
+    async def stop(self, timeout: float):
+        """
+        Перестаёт принимать апдейты и дожидается разбора очереди.
+        """
+        self._closing = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+            self.logger.info("🧹 Очередь апдейтов разобрана")
+        except asyncio.TimeoutError:
+            self.logger.warning(f"⚠️ Не дождались разбора очереди, осталось {self.queue.qsize()}")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.workers_count
+        return {
+            "depth": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "workers": self.workers_count,
+            "busy_workers": self.busy,
+            "utilisation": round(self.busy_time / capacity, 4) if capacity else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+class PostgresUpdateQueue:
+    """
+    Очередь апдейтов в таблице update_queue, общая для нескольких процессов.
+    API-воркеры только кладут апдейты (workers=0), воркеры приёма разбирают их.
+    pool — database.pool.PoolManager: через него идёт LISTEN updates_enqueued.
+    Доставка "хотя бы один раз": апдейт удаляется после обработки, а взятый
+    упавшим воркером возвращается в очередь через visibility_timeout.
+    """
+
+    def __init__(self, pool, handler, maxsize: int, workers: int,
+                 visibility_timeout: float, max_attempts: int):
+        self.pool = pool
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers_count = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+
+        self._tasks = []
+        self._workers = []
+        self._notified = asyncio.Event()
+        self._closing = False
+        self._started_at = None
+
+        # Глубина обновляется фоном: считать строки на каждый put дорого
+        self.depth = 0
+        self.busy = 0
+        self.busy_time = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._refresh_depth(), name="update-queue-depth")]
+        if self.workers_count:
+            self._tasks.append(asyncio.create_task(self._listen(), name="update-queue-listen"))
+            self._workers = [
+                asyncio.create_task(self._worker(n), name=f"update-worker-{n}")
+                for n in range(self.workers_count)
+            ]
+        self.logger.info(f"🧵 Очередь апдейтов в Postgres, воркеров: {self.workers_count}")
+
+    async def put(self, update, timeout: float) -> bool:
+        if self._closing or self.depth >= self.maxsize:
+            self.rejected += 1
+            return False
+        try:
+            payload = update.model_dump_json(by_alias=True, exclude_none=True)
+            await asyncio.wait_for(enqueue_update(self.pool, payload), timeout)
+            self.depth += 1
+            return True
+        except Exception as e:
+            self.rejected += 1
+            self.logger.warning(f"⏳ Не удалось поставить апдейт в очередь: {e!r}")
+            return False
+
+    async def _refresh_depth(self):
+        while True:
+            try:
+                self.depth = await count_queued_updates(self.pool)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Не удалось получить глубину очереди: {e}")
+            await asyncio.sleep(1)
+
+    def _on_enqueued(self, connection, pid, channel, payload):
+        self._notified.set()
+
+    async def _listen(self):
+        # Подписка живёт в PoolManager и переживает переподключение к БД
+        await self.pool.add_listener("updates_enqueued", self._on_enqueued)
+
+    async def _worker(self, n: int):
+        while not self._closing:
+            try:
+                job = await claim_update(self.pool, self.visibility_timeout)
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка при чтении очереди апдейтов: {e}")
+                job = None
+
+            if job is None:
+                # NOTIFY будит сразу, таймаут страхует от потерянных уведомлений
+                self._notified.clear()
+                try:
+                    await asyncio.wait_for(self._notified.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.busy += 1
+            started = time.monotonic()
+            try:
+                if job["attempts"] > self.max_attempts:
+                    self.logger.error(f"❌ Апдейт {job['id']} не обработан за {self.max_attempts} попыток, пропускаем")
+                    self.failed += 1
+                else:
+                    await self.handler(Update.model_validate_json(job["payload"]))
+                    self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.error(f"❌ Ошибка при обработке апдейта в воркере {n}: {e}", exc_info=True)
+            finally:
+                self.busy -= 1
+                self.busy_time += time.monotonic() - started
+                try:
+                    await complete_update(self.pool, job["id"])
+                except Exception as e:
+                    self.logger.error(f"❌ Не удалось удалить апдейт {job['id']} из очереди: {e}")
+
+    async def stop(self, timeout: float):
+        """
+        Дожидается обработки уже взятых апдейтов; остальные остаются в таблице
+        для других воркеров или следующего запуска.
+        """
+        self._closing = True
+        self._notified.set()
+        if self._workers:
+            _, pending = await asyncio.wait(self._workers, timeout=timeout)
+            if pending:
+                self.logger.warning(f"⚠️ Не дождались воркеров: {len(pending)}, их апдейты вернутся в очередь")
+
+        for task in [*self._workers, *self._tasks]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._tasks, return_exceptions=True)
+        if self.workers_count:
+            await self.pool.remove_listener("updates_enqueued", self._on_enqueued)
+        self._workers = []
+        self._tasks = []
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.workers_count
+        return {
+            "backend": "postgres",
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "workers": self.workers_count,
+            "busy_workers": self.busy,
+            "utilisation": round(self.busy_time / capacity, 4) if capacity else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
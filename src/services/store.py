@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from pathlib import Path
+
+from config import MEDIA_ROOT
+from database.models import get_media_file, get_media_file_by_hash, save_media_file
+from services.download import place_file
+
+
+def content_filename(sha256: str, extension: str) -> str:
+    # Имя из хеша: разные чаты и импорт не перезапишут чужой файл, а байты по URL не меняются
+    return f"{sha256}.{extension}"
+
+
+class MediaStore:
+    """
+    Индекс сохранённых медиа: file_unique_id Telegram -> путь, плюс sha256 содержимого.
+    Повторные посты ссылаются на уже сохранённый файл вместо новой копии,
+    новые файлы кладутся под именем из sha256 содержимого.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.logger = logging.getLogger(__name__)
+
+        self.unique_id_hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _exists(self, relative_path: str) -> bool:
+        # relative_path вида uploads/<dir>/<file>, MEDIA_ROOT соответствует uploads
+        return (MEDIA_ROOT / relative_path.split("/", 1)[1]).exists()
+
+    async def lookup(self, file_unique_id: str):
+        """
+        Путь к уже сохранённому файлу или None — тогда файл нужно скачать.
+        """
+        if not file_unique_id:
+            return None
+
+        stored = await get_media_file(self.pool, file_unique_id)
+        if stored and self._exists(stored["path"]):
+            self.unique_id_hits += 1
+            self.bytes_saved += stored["size"]
+            self.logger.info(f"♻️ Файл {file_unique_id} уже сохранён: {stored['path']}")
+            return stored["path"]
+        return None
+
+    async def register(self, file_unique_id: str, sha256: str, source: Path, directory: Path,
+                       extension: str, size: int) -> str:
+        """
+        Регистрирует скачанный во временный файл source. Если такое содержимое
+        уже есть — возвращает путь к существующему файлу, иначе переносит source
+        в directory под именем из хеша. source после вызова не существует.
+        """
+        existing = await get_media_file_by_hash(self.pool, sha256)
+        if existing and self._exists(existing["path"]):
+            self.hash_hits += 1
+            self.bytes_saved += size
+            relative_path = existing["path"]
+            await asyncio.to_thread(source.unlink, missing_ok=True)
+            self.logger.info(f"♻️ Содержимое совпало с {relative_path}, копия удалена")
+        else:
+            self.misses += 1
+            filename = content_filename(sha256, extension)
+            await asyncio.to_thread(place_file, source, directory / filename)
+            relative_path = f"uploads/{directory.name}/{filename}"
+
+        if file_unique_id:
+            await save_media_file(self.pool, file_unique_id, sha256, relative_path, size)
+        return relative_path
+
+    def stats(self) -> dict:
+        total = self.unique_id_hits + self.hash_hits + self.misses
+        hits = self.unique_id_hits + self.hash_hits
+        return {
+            "unique_id_hits": self.unique_id_hits,
+            "hash_hits": self.hash_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from config import (
+    MEDIA_ROOT,
+    THUMB_DIR,
+    THUMB_SIZE,
+    THUMB_FORMAT,
+    THUMB_QUALITY,
+    THUMB_WORKERS,
+    THUMB_BATCH_SIZE,
+    THUMB_POLL_INTERVAL,
+    THUMB_CLAIM_TTL
+)
+from database.models import claim_media_items_without_thumbs, set_media_item_thumbs
+
+IMAGE_TYPES = ("photo",)
+# Для видео и анимаций превью делается из кадра-постера
+VIDEO_TYPES = ("video", "animation")
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def render_image_thumbnail(source: str, target: str, size: int, image_format: str, quality: int):
+    """
+    Уменьшает картинку до size по большей стороне. Выполняется в дочернем процессе.
+    """
+    from PIL import Image, ImageOps
+
+    tmp_target = f"{target}.{os.getpid()}.part"
+    with Image.open(source) as image:
+        # draft() декодирует JPEG сразу в уменьшенном масштабе
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((size, size))
+        if image_format == "webp":
+            image.save(tmp_target, format="WEBP", quality=quality, method=4)
+        else:
+            image.save(tmp_target, format="JPEG", quality=quality, optimize=True)
+    os.replace(tmp_target, target)
+
+
+def media_path(media_url: str) -> Path:
+    # media_url вида uploads/<каталог>/<файл>, /uploads смонтирован на MEDIA_ROOT
+    return MEDIA_ROOT / Path(media_url).relative_to("uploads")
+
+
+def thumb_name(media_url: str) -> str:
+    path = Path(media_url)
+    return f"{path.parent.name}_{path.stem}_{THUMB_SIZE}.{EXTENSIONS[THUMB_FORMAT]}"
+
+
+class ThumbnailGenerator:
+    """
+    Фоновая генерация превью для медиа из media_items.
+    Картинки уменьшаются в пуле процессов, постеры видео делает ffmpeg.
+    Работа идемпотентна: превью с тем же именем не пересоздаётся, а
+    необработанные записи подхватываются после рестарта. В кластере записи
+    разбираются процессами приёма без пересечений — каждую берёт один.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.logger = logging.getLogger(__name__)
+        self.ffmpeg = shutil.which("ffmpeg")
+        # Без ffmpeg видео остаются без превью до его установки, а не помечаются ошибкой
+        self.media_types = list(IMAGE_TYPES + (VIDEO_TYPES if self.ffmpeg else ()))
+
+        self._executor = None
+        self._slots = asyncio.Semaphore(THUMB_WORKERS)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        self.generated = 0
+        self.reused = 0
+        self.failed = 0
+
+    def start(self):
+        if not self.ffmpeg:
+            self.logger.warning("⚠️ ffmpeg не найден, постеры для видео не создаются")
+        self._executor = ProcessPoolExecutor(max_workers=THUMB_WORKERS)
+        self._task = asyncio.create_task(self._run(), name="thumbnails")
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                items = await claim_media_items_without_thumbs(
+                    self.pool, self.media_types, THUMB_BATCH_SIZE, THUMB_CLAIM_TTL
+                )
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка при выборке медиа без превью: {e}")
+                items = []
+
+            if items:
+                results = await asyncio.gather(*(self._make_thumbnail(item) for item in items))
+                try:
+                    await set_media_item_thumbs(self.pool, results)
+                except Exception as e:
+                    self.logger.error(f"❌ Не удалось сохранить превью: {e}")
+                    await asyncio.sleep(THUMB_POLL_INTERVAL)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), THUMB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _make_thumbnail(self, item):
+        name = thumb_name(item["media_url"])
+        target = THUMB_DIR / name
+        thumb_url = f"uploads/{THUMB_DIR.name}/{name}"
+
+        if target.exists():
+            # Файл уже есть: тот же медиафайл у другого сообщения или повтор после рестарта
+            self.reused += 1
+            return item["message_db_id"], item["position"], thumb_url
+
+        source = media_path(item["media_url"])
+        frame = None
+        try:
+            async with self._slots:
+                if item["media_type"] in VIDEO_TYPES:
+                    frame = target.with_name(f".{target.stem}.frame.png")
+                    await self._extract_frame(source, frame)
+                    source = frame
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, render_image_thumbnail,
+                    str(source), str(target), THUMB_SIZE, THUMB_FORMAT, THUMB_QUALITY
+                )
+            self.generated += 1
+            return item["message_db_id"], item["position"], thumb_url
+        except Exception as e:
+            self.failed += 1
+            self.logger.error(f"❌ Не удалось сделать превью для {item['media_url']}: {e}")
+            return item["message_db_id"], item["position"], ""
+        finally:
+            if frame:
+                frame.unlink(missing_ok=True)
+
+    async def _extract_frame(self, source: Path, frame: Path):
+        """
+        Кадр-постер через ffmpeg; дальше он уменьшается так же, как фото.
+        Сначала кадр на первой секунде, для более коротких роликов — первый кадр.
+        """
+        for seek in (["-ss", "1"], []):
+            process = await asyncio.create_subprocess_exec(
+                self.ffmpeg, "-v", "error", "-y", *seek, "-i", str(source),
+                "-frames:v", "1", "-vf", f"scale='min({THUMB_SIZE * 2},iw)':-2", str(frame),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+            if process.returncode == 0 and frame.exists():
+                return
+        raise RuntimeError(stderr.decode(errors="replace").strip() or f"ffmpeg: код {process.returncode}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "generated": self.generated,
+            "reused": self.reused,
+            "failed": self.failed,
+            "workers": THUMB_WORKERS,
+            "video_posters": bool(self.ffmpeg),
+        }